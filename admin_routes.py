@@ -1,12 +1,16 @@
 from flask import Blueprint, render_template, redirect, url_for, flash, request, session, current_app, send_from_directory, abort, jsonify
 from werkzeug.utils import secure_filename
 from werkzeug.security import generate_password_hash, check_password_hash
-from sqlalchemy.orm import joinedload
 from models import Category, SubCategory, db, Course, Teacher, Book, BookImage, BookReview, Admin, User, Certificate, UserCourse, Order, OrderItem, Transaction, BundleOffer, FullOrderDetail, Customer, utc_now
 from forms import CourseForm, TeacherForm, BookForm, AdminRegistrationForm, AdminLoginForm, CertificateUploadForm, BundleOfferForm
 import os
 from datetime import datetime
 import uuid
+import catalog
+import mailer
+import perf
+import ratings
+import slow_queries
 
 admin_bp = Blueprint('admin', __name__, url_prefix='/admin')
 
@@ -317,7 +321,7 @@ def manage_books():
     elif sort_by == 'price_desc':
         query = query.order_by(Book.price.desc())
 
-    books = query.all()
+    books = catalog.book_cards(query)
 
     # ✅ Get all categories
     categories = Category.query.order_by(Category.name).all()
@@ -466,6 +470,7 @@ def upload_certificate():
                     )
                     db.session.add(certificate)
                     db.session.commit()
+                    send_certificate_email(certificate, user)
                     
                     flash('Offline certificate uploaded successfully', 'success')
                 except Exception as e:
@@ -514,6 +519,7 @@ def upload_certificate():
                     )
                     db.session.add(certificate)
                     db.session.commit()
+                    send_certificate_email(certificate, user, course)
                     
                     flash('Certificate uploaded successfully', 'success')
                 except Exception as e:
@@ -532,6 +538,19 @@ def upload_certificate():
                 
     return redirect(url_for('admin.upload_certificate'))
 
+def send_certificate_email(certificate, user, course=None):
+    """Queue the "certificate issued" email for a newly uploaded certificate"""
+    try:
+        mailer.send(mailer.compose(
+            user.email, "Your certificate is ready - Easy2Learning", 'certificate_issued.html',
+            name=user.customer.full_name if user.customer else None,
+            course_title=course.title if course else None,
+            download_url=url_for('download_certificate', certificate_id=certificate.id, _external=True)
+        ))
+    except Exception as e:
+        # The certificate is saved either way; it is also listed on the user's profile
+        print(f"Error queueing certificate email: {e}")
+
 def search_users_by_criteria(search_type, search_value):
     """Search users by email or name"""
     if search_type == 'email':
@@ -758,19 +777,11 @@ def set_book_rating(book_id):
     if not book:
         abort(404)
     
-    rating = request.form.get('rating')
-    review_count = request.form.get('review_count')
-    
-    if rating and review_count:
-        try:
-            book.avg_rating = float(rating)
-            book.review_count = int(review_count)
-            db.session.commit()
-            flash('Book rating updated successfully!', 'success')
-        except ValueError:
-            flash('Invalid rating or review count values.', 'danger')
+    # Ratings are derived from reviews, so recalculate instead of overriding
+    if ratings.reconcile_ratings(book_ids=[book_id]):
+        flash('Book rating recalculated from its reviews.', 'success')
     else:
-        flash('Rating and review count are required.', 'danger')
+        flash('Book rating already matches its reviews.', 'info')
     
     return redirect(url_for('admin.edit_book', book_id=book_id))
 
@@ -781,12 +792,46 @@ def delete_review(review_id):
     if not review:
         abort(404)
     
+    # The book's rating aggregates are updated by ratings.py
     db.session.delete(review)
     db.session.commit()
     flash('Review deleted successfully!', 'success')
     return redirect(url_for('admin.manage_book_reviews'))
 
 
+# Request performance
+
+@admin_bp.route('/perf')
+@admin_login_required
+def perf_dashboard():
+    return render_template('admin/perf.html', endpoints=perf.snapshot())
+
+@admin_bp.route('/perf.json')
+@admin_login_required
+def perf_json():
+    return jsonify({'endpoints': perf.snapshot(), 'buckets_ms': list(perf.LATENCY_BUCKETS_MS)})
+
+@admin_bp.route('/perf/reset', methods=['POST'])
+@admin_login_required
+def perf_reset():
+    perf.reset()
+    flash('Performance counters reset.', 'success')
+    return redirect(url_for('admin.perf_dashboard'))
+
+@admin_bp.route('/slow-queries')
+@admin_login_required
+def slow_query_log():
+    return render_template('admin/slow_queries.html', statements=slow_queries.ranking(),
+                           threshold_ms=slow_queries.THRESHOLD_MS)
+
+@admin_bp.route('/slow-queries/clear', methods=['POST'])
+@admin_login_required
+def clear_slow_queries():
+    slow_queries.clear()
+    flash('Slow-query log cleared.', 'success')
+    return redirect(url_for('admin.slow_query_log'))
+
+
 # Bundle Management Routes
 
 @admin_bp.route('/manage-bundles')
@@ -798,8 +843,8 @@ def manage_bundles():
     sort_by = request.args.get('sort', 'title')
     sort_order = request.args.get('order', 'asc')
     
-    # Base query with joined books
-    query = BundleOffer.query.options(joinedload(BundleOffer.books))
+    # Book counts and savings are stored on the bundle, so the books are not loaded
+    query = BundleOffer.query
     
     # Apply search filter (case-insensitive)
     if search:
@@ -1,5 +1,5 @@
 from functools import wraps
-from flask import Flask, render_template, redirect, url_for, flash, request, session, jsonify, send_from_directory, abort, current_app
+from flask import Flask, render_template, redirect, url_for, flash, request, session, jsonify, send_from_directory, abort
 from models import Book, BookImage, BookReview, Category, Customer, FullOrderDetail, HeroSlider, Job, JobApplication, SubCategory, Testimonial, db, Course, Teacher, User, Order, OrderItem, Transaction, Certificate, UserCourse, BundleOffer
 from modelss.data import get_courses, get_books, get_certifications 
 from admin_routes import admin_bp, admin_login_required
@@ -12,15 +12,56 @@ import razorpay
 from datetime import datetime, timedelta, timezone
 # For Python versions before 3.11, we'll use timezone.utc instead of datetime.UTC
 from werkzeug.utils import secure_filename
-from utils import generate_otp, send_reset_email
+from utils import generate_otp, send_reset_email, EMAIL_ADDRESS, EMAIL_PASSWORD, ENABLE_EMAIL_SENDING, SMTP_PORT, SMTP_SERVER
+import catalog
+import search_index
+import suggest_index
+import cache
+import related
+import recommendations
+import bundles
+import ratings
+import cart_store
+import order_pipeline
+import inventory
+import payments
+import jobs
+import metrics
+import perf
+import database
+import seed_data
+import slow_queries
 
 app = Flask(__name__)
 app.secret_key = 'your_secret_key'
 
 # Configurations
-app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///site.db'
+app.config['SQLALCHEMY_DATABASE_URI'] = os.environ.get('DATABASE_URL', 'sqlite:///site.db')
 app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 app.config['UPLOAD_FOLDER'] = 'static/uploads/'
+# Shared cache store for all workers (defaults to instance/cache.db)
+app.config['CACHE_PATH'] = os.environ.get('CACHE_PATH')
+# Server-side carts (defaults to instance/carts.db; CART_BACKEND='module:Class' swaps the store)
+app.config['CART_STORE_PATH'] = os.environ.get('CART_STORE_PATH')
+app.config['CART_BACKEND'] = os.environ.get('CART_BACKEND')
+# Prometheus metrics shared by all workers; defaults to instance/metrics.db
+app.config['METRICS_PATH'] = os.environ.get('METRICS_PATH')
+app.config['METRICS_ALLOW'] = os.environ.get('METRICS_ALLOW', '127.0.0.1,::1')
+# Statements slower than this are logged with their query plan (SLOW_QUERY_MS=off disables)
+app.config['SLOW_QUERY_MS'] = None if os.environ.get('SLOW_QUERY_MS') == 'off' else float(os.environ.get('SLOW_QUERY_MS', 100))
+app.config['SLOW_QUERY_PATH'] = os.environ.get('SLOW_QUERY_PATH')
+# Send Server-Timing headers on every response (admins always get them)
+app.config['SERVER_TIMING'] = os.environ.get('SERVER_TIMING', '0') == '1'
+# Catalog changes for the other workers' suggestion indexes; defaults to instance/suggest_index.changes
+app.config['SUGGEST_CHANGES_PATH'] = os.environ.get('SUGGEST_CHANGES_PATH')
+# Outgoing email (mailer.py); MAIL_ENABLED=0 logs messages instead of sending them
+app.config['MAIL_SERVER'] = os.environ.get('MAIL_SERVER', SMTP_SERVER)
+app.config['MAIL_PORT'] = int(os.environ.get('MAIL_PORT', SMTP_PORT))
+app.config['MAIL_USE_TLS'] = os.environ.get('MAIL_USE_TLS', '1') == '1'
+app.config['MAIL_USERNAME'] = os.environ.get('MAIL_USERNAME', EMAIL_ADDRESS)
+app.config['MAIL_PASSWORD'] = os.environ.get('MAIL_PASSWORD', EMAIL_PASSWORD)
+app.config['MAIL_SENDER'] = os.environ.get('MAIL_SENDER', EMAIL_ADDRESS)
+app.config['MAIL_ENABLED'] = os.environ.get('MAIL_ENABLED', '1' if ENABLE_EMAIL_SENDING else '0') == '1'
 
 # Razorpay configuration
 app.config['RAZORPAY_KEY_ID'] = 'rzp_live_83IOlByr8u0xkh'
@@ -29,6 +70,8 @@ razorpay_client = razorpay.Client(auth=(app.config['RAZORPAY_KEY_ID'], app.confi
 
 # Initialize DB
 db.init_app(app)
+# WAL, busy timeout and BEGIN IMMEDIATE for the workers and the job worker
+database.init_app(app)
 
 # Add custom Jinja2 filters
 @app.template_filter('nl2br')
@@ -41,6 +84,28 @@ def nl2br_filter(text):
 # Register Blueprints
 app.register_blueprint(admin_bp)
 
+# Full-text search index CLI commands
+search_index.init_app(app)
+cache.init_app(app)
+related.init_app(app)
+recommendations.init_app(app)
+bundles.init_app(app)
+ratings.init_app(app)
+cart_store.init_app(app)
+jobs.init_app(app)
+metrics.init_app(app)
+slow_queries.init_app(app)
+seed_data.init_app(app)
+
+# Per-request timing, query counts and N+1 detection (/admin/perf)
+if os.environ.get('PERF_ENABLED', '1') == '1':
+    perf.init_app(app)
+
+# Homepage cache: any committed write to what index.html shows drops it in every worker
+HOMEPAGE_CACHE = 'homepage'
+cache.invalidate_on(HOMEPAGE_CACHE, Course, Teacher, HeroSlider, Testimonial,
+                    Book, BookImage, Category, SubCategory)
+
 # User login required decorator
 def login_required(f):
     @wraps(f)
@@ -52,53 +117,28 @@ def login_required(f):
     return decorated_function
 
 # Helper Functions
-def get_or_create_customer(user_id, customer_info):
-    """Get existing customer or create new one with detailed address information"""
-    try:
-        # Check if customer already exists for this user
-        customer = Customer.query.filter_by(user_id=user_id).first()
-        
-        if customer:
-            # Update existing customer with new information
-            customer.full_name = customer_info.get('full_name', customer.full_name)
-            customer.email = customer_info.get('email', customer.email)
-            customer.phone = customer_info.get('phone', customer.phone)
-            customer.street_address = customer_info.get('street_address', customer.street_address)
-            customer.city = customer_info.get('city', customer.city)
-            customer.state = customer_info.get('state', customer.state)
-            customer.pincode = customer_info.get('pincode', customer.pincode)
-            customer.updated_at = datetime.now(timezone.utc)
-        else:
-            # Create new customer
-            customer = Customer(
-                user_id=user_id,
-                full_name=customer_info.get('full_name', ''),
-                email=customer_info.get('email', ''),
-                phone=customer_info.get('phone', ''),
-                street_address=customer_info.get('street_address', ''),
-                city=customer_info.get('city', ''),
-                state=customer_info.get('state', ''),
-                pincode=customer_info.get('pincode', '')
-            )
-            db.session.add(customer)
-        
-        db.session.commit()
-        return customer
-        
-    except Exception as e:
-        db.session.rollback()
-        print(f"Error managing customer: {e}")
-        return None
+def homepage_data():
+    """Load everything index.html shows as plain, cacheable values"""
+    return {
+        'courses': [cache.snapshot(c) for c in Course.query.filter_by(is_popular=True).all()],
+        'books': catalog.book_cards(Book.query.filter_by(is_deleted=False)),
+        'teachers': [cache.snapshot(t) for t in Teacher.query.all()],
+        'hero_slides': [cache.snapshot(s) for s in HeroSlider.query.order_by(HeroSlider.updated_at.desc()).all()],
+        'testimonials': [cache.snapshot(t) for t in Testimonial.query.order_by(Testimonial.created_at.desc()).all()],
+    }
 
 # Routes
 @app.route('/')
 def index():
-    courses = Course.query.filter_by(is_popular=True).all()
-    all_books = Book.query.filter_by(is_deleted=False).all()
-    teachers = Teacher.query.all()
-    hero_slides = HeroSlider.query.order_by(HeroSlider.updated_at.desc()).all()
-    testimonials = Testimonial.query.order_by(Testimonial.created_at.desc()).all()
-    return render_template('index.html', courses=courses, teachers=teachers, hero_slides=hero_slides, books=all_books, testimonials=testimonials)
+    # Only the navbar differs between visitors: login state and cart size
+    variant = f"html:{int('user_id' in session)}:{cart_store.count()}"
+    html = cache.get(HOMEPAGE_CACHE, variant)
+    if html is None:
+        version = cache.get_version(HOMEPAGE_CACHE)
+        data = cache.get_or_set(HOMEPAGE_CACHE, 'data', homepage_data)
+        html = render_template('index.html', **data)
+        cache.put(HOMEPAGE_CACHE, variant, html, version=version)
+    return html
 
 @app.route('/register', methods=['GET', 'POST'])
 def register():
@@ -122,6 +162,7 @@ def login():
             session['user_id'] = user.id
             session['email'] = user.email
             session['phone'] = user.phone
+            cart_store.merge_anonymous_cart(user.id)
             flash('Login successful.', 'success')
             return redirect(url_for('profile'))
         else:
@@ -148,11 +189,10 @@ def forgot_password():
             user.reset_token_expiration = datetime.now(timezone.utc) + timedelta(minutes=15)
             db.session.commit()
             
-            # Send email with OTP
+            # Queue the email with the OTP
             if send_reset_email(user.email, otp):
                 # Check if we're in test mode (email sending disabled)
-                from utils import ENABLE_EMAIL_SENDING
-                if not ENABLE_EMAIL_SENDING:
+                if not app.config['MAIL_ENABLED']:
                     flash(f'TEST MODE: Your OTP is {otp}. In production, this would be sent via email.', 'info')
                 else:
                     flash('Password reset OTP has been sent to your email.', 'success')
@@ -256,164 +296,136 @@ def courses():
 
 @app.route('/books')
 def books():
-    query = Book.query.filter_by(is_deleted=False)
-
-    title = request.args.get('title')
-    author = request.args.get('author')
-    category = request.args.get('category')
-    subcategory = request.args.get('subject')   # subject = subcategory filter
-    min_price = request.args.get('min_price', type=float)
-    max_price = request.args.get('max_price', type=float)
+    filters = catalog.parse_filters(request.args)
     view_type = request.args.get('view', 'category')  # 'category' or 'list'
-
-    # Apply filters
-    if title:
-        query = query.filter(Book.title.ilike(f"%{title}%"))
-    if author:
-        query = query.filter(Book.author.ilike(f"%{author}%"))
-    if category:
-        query = query.join(Book.categories).filter(Category.name.ilike(f"%{category}%"))
-    if subcategory:
-        query = query.join(Book.subcategories).filter(SubCategory.name.ilike(f"%{subcategory}%"))
-    if min_price is not None:
-        query = query.filter(Book.price >= min_price)
-    if max_price is not None:
-        query = query.filter(Book.price <= max_price)
-
-    books = query.all()
-    
-    # Distinct category and subcategory names for filters
-    categories = [c[0] for c in db.session.query(Category.name).distinct().all() if c[0]]
-    subjects = [s[0] for s in db.session.query(SubCategory.name).distinct().all() if s[0]]
-    
-    # Group books by category for category view
-    books_by_category = {}
+    try:
+        after = catalog.decode_cursor(request.args.get('after'),
+                                      catalog.SECTION_CURSOR if view_type == 'category' else catalog.BOOK_CURSOR)
+    except ValueError:
+        abort(400)
+
+    # Filter options with result counts, from one cached aggregate query
+    facets = catalog.facet_counts(filters)
+
+    # Category view: one keyset page of sections, each with its top-N books.
+    # The rest of every section is fetched lazily from books_section_feed.
+    sections = []
+    books = []
     if view_type == 'category':
-        for book in books:
-            if book.categories:
-                for cat in book.categories:
-                    if cat.name not in books_by_category:
-                        books_by_category[cat.name] = []
-                    books_by_category[cat.name].append(book)
-            else:
-                books_by_category.setdefault('Uncategorized', []).append(book)
-        
-        # Sort categories alphabetically, but put 'Uncategorized' last
-        sorted_categories = sorted([cat for cat in books_by_category if cat != 'Uncategorized'])
-        if 'Uncategorized' in books_by_category:
-            sorted_categories.append('Uncategorized')
-        
-        books_by_category = {cat: books_by_category[cat] for cat in sorted_categories}
+        page = catalog.category_sections(filters, after=after)
+        sections = page['sections']
+        books = [book for section in sections for book in section['books']]
+    else:
+        page = catalog.book_list_page(filters, after=after)
+        books = page['books']
+
+    next_page_url = None
+    if page['next_cursor']:
+        next_page_url = url_for('books', **{**request.args.to_dict(), 'after': page['next_cursor']})
 
     return render_template(
         'books_new.html',
         books=books,
-        books_by_category=books_by_category,
-        categories=categories,
-        subjects=subjects,
-        view_type=view_type
+        sections=sections,
+        facets=facets,
+        view_type=view_type,
+        next_page_url=next_page_url
     )
 
 
+@app.route('/books/section')
+def books_section_feed():
+    section = request.args.get('section', '').strip()
+    if not section:
+        return jsonify({'success': False, 'message': 'Section is required'}), 400
+
+    try:
+        after = catalog.decode_cursor(request.args.get('after'), catalog.BOOK_CURSOR)
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+
+    filters = catalog.parse_filters(request.args)
+    page = catalog.section_feed(filters, section, after=after)
+
+    return jsonify({
+        'success': True,
+        'books': [catalog.book_card_json(book) for book in page['books']],
+        'next_cursor': page['next_cursor']
+    })
+
+
+@app.route('/books/facets')
+def books_facets():
+    return jsonify({'success': True, **catalog.facet_counts(catalog.parse_filters(request.args))})
+
+
+@app.route('/books/also-bought')
+def books_also_bought():
+    """Customers also bought, for one book or every book in the cart (?ids=1,2,3)"""
+    # Ids past SQLite's 64-bit integers cannot exist and would overflow the bind
+    book_ids = [int(i) for i in request.args.get('ids', '').split(',')
+                if i.strip().isdecimal() and int(i) < 2 ** 63]
+    limit = max(1, min(request.args.get('limit', 4, type=int), 20))
+    books = catalog.load_book_cards(recommendations.also_bought(book_ids, limit=limit))
+    return jsonify({'success': True, 'books': [catalog.book_card_json(book) for book in books]})
+
+
 @app.route('/book/<int:book_id>')
 def book_detail(book_id):
-    book = db.session.get(Book, book_id)
-    if not book:
+    # Book, images, categories, reviews and bundles in a fixed number of queries
+    page = catalog.load_book_page(book_id)
+    if not page:
         abort(404)
+    book = page['book']
     
-    # Get all reviews for this book
-    reviews = BookReview.query.filter_by(book_id=book_id).order_by(BookReview.created_at.desc()).all()
+    # Only the newest page of reviews; the header uses the stored avg_rating,
+    # review_count and star histogram on the book
+    reviews = page['reviews']
     
-    # Calculate average rating
-    avg_rating = 0
-    if reviews:
-        avg_rating = sum(review.rating for review in reviews) / len(reviews)
-    
-    # Check if current user has purchased this book
+    # Purchase and review status of the current user (cached per user and book)
     user_purchased = False
     user_can_review = False
     user_existing_review = None
     
     if 'user_id' in session:
-        user_id = session['user_id']
-        user_order = db.session.query(OrderItem).join(Order).filter(
-            Order.user_id == user_id,
-            OrderItem.book_id == book_id,
-            Order.status == 'completed'
-        ).first()
-        
-        if user_order:
-            user_purchased = True
-            # Check if user already reviewed this book
-            user_existing_review = BookReview.query.filter_by(
-                book_id=book_id, 
-                user_id=user_id
-            ).first()
-            
-            if not user_existing_review:
-                user_can_review = True
-    
-    # Get related books (any book sharing at least one category)
-    related_books = []
-    if book.categories:
-        related_books = (
-            Book.query.filter_by(is_deleted=False).join(Book.categories)
-            .filter(Category.id.in_([c.id for c in book.categories]))
-            .filter(Book.id != book_id)
-            .limit(4)
-            .all()
-        )
+        flags = catalog.user_book_flags(session['user_id'], book_id)
+        user_purchased = flags['purchased']
+        if user_purchased:
+            user_existing_review = flags['review_id']
+            user_can_review = not user_existing_review
     
-    # Get active bundle offers that contain this book
-    bundle_offers = BundleOffer.query.filter(
-        BundleOffer.is_active == True,
-        BundleOffer.books.any(id=book_id)
-    ).all()
+    # Related books are precomputed (category overlap + co-purchases) by related.py
+    related_books = catalog.load_book_cards(related.related_book_ids(book_id, limit=4))
     
-    # Calculate bundle savings for each bundle
-    bundle_offers_with_savings = []
-    for bundle in bundle_offers:
-        savings_data = calculate_bundle_savings(bundle)
-        bundle_offers_with_savings.append({
-            'bundle': bundle,
-            'total_mrp': savings_data['total_mrp'],
-            'savings_amount': savings_data['savings_amount'],
-            'savings_percentage': savings_data['savings_percentage']
-        })
+    # Active bundles containing this book (savings are stored on the bundle)
+    bundle_offers = page['bundles']
     
     return render_template(
         'book_detail.html',
         book=book,
         reviews=reviews,
-        avg_rating=avg_rating,
+        reviews_cursor=page['reviews_cursor'],
         user_purchased=user_purchased,
         user_can_review=user_can_review,
         user_existing_review=user_existing_review,
         related_books=related_books,
-        bundle_offers=bundle_offers_with_savings
+        bundle_offers=bundle_offers
     )
 
 
-def calculate_bundle_savings(bundle):
-    """Calculate bundle savings and return structured data"""
+@app.route('/book/<int:book_id>/reviews')
+def book_reviews(book_id):
+    """Next page of a book's reviews, newest first (?after=<cursor>)"""
     try:
-        # total MRP from books (prefer original_price)
-        total_mrp = sum((getattr(b, 'original_price', None) or getattr(b, 'price', 0) or 0) for b in bundle.books)
-        if total_mrp <= 0:
-            return {"total_mrp": 0, "savings_amount": 0, "savings_percentage": 0}
-
-        savings_amount = max(0, total_mrp - bundle.selling_price)
-        savings_percentage = (savings_amount / total_mrp) * 100 if total_mrp > 0 else 0
-        return {"total_mrp": total_mrp, "savings_amount": savings_amount, "savings_percentage": savings_percentage}
-        
-    except Exception as e:
-        # Log error and return safe defaults
-        current_app.logger.error(f"Error calculating bundle savings for bundle {bundle.id}: {str(e)}")
-        return {
-            'total_mrp': 0,
-            'savings_amount': 0,
-            'savings_percentage': 0
-        }
+        after = catalog.decode_review_cursor(request.args.get('after'))
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid cursor'}), 400
+    page = catalog.review_page(book_id, after=after)
+    return jsonify({
+        'success': True,
+        'reviews': [catalog.review_json(review) for review in page['reviews']],
+        'next_cursor': page['next_cursor'],
+    })
 
 
 @app.route('/book/<int:book_id>/review', methods=['POST'])
@@ -450,27 +462,21 @@ def add_book_review(book_id):
     rating = request.form.get('rating')
     review_text = request.form.get('review_text', '').strip()
     
-    if not rating:
+    if not rating or not rating.isdigit() or not 1 <= int(rating) <= 5:
         flash('Please provide a rating.', 'danger')
         return redirect(url_for('book_detail', book_id=book_id))
+    rating = int(rating)
     
     # Create new review
     review = BookReview(
         book_id=book_id,
         user_id=user_id,
-        rating=int(rating),
+        rating=rating,
         review_text=review_text if review_text else None
     )
     
+    # avg_rating, review_count and the histogram are updated by ratings.py
     db.session.add(review)
-    
-    # Update book rating
-    all_reviews = BookReview.query.filter_by(book_id=book_id).all()
-    total_reviews = len(all_reviews) + 1  # include new one
-    total_rating = sum(r.rating for r in all_reviews) + int(rating)
-    book.avg_rating = total_rating / total_reviews
-    book.review_count = total_reviews
-    
     db.session.commit()
     
     flash('Your review has been added successfully!', 'success')
@@ -484,41 +490,23 @@ def certifications():
 
 @app.route('/buy/<int:book_id>')
 def buy_now(book_id):
-    # Get the book details
     book = db.session.get(Book, book_id)
     if not book:
         abort(404)
     
-    # Use first image filename if exists, else None
-    image_filename = book.images[0].image_filename if book.images else None
-
-    # Use first category and subcategory names (or None if not set)
-    category_name = book.categories[0].name if book.categories else None
-    subcategory_name = book.subcategories[0].name if book.subcategories else None
-    
-    # Create a cart with just this item
-    cart_item = {
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'price': book.price,
-        'image': image_filename,
-        'category': category_name,
-        'subject': subcategory_name,
-        'quantity': 1
-    }
-    
     # Replace the entire cart with just this item for direct checkout
-    session['cart'] = [cart_item]
+    cart_store.replace('book', book.id)
     
     return redirect(url_for('checkout'))
 
 
 @app.route('/cart')
 def cart():
-    cart_items = session.get('cart', [])
+    # Lines are stored server side; titles, prices and images come from cached summaries
+    cart_items = cart_store.items()
     total_price = sum(item['price'] * item['quantity'] for item in cart_items)
-    return render_template('cart.html', cart=cart_items, total_price=total_price)
+    cart_book_ids = [item['id'] for item in cart_items if item['type'] == 'book']
+    return render_template('cart.html', cart=cart_items, total_price=total_price, cart_book_ids=cart_book_ids)
 
 
 @app.route('/cart/add/<int:book_id>')
@@ -527,63 +515,19 @@ def add_to_cart(book_id):
     if not book:
         abort(404)
 
-    # Use first image filename if exists, else None
-    image_filename = book.images[0].image_filename if book.images else None
-    category_name = book.categories[0].name if book.categories else None
-    subcategory_name = book.subcategories[0].name if book.subcategories else None
-
-    cart_item = {
-        'id': book.id,
-        'title': book.title,
-        'author': book.author,
-        'price': book.price,
-        'image': image_filename,
-        'category': category_name,
-        'subject': subcategory_name,
-        'quantity': 1
-    }
-
-    cart = session.get('cart', [])
-
-    for item in cart:
-        if item['id'] == book.id:
-            if item['quantity'] < book.quantity:
-                item['quantity'] += 1
-                flash(f"Increased quantity of '{book.title}' in cart.", "success")
-            else:
-                flash(f"Cannot add more '{book.title}'. Only {book.quantity} in stock.", "warning")
-            break
-    else:
-        cart.append(cart_item)
+    quantity = cart_store.quantity_of('book', book.id)
+    if not quantity:
+        cart_store.set_quantity('book', book.id, 1)
         flash(f"'{book.title}' added to cart!", "success")
+    elif quantity < book.quantity:
+        cart_store.set_quantity('book', book.id, quantity + 1)
+        flash(f"Increased quantity of '{book.title}' in cart.", "success")
+    else:
+        flash(f"Cannot add more '{book.title}'. Only {book.quantity} in stock.", "warning")
 
-    session['cart'] = cart
     return redirect(url_for('cart'))
 
 
-def create_bundle_cart_item(bundle):
-    """Helper function to create standardized bundle cart item structure"""
-    books_info = []
-    for book in bundle.books:
-        image_filename = book.images[0].image_filename if book.images else None
-        books_info.append({
-            'id': book.id,
-            'title': book.title,
-            'author': book.author,
-            'price': book.price,
-            'image': image_filename
-        })
-    
-    return {
-        'id': bundle.id,
-        'title': bundle.title,
-        'price': bundle.selling_price,
-        'quantity': 1,
-        'type': 'bundle',
-        'books': books_info
-    }
-
-
 @app.route('/cart/add-bundle/<int:bundle_id>')
 def add_bundle_to_cart(bundle_id):
     bundle = db.session.get(BundleOffer, bundle_id)
@@ -594,61 +538,33 @@ def add_bundle_to_cart(bundle_id):
         flash(f"Bundle '{bundle.title}' is no longer available.", "danger")
         return redirect(request.referrer or url_for('cart'))
     
-    cart_item = create_bundle_cart_item(bundle)
-    cart = session.get('cart', [])
+    # Check stock availability for all books in the bundle
+    quantity = cart_store.quantity_of('bundle', bundle_id) + 1
+    for book in bundle.books:
+        if book.quantity < quantity:
+            if quantity > 1:
+                flash(f"Cannot add more '{bundle.title}'. Book '{book.title}' has insufficient stock.", "warning")
+            else:
+                flash(f"Cannot add bundle '{bundle.title}'. Book '{book.title}' is out of stock.", "warning")
+            return redirect(url_for('cart'))
     
-    # Check if bundle already in cart
-    for item in cart:
-        if item.get('type') == 'bundle' and item['id'] == bundle_id:
-            # Check stock availability for all books in bundle
-            stock_available = True
-            for book in bundle.books:
-                if book.quantity < (item['quantity'] + 1):
-                    stock_available = False
-                    flash(f"Cannot add more '{bundle.title}'. Book '{book.title}' has insufficient stock.", "warning")
-                    break
-            
-            if stock_available:
-                item['quantity'] += 1
-                flash(f"Increased quantity of bundle '{bundle.title}' in cart.", "success")
-            break
+    cart_store.set_quantity('bundle', bundle_id, quantity)
+    if quantity > 1:
+        flash(f"Increased quantity of bundle '{bundle.title}' in cart.", "success")
     else:
-        # Check stock for new bundle
-        stock_available = True
-        for book in bundle.books:
-            if book.quantity < 1:
-                stock_available = False
-                flash(f"Cannot add bundle '{bundle.title}'. Book '{book.title}' is out of stock.", "warning")
-                break
-        
-        if stock_available:
-            cart.append(cart_item)
-            flash(f"Bundle '{bundle.title}' added to cart!", "success")
+        flash(f"Bundle '{bundle.title}' added to cart!", "success")
     
-    session['cart'] = cart
     return redirect(url_for('cart'))
 
 
 @app.route('/cart/remove/<string:item_type>/<int:item_id>')
 def remove_from_cart_generic(item_type, item_id):
-    cart = session.get('cart', [])
-    updated_cart = []
-    
-    for item in cart:
-        if item_type == 'bundle':
-            if not (item.get('type') == 'bundle' and item['id'] == item_id):
-                updated_cart.append(item)
-        elif item_type == 'course':
-            if not (item.get('type') == 'course' and item['id'] == item_id):
-                updated_cart.append(item)
-        else:  # book
-            if not (item.get('type', 'book') == 'book' and item['id'] == item_id):
-                updated_cart.append(item)
+    if item_type not in cart_store.ITEM_TYPES:
+        item_type = 'book'
     
-    if len(cart) == len(updated_cart):
+    if not cart_store.remove(item_type, item_id):
         flash("Item not found in cart.", "danger")
     else:
-        session['cart'] = updated_cart
         item_name = "Bundle" if item_type == 'bundle' else ("Course" if item_type == 'course' else "Book")
         flash(f"{item_name} removed from cart.", "warning")
     
@@ -664,7 +580,7 @@ def remove_from_cart(book_id):
 @app.route('/checkout')
 @login_required
 def checkout():
-    cart = session.get('cart', [])
+    cart = cart_store.items()
     if not cart:
         flash("Your cart is empty. Add items before checking out.", "info")
         return redirect(url_for('cart'))
@@ -676,14 +592,25 @@ def checkout():
 @app.route('/payment/success')
 @login_required
 def payment_success():
-    payment_id = request.args.get('payment_id', 'N/A')
+    payment_id = request.args.get('payment_id', '').strip()
+    if not payment_id:
+        metrics.inc('checkouts_total', result='failure', reason='missing_payment_id')
+        flash('Payment reference is missing. Please complete your order again.', 'error')
+        return redirect(url_for('checkout'))
 
-    # Fetch cart and customer info from session
-    cart = session.get('cart', [])
+    # A reload or retry of a processed payment shows its order instead of creating another
+    payment = payments.find_payment(payment_id)
+    if payment:
+        metrics.inc('checkouts_total', result='duplicate', reason='reload')
+        return show_recorded_payment(payment)
+
+    # Fetch cart and customer info
+    cart = cart_store.items()
     customer_info = session.get('customer_info')
     
     # Validate that customer_info exists and has required fields
     if not customer_info:
+        metrics.inc('checkouts_total', result='failure', reason='missing_customer_info')
         flash('Customer information is missing. Please complete your order again.', 'error')
         return redirect(url_for('checkout'))
     
@@ -691,14 +618,10 @@ def payment_success():
     required_fields = ['full_name', 'email', 'phone']
     missing_fields = [field for field in required_fields if not customer_info.get(field, '').strip()]
     if missing_fields:
+        metrics.inc('checkouts_total', result='failure', reason='missing_customer_info')
         flash(f'Missing required customer information: {", ".join(missing_fields)}. Please complete your order again.', 'error')
         return redirect(url_for('checkout'))
 
-    full_name = customer_info.get('full_name', '')
-    email = customer_info.get('email', '')
-    phone = customer_info.get('phone', '')
-    address = customer_info.get('address', '')
-
     # Calculate final price with optional shipping and tax
     total_price = sum(item['price'] * item['quantity'] for item in cart)
     delivery_charge = 60 if total_price < 500 else 0
@@ -707,36 +630,40 @@ def payment_success():
     if 'user_id' in session:
         user_id = session['user_id']
 
-        # 0. Create or update Customer record
-        customer = get_or_create_customer(user_id, customer_info)
-        customer_id = customer.id if customer else None
+        # Generate custom order ID
+        custom_order_id = f"ORD-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{payment_id[-6:]}"  # <-- Custom ID
 
-        # Stock validation pass - Check availability before processing payment
-        for item in cart:
-            item_type = item.get('type', 'book')
-            item_id = item['id']
-            quantity = item.get('quantity', 1)
-            
-            if item_type == 'bundle':
-                bundle = db.session.get(BundleOffer, item_id)
-                if not bundle or not bundle.is_active:
-                    flash(f"Bundle '{item.get('title', 'Unknown')}' is no longer available.", "danger")
-                    db.session.rollback()
-                    return redirect(url_for('cart'))
-                
-                # Check stock for each book in bundle
-                for book in bundle.books:
-                    if book.quantity < quantity:
-                        flash(f"Insufficient stock for '{book.title}' in bundle '{bundle.title}'. Only {book.quantity} available.", "danger")
-                        db.session.rollback()
-                        return redirect(url_for('cart'))
-            elif item_type == 'book':
-                book = db.session.get(Book, item_id)
-                if not book or book.quantity < quantity:
-                    available = book.quantity if book else 0
-                    flash(f"Insufficient stock for '{item.get('title', 'Unknown')}'. Only {available} available.", "danger")
-                    db.session.rollback()
-                    return redirect(url_for('cart'))
+        # Take the write lock before the order transaction reads anything, then
+        # claim the payment before anything else is written: concurrent duplicates
+        # of this request wait here and find the winner's order instead
+        database.begin_immediate()
+        if not payments.claim_payment(payment_id, user_id, custom_order_id, final_amount):
+            db.session.rollback()
+            metrics.inc('checkouts_total', result='duplicate', reason='concurrent')
+            return show_recorded_payment(payments.find_payment(payment_id))
+
+        # Resolve every book and bundle once, then validate stock from that snapshot
+        snapshot = order_pipeline.load_cart_snapshot(cart)
+        error = order_pipeline.stock_error(cart, snapshot)
+        if error:
+            flash(error, "danger")
+            db.session.rollback()
+            metrics.inc('stock_outs_total', stage='validation')
+            metrics.inc('checkouts_total', result='failure', reason='out_of_stock')
+            return redirect(url_for('cart'))
+
+        # Take stock first: conditional UPDATEs that fail instead of overselling
+        # when another checkout took the last copies since validation
+        needed = order_pipeline.required_stock(cart, snapshot)
+        try:
+            inventory.take_stock(needed)
+        except inventory.InsufficientStock as e:
+            db.session.rollback()
+            metrics.inc('stock_outs_total', stage='race')
+            metrics.inc('checkouts_total', result='failure', reason='out_of_stock')
+            book = snapshot.books.get(e.book_id)
+            flash(f"Sorry, '{book.title if book else 'a book'}' just sold out. Please review your cart.", "danger")
+            return redirect(url_for('cart'))
 
         # 1. Create the Order
         order = Order(
@@ -747,74 +674,28 @@ def payment_success():
         )
         db.session.add(order)
         db.session.flush()  # Generates order.id
+        payments.attach_order(payment_id, order.id)
 
-        # Generate custom order ID
-        custom_order_id = f"ORD-{datetime.now(timezone.utc).strftime('%Y%m%d')}-{payment_id[-6:]}"  # <-- Custom ID
-
-        # 2. Add Order Items or Enroll in Courses
+        # 2. Enroll in Courses (books and bundles become order items below)
         for item in cart:
             item_type = item.get('type', 'book')
-            item_id = item['id']
             title = item.get('title', 'Untitled')
-            quantity = item.get('quantity', 1)
-            price = item.get('price', 0.0)
 
             if item_type == 'course':
                 user_course = UserCourse(
                     user_id=user_id,
-                    course_id=item_id,
+                    course_id=item['id'],
                     enrollment_date=datetime.now(timezone.utc),
                     completion_status='enrolled'
                 )
                 db.session.add(user_course)
                 flash(f"Enrolled in course: {title}", 'success')
             elif item_type == 'bundle':
-                # Handle bundle purchase
-                bundle = db.session.get(BundleOffer, item_id)
+                bundle = snapshot.bundles.get(item['id'])
                 if bundle and bundle.is_active:
-                    # Calculate per-book price allocation
-                    per_book_price = bundle.selling_price / len(bundle.books) if bundle.books else 0
-                    
-                    # Create OrderItem for each book in the bundle
-                    for book in bundle.books:
-                        order_item = OrderItem(
-                            order_id=order.id,
-                            book_id=book.id,
-                            quantity=quantity,
-                            price=per_book_price
-                        )
-                        db.session.add(order_item)
-                        
-                        # Deduct quantity from Book table
-                        if book.quantity >= quantity:
-                            book.quantity -= quantity
-                        else:
-                            flash(f"Only {book.quantity} of '{book.title}' available in bundle. Adjusted to 0.", "warning")
-                            book.quantity = 0
-                        db.session.add(book)
-                    
                     flash(f"Bundle purchased: {title}", 'success')
                 else:
                     flash(f"Bundle '{title}' is no longer available.", "warning")
-            else:
-                # Add to order items (individual book)
-                order_item = OrderItem(
-                    order_id=order.id,
-                    book_id=item_id,
-                    quantity=quantity,
-                    price=price
-                )
-                db.session.add(order_item)
-
-                # Deduct quantity from Book table
-                book = db.session.get(Book, item_id)
-                if book:
-                    if book.quantity >= quantity:
-                        book.quantity -= quantity
-                    else:
-                        flash(f"Only {book.quantity} of '{book.title}' available. Adjusted to 0.", "warning")
-                        book.quantity = 0
-                    db.session.add(book)
 
         # 3. Create the Transaction
         transaction = Transaction(
@@ -828,32 +709,17 @@ def payment_success():
         db.session.add(transaction)
         db.session.flush()
 
-        # 4. Create Full Order Details for each item
-        for item in cart:
-            item_type = item.get('type', 'book')
-            
-            full_detail = FullOrderDetail(
-                order_id=order.id,
-                transaction_id=transaction.id,
-                customer_id=customer_id,
-                bundle_id=item['id'] if item_type == 'bundle' else None,
-                custom_order_id=custom_order_id,
-                item_id=item['id'],
-                item_type=item_type,
-                item_title=item.get('title', 'Untitled'),
-                quantity=item.get('quantity', 1),
-                price=item['price'],
-                full_name=full_name,
-                email=email,
-                phone=phone,
-                address=address,
-                created_at=datetime.now(timezone.utc)
-            )
-            db.session.add(full_detail)
+        # 4. Insert Order Items in bulk
+        order_pipeline.insert_order_items(order_pipeline.order_item_rows(order.id, cart, snapshot))
+
+        # 5. Queue the customer record, Full Order Details and recommendation
+        #    refreshes for the job worker; they commit with the order
+        order_pipeline.queue_order_jobs(order, transaction, custom_order_id, customer_info, cart, needed)
 
         db.session.commit()
+        metrics.inc('checkouts_total', result='success')
 
-    session['cart'] = []
+    cart_store.clear()
     session.pop('customer_info', None)
 
     order_summary = {
@@ -866,6 +732,14 @@ def payment_success():
     return render_template('payment_success.html', **order_summary)
 
 
+def show_recorded_payment(payment):
+    """Show the order summary of an already processed payment to the user who paid"""
+    if payment.user_id != session.get('user_id'):
+        flash('This payment has already been used for another order.', 'danger')
+        return redirect(url_for('index'))
+    return render_template('payment_success.html', **payments.order_summary(payment))
+
+
 @app.route('/certificate/<int:certificate_id>')
 def download_certificate(certificate_id):
     # Check if user is logged in
@@ -919,18 +793,8 @@ def enroll_course(course_id):
         flash(f'You are already enrolled in {course.title}.', 'info')
         return redirect(url_for('profile'))
     else:
-        # Create cart item for the course
-        cart_item = {
-            'id': course.id,
-            'title': course.title,
-            'price': course.price,
-            'image': course.image,
-            'quantity': 1,
-            'type': 'course'  # To distinguish from books
-        }
-        
         # Replace the entire cart with just this course for direct checkout
-        session['cart'] = [cart_item]
+        cart_store.replace('course', course.id)
         
         # Redirect to checkout for payment
         flash(f'Please complete the payment to enroll in {course.title}.', 'info')
@@ -1321,22 +1185,11 @@ def search():
         'certifications': []    # TODO: Fill in when certification model is ready
     }
 
-    # --- Books search ---
-    books_query = (
-        Book.query
-        .filter(Book.is_deleted == False)
-        .filter(
-            db.or_(
-                Book.title.ilike(f"%{query}%"),
-                Book.author.ilike(f"%{query}%"),
-                Book.description.ilike(f"%{query}%"),
-                Book.categories.any(Category.name.ilike(f"%{query}%")),
-                Book.subcategories.any(SubCategory.name.ilike(f"%{query}%"))
-            )
-        )
-        .limit(20)
-        .all()
-    )
+    page = max(request.args.get('page', 1, type=int), 1)
+
+    # --- Books search (BM25-ranked via the FTS5 index) ---
+    book_ids, has_more = search_index.search_book_ids(query, page=page)
+    books_query = catalog.load_book_cards(book_ids)
 
     for book in books_query:
         results['books'].append({
@@ -1345,13 +1198,13 @@ def search():
             'author': book.author,
             'description': book.description or '',
             'price': book.price,
-            'categories': [c.name for c in book.categories],
-            'subcategories': [s.name for s in book.subcategories],
+            'categories': list(book.categories),
+            'subcategories': list(book.subcategories),
             'avg_rating': book.avg_rating,
             'review_count': book.review_count
         })
 
-    return jsonify({'success': True, 'results': results})
+    return jsonify({'success': True, 'results': results, 'page': page, 'has_more': has_more})
 
 
 @app.route('/search/suggestions')
@@ -1379,41 +1232,17 @@ def search_suggestions():
             'id': 0
         })
 
-    # --- Book suggestions ---
-    if category in ('all', 'books'):
-        books = (
-            Book.query
-            .filter(Book.is_deleted == False)
-            .filter(Book.title.ilike(f"%{query}%"))
-            .limit(5)
-            .all()
-        )
-        for book in books:
-            suggestions.append({
-                'text': book.title,
-                'category': 'books',
-                'id': book.id
-            })
-
-    # --- Category suggestions ---
-    if category in ('all', 'books'):
-        cats = Category.query.filter(Category.name.ilike(f"%{query}%")).limit(5).all()
-        for cat in cats:
-            suggestions.append({
-                'text': cat.name,
-                'category': 'category',
-                'id': cat.id
-            })
-
-    # --- SubCategory suggestions ---
+    # --- Book, author, category and subcategory suggestions ---
+    # Served from this worker's in-memory prefix index, ranked by popularity
     if category in ('all', 'books'):
-        subs = SubCategory.query.filter(SubCategory.name.ilike(f"%{query}%")).limit(5).all()
-        for sub in subs:
-            suggestions.append({
-                'text': sub.name,
-                'category': 'subcategory',
-                'id': sub.id
-            })
+        matches = suggest_index.suggest(query, limit=5)
+        for group in suggest_index.GROUPS:
+            for text, item_id in matches[group]:
+                suggestions.append({
+                    'text': text,
+                    'category': group,
+                    'id': item_id
+                })
 
     return jsonify({'success': True, 'suggestions': suggestions})
 
@@ -0,0 +1,54 @@
+import os
+import threading
+import time
+
+
+class BatchRunner:
+    """Run a refresh handler on a per-worker background thread.
+
+    Commits submit sets of ids; the runner waits `delay` seconds so a burst of
+    commits is merged, then calls handler(**ids) inside an app context. With
+    app.config['BACKGROUND_REFRESH_ASYNC'] = False the handler runs inline,
+    which is what the tests use.
+    """
+
+    def __init__(self, name, handler, delay=1.0):
+        self.name = name
+        self.handler = handler
+        self.delay = delay
+        self._pending = {}
+        self._lock = threading.Lock()
+        self._wakeup = threading.Event()
+        self._thread = None
+        self._pid = None
+
+    def submit(self, app, **ids):
+        if not app.config.get('BACKGROUND_REFRESH_ASYNC', True):
+            with app.app_context():
+                self.handler(**{key: set(values) for key, values in ids.items()})
+            return
+
+        with self._lock:
+            for key, values in ids.items():
+                self._pending.setdefault(key, set()).update(values)
+            # Threads do not survive a fork, so each gunicorn worker starts its own
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name=self.name, daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+        self._wakeup.set()
+
+    def _run(self, app):
+        while True:
+            self._wakeup.wait()
+            time.sleep(self.delay)
+            self._wakeup.clear()
+            with self._lock:
+                ids, self._pending = self._pending, {}
+            if not any(ids.values()):
+                continue
+            try:
+                with app.app_context():
+                    self.handler(**ids)
+            except Exception as e:
+                print(f"Error in background {self.name} refresh: {e}")
@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+"""
+Benchmark order persistence: commit latency for 1-, 10- and 50-line carts with
+one ORM object per row (the old payment_success) against the bulk executemany
+path in order_pipeline (python bench_order_insert.py [repeats])
+"""
+
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timezone
+
+# Never touch the real database
+_tmp = tempfile.mkdtemp(prefix='bench-orders-')
+os.environ['DATABASE_URL'] = f"sqlite:///{os.path.join(_tmp, 'bench.db')}"
+os.environ['CACHE_PATH'] = os.path.join(_tmp, 'cache.db')
+os.environ['CART_STORE_PATH'] = os.path.join(_tmp, 'carts.db')
+os.environ['METRICS_PATH'] = os.path.join(_tmp, 'metrics.db')
+os.environ['SLOW_QUERY_PATH'] = os.path.join(_tmp, 'slow_queries.db')
+os.environ['SUGGEST_CHANGES_PATH'] = os.path.join(_tmp, 'suggest_index.changes')
+
+from app import app, db
+from models import Book, FullOrderDetail, Order, OrderItem, Transaction, User
+import order_pipeline
+
+CART_SIZES = (1, 10, 50)
+
+COMMON = {'full_name': 'Bench User', 'email': 'bench@example.com', 'phone': '9000000000',
+          'address': '1 Main Road, Pune, MH - 411001'}
+
+
+def seed():
+    """A catalog large enough for the biggest cart; returns the user id"""
+    with app.app_context():
+        db.drop_all()
+        db.create_all()
+        db.session.add_all(Book(title=f'Book {i:03d}', author='Author', quantity=10_000, price=100 + i)
+                           for i in range(max(CART_SIZES)))
+        user = User(email='bench@example.com', phone='7000000000', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        return user.id
+
+
+def make_cart(size):
+    return [{'type': 'book', 'id': n, 'title': f'Book {n - 1:03d}', 'price': 99 + n, 'quantity': 1}
+            for n in range(1, size + 1)]
+
+
+def start_order(user_id, cart):
+    order = Order(user_id=user_id, status='completed', total_amount=sum(i['price'] for i in cart))
+    db.session.add(order)
+    db.session.flush()
+    transaction = Transaction(user_id=user_id, order_id=order.id, amount=order.total_amount,
+                              status='completed', payment_id='pay_BENCH')
+    db.session.add(transaction)
+    db.session.flush()
+    return order, transaction
+
+
+def per_row(user_id, cart, snapshot):
+    """The old path: one OrderItem and one FullOrderDetail object per line"""
+    order, transaction = start_order(user_id, cart)
+    for item in cart:
+        db.session.add(OrderItem(order_id=order.id, book_id=item['id'],
+                                 quantity=item['quantity'], price=item['price']))
+    for item in cart:
+        db.session.add(FullOrderDetail(
+            order_id=order.id, transaction_id=transaction.id, item_id=item['id'], item_type='book',
+            item_title=item['title'], quantity=item['quantity'], price=item['price'],
+            created_at=datetime.now(timezone.utc), **COMMON
+        ))
+    db.session.commit()
+
+
+def bulk(user_id, cart, snapshot):
+    """The new path: one executemany INSERT per table"""
+    order, transaction = start_order(user_id, cart)
+    order_pipeline.insert_order_items(order_pipeline.order_item_rows(order.id, cart, snapshot))
+    order_pipeline.insert_order_details(
+        order_pipeline.order_detail_rows(cart, order_id=order.id, transaction_id=transaction.id,
+                                         created_at=datetime.now(timezone.utc), **COMMON)
+    )
+    db.session.commit()
+
+
+def median_ms(fn, user_id, cart, repeats):
+    with app.app_context():
+        snapshot = order_pipeline.load_cart_snapshot(cart)
+        timings = []
+        for _ in range(repeats):
+            start = time.perf_counter()
+            fn(user_id, cart, snapshot)
+            timings.append(time.perf_counter() - start)
+        return statistics.median(timings) * 1000
+
+
+def run_benchmark(repeats=200):
+    print("📊 Order persistence benchmark")
+    print("=" * 40)
+    user_id = seed()
+    print(f"   {'lines':>5}  {'per-row':>9}  {'bulk':>9}  speedup")
+    for size in CART_SIZES:
+        cart = make_cart(size)
+        before = median_ms(per_row, user_id, cart, repeats)
+        after = median_ms(bulk, user_id, cart, repeats)
+        print(f"   {size:>5}  {before:>7.2f}ms  {after:>7.2f}ms  {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 200)
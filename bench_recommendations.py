@@ -0,0 +1,54 @@
+#!/usr/bin/env python3
+"""
+Benchmark the co-purchase recommendation engine on a synthetic dataset of
+one million order items (python bench_recommendations.py [order_items])
+"""
+
+import sys
+import time
+
+import numpy as np
+
+from recommendations import TOP_K, top_k_neighbours
+
+BOOKS = 20_000
+MEAN_ORDER_SIZE = 3
+
+
+def synthetic_order_items(total, seed=42):
+    """Return (order_ids, book_ids) with Zipf-like book popularity and geometric order sizes"""
+    rng = np.random.default_rng(seed)
+    sizes = rng.geometric(1 / MEAN_ORDER_SIZE, size=total)
+    sizes = sizes[np.cumsum(sizes) <= total]
+    order_ids = np.repeat(np.arange(len(sizes), dtype=np.int64), sizes)
+
+    popularity = 1 / np.arange(1, BOOKS + 1) ** 0.8
+    book_ids = rng.choice(BOOKS, size=len(order_ids), p=popularity / popularity.sum()) + 1
+    return order_ids, book_ids
+
+
+def timed(label, fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    print(f"   {label}: {time.perf_counter() - start:.2f}s")
+    return result
+
+
+def run_benchmark(total=1_000_000):
+    print("📊 Co-purchase recommendation benchmark")
+    print("=" * 40)
+    order_ids, book_ids = timed("Generate data", synthetic_order_items, total)
+    print(f"   {len(book_ids):,} order items in {order_ids[-1] + 1:,} orders over {BOOKS:,} books")
+
+    source, target, co_purchases, rank = timed("Full rebuild", top_k_neighbours, order_ids, book_ids)
+    print(f"   {len(source):,} neighbour rows (top {TOP_K}) for {len(np.unique(source)):,} books")
+
+    # Incremental update: the books of one new order, recomputed from the orders they appear in
+    new_order = np.unique(book_ids[:MEAN_ORDER_SIZE])
+    touched = np.isin(order_ids, order_ids[np.isin(book_ids, new_order)])
+    timed(f"Incremental update ({len(new_order)} books, {touched.sum():,} order items)",
+          top_k_neighbours, order_ids[touched], book_ids[touched], rows=set(new_order.tolist()))
+
+
+if __name__ == "__main__":
+    run_benchmark(int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000)
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+Load-test the storefront: serve a seeded copy of the database with gunicorn
+(and the job worker) and drive shopper journeys from local threads (browse
+/books, search, book pages, add to cart, checkout through /payment/success
+with stub payment ids, profile) plus a back-office admin, then write
+throughput, p50/p95/p99 latency and error rate per route to a JSON file
+
+    python bench_storefront.py [--scale 0.01] [--users 8] [--journeys 25] [--baseline FILE]
+    python bench_storefront.py --compare BASELINE RESULTS
+
+Runs are reproducible: the same --scale, --seed, --users and --journeys
+replay the same requests against the same data. Comparing with a baseline
+exits 1 when a route got slower or started failing, so it can gate a deploy.
+"""
+
+import argparse
+import json
+import math
+import os
+import platform
+import random
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime, timezone
+
+import requests
+
+# Never touch the real database
+_tmp = tempfile.mkdtemp(prefix='bench-storefront-')
+_db_path = os.path.join(_tmp, 'bench.db')
+os.environ['DATABASE_URL'] = f"sqlite:///{_db_path}"
+os.environ['CACHE_PATH'] = os.path.join(_tmp, 'cache.db')
+os.environ['CART_STORE_PATH'] = os.path.join(_tmp, 'carts.db')
+os.environ['METRICS_PATH'] = os.path.join(_tmp, 'metrics.db')
+os.environ['SLOW_QUERY_PATH'] = os.path.join(_tmp, 'slow_queries.db')
+os.environ['SUGGEST_CHANGES_PATH'] = os.path.join(_tmp, 'suggest_index.changes')
+os.environ['MAIL_ENABLED'] = '0'
+
+from app import app
+from seed_data import CATEGORIES, TITLE_OPENERS, TITLE_TOPICS, person
+
+ROOT = os.path.dirname(os.path.abspath(__file__))
+OUTPUT = 'bench_storefront.json'
+THRESHOLD = 0.20      # relative slowdown (or throughput drop) that counts as a regression
+MIN_DELTA_MS = 5.0    # ... as long as the route is at least this much slower
+MIN_REQUESTS = 30     # fewer requests than this are too noisy to judge latency on
+MAX_ERROR_RATE_RISE = 0.01
+READY_TIMEOUT = 60
+REQUEST_TIMEOUT = 30
+
+SEARCH_TERMS = [word.lower() for phrase in TITLE_OPENERS + TITLE_TOPICS
+                for word in phrase.split() if len(word) > 3]
+
+
+def git(*args):
+    try:
+        return subprocess.run(['git', *args], cwd=ROOT, capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def seed(path, scale, seed_value):
+    """Generate the benchmark data into path with the seed-data command"""
+    env = dict(os.environ, DATABASE_URL=f"sqlite:///{path}")
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-m', 'flask', '--app', 'app', 'seed-data',
+                    '--scale', str(scale), '--seed', str(seed_value), '--reset', '--yes'],
+                   cwd=ROOT, env=env, check=True, stdout=subprocess.DEVNULL)
+    print(f"   Seeded scale {scale} in {time.perf_counter() - start:.0f}s")
+
+
+def prepare_database(seed_path):
+    """Copy the seeded database for this run; returns the catalog the shoppers pick from"""
+    with sqlite3.connect(seed_path) as source, sqlite3.connect(_db_path) as target:
+        source.backup(target)
+        target.execute("INSERT INTO admins (name, email, password_hash, created_at) "
+                       "VALUES ('Bench Admin', 'bench-admin@example.com', 'x', CURRENT_TIMESTAMP)")
+        book_ids = [row[0] for row in target.execute(
+            'SELECT id FROM books WHERE NOT is_deleted AND quantity > 0 ORDER BY id')]
+        user_count = target.execute('SELECT COUNT(*) FROM users').fetchone()[0]
+        admin_id = target.execute("SELECT id FROM admins WHERE email = 'bench-admin@example.com'").fetchone()[0]
+    return book_ids, user_count, admin_id
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def start_server(workers, port, log):
+    """Start gunicorn and the job worker; returns their processes once the site answers"""
+    server = subprocess.Popen(
+        [sys.executable, '-m', 'gunicorn', '-c', 'gunicorn.conf.py', '--workers', str(workers),
+         '--bind', f'127.0.0.1:{port}', 'app:app'],
+        cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    job_worker = subprocess.Popen([sys.executable, '-m', 'flask', '--app', 'app', 'run-jobs'],
+                                  cwd=ROOT, stdout=log, stderr=subprocess.STDOUT)
+    processes = [server, job_worker]
+
+    deadline = time.monotonic() + READY_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            stop(processes)
+            raise SystemExit(f"❌ gunicorn exited with {server.returncode}; see {log.name}")
+        try:
+            if requests.get(f'http://127.0.0.1:{port}/books', timeout=5).status_code < 500:
+                return processes
+        except requests.RequestException:
+            pass
+        time.sleep(0.25)
+    stop(processes)
+    raise SystemExit(f"❌ The server did not answer within {READY_TIMEOUT}s; see {log.name}")
+
+
+def stop(processes):
+    for process in processes:
+        process.terminate()
+    for process in processes:
+        try:
+            process.wait(timeout=10)
+        except subprocess.TimeoutExpired:
+            process.kill()
+
+
+def signed_session(**values):
+    """A session cookie as the app would set it after login"""
+    return app.session_interface.get_signing_serializer(app).dumps(values)
+
+
+class Recorder:
+    """Latency, status and outcome of every request, by route"""
+
+    def __init__(self):
+        self.samples = {}
+        self._lock = threading.Lock()
+
+    def add(self, route, ms, status, ok):
+        with self._lock:
+            self.samples.setdefault(route, []).append((ms, status, ok))
+
+
+class VirtualUser:
+    """One client with its own cookies and random stream, replaying journeys"""
+
+    def __init__(self, index, base_url, recorder, seed_value, session_values):
+        self.index = index
+        self.base_url = base_url
+        self.recorder = recorder
+        self.rng = random.Random(seed_value * 1000 + index)
+        self.http = requests.Session()
+        self.http.cookies.set(app.config['SESSION_COOKIE_NAME'], signed_session(**session_values),
+                              domain='127.0.0.1', path='/')
+
+    def request(self, route, method, path, **kwargs):
+        start = time.perf_counter()
+        try:
+            response = self.http.request(method, self.base_url + path, allow_redirects=False,
+                                         timeout=REQUEST_TIMEOUT, **kwargs)
+        except requests.RequestException:
+            self.recorder.add(route, (time.perf_counter() - start) * 1000, 0, False)
+            return None
+        ms = (time.perf_counter() - start) * 1000
+        # A redirect to a login page means the session was lost: count it as an error
+        location = response.headers.get('Location', '')
+        ok = response.status_code < 400 and not location.split('?')[0].endswith('/login')
+        self.recorder.add(route, ms, response.status_code, ok)
+        return response
+
+    def run(self, journeys):
+        for _ in range(journeys):
+            self.journey()
+
+
+class Shopper(VirtualUser):
+    """Browses, searches, reads book pages and sometimes buys"""
+
+    def __init__(self, index, base_url, recorder, seed_value, user_id, book_ids):
+        details = person(user_id)
+        super().__init__(index, base_url, recorder, seed_value,
+                         {'user_id': user_id, 'email': details['email'], 'phone': details['phone']})
+        self.customer_info = details
+        self.book_ids = book_ids
+        self.cart = []
+        self.orders = 0
+
+    def pick_book(self):
+        # Skewed towards the front of the catalog: a few books get most of the views
+        return self.book_ids[int(len(self.book_ids) * self.rng.random() ** 3)]
+
+    def journey(self):
+        rng = self.rng
+        params = rng.choice([{}, {'view': 'list'}, {'category': rng.choice(list(CATEGORIES))}])
+        self.request('books', 'GET', '/books', params=params)
+        if rng.random() < 0.5:
+            self.request('search', 'GET', '/search', params={'q': rng.choice(SEARCH_TERMS)})
+        for _ in range(rng.randint(1, 3)):
+            book_id = self.pick_book()
+            self.request('book_detail', 'GET', f'/book/{book_id}')
+        if rng.random() < 0.4:
+            self.request('add_to_cart', 'GET', f'/cart/add/{book_id}')
+            self.cart.append(book_id)
+        if self.cart and rng.random() < 0.5:
+            self.checkout()
+        if rng.random() < 0.3:
+            self.request('profile', 'GET', '/profile')
+
+    def checkout(self):
+        self.request('checkout', 'GET', '/checkout')
+        self.request('store_customer_info', 'POST', '/store-customer-info', json=self.customer_info)
+        self.orders += 1
+        payment_id = f'pay_LOAD{self.index:03d}{self.orders:05d}'
+        response = self.request('payment_success', 'GET', '/payment/success', params={'payment_id': payment_id})
+        if response is not None and response.status_code != 200:
+            # Sold out since it was added: empty the cart and carry on shopping
+            for book_id in set(self.cart):
+                self.request('remove_from_cart', 'GET', f'/cart/remove/book/{book_id}')
+        self.cart = []
+
+
+class Admin(VirtualUser):
+    """Back office: the dashboard and the catalog pages"""
+
+    def __init__(self, index, base_url, recorder, seed_value, admin_id):
+        super().__init__(index, base_url, recorder, seed_value, {'admin_id': admin_id})
+
+    def journey(self):
+        self.request('admin.dashboard', 'GET', '/admin/dashboard')
+        self.request('admin.manage_books', 'GET', '/admin/manage-books',
+                     params=self.rng.choice([{}, {'search': self.rng.choice(SEARCH_TERMS)}]))
+        self.request('admin.manage_bundles', 'GET', '/admin/manage-bundles')
+
+
+def percentile(latencies, q):
+    """Nearest-rank percentile of sorted latencies"""
+    return latencies[max(0, min(len(latencies) - 1, math.ceil(q * len(latencies)) - 1))]
+
+
+def route_stats(samples, wall):
+    latencies = sorted(ms for ms, _, _ in samples)
+    errors = sum(1 for _, _, ok in samples if not ok)
+    statuses = {}
+    for _, status, _ in samples:
+        statuses[str(status)] = statuses.get(str(status), 0) + 1
+    return {
+        'requests': len(samples),
+        'errors': errors,
+        'error_rate': round(errors / len(samples), 4),
+        'throughput_rps': round(len(samples) / wall, 2),
+        'mean_ms': round(sum(latencies) / len(latencies), 2),
+        'p50_ms': round(percentile(latencies, 0.50), 2),
+        'p95_ms': round(percentile(latencies, 0.95), 2),
+        'p99_ms': round(percentile(latencies, 0.99), 2),
+        'max_ms': round(latencies[-1], 2),
+        'statuses': dict(sorted(statuses.items())),
+    }
+
+
+def summarise(recorder, wall):
+    routes = {route: route_stats(samples, wall) for route, samples in sorted(recorder.samples.items())}
+    every = [sample for samples in recorder.samples.values() for sample in samples]
+    return routes, route_stats(every, wall)
+
+
+def print_results(results):
+    print(f"   {'route':<22} {'reqs':>6} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'errors':>7}")
+    for route, stats in [*results['routes'].items(), ('TOTAL', results['total'])]:
+        print(f"   {route:<22} {stats['requests']:>6} {stats['throughput_rps']:>7.1f} "
+              f"{stats['p50_ms']:>6.1f}ms {stats['p95_ms']:>6.1f}ms {stats['p99_ms']:>6.1f}ms "
+              f"{stats['error_rate']:>7.1%}")
+
+
+def run_benchmark(scale=0.01, seed_value=42, users=8, admins=1, journeys=25, workers=2,
+                  seed_db=None, output=OUTPUT):
+    print("📊 Storefront load test")
+    print("=" * 40)
+    if seed_db is None or not os.path.exists(seed_db):
+        seed_db = seed_db or os.path.join(_tmp, 'seed.db')
+        seed(seed_db, scale, seed_value)
+    else:
+        print(f"   Reusing seeded database {seed_db}")
+    book_ids, user_count, admin_id = prepare_database(seed_db)
+
+    port = free_port()
+    base_url = f'http://127.0.0.1:{port}'
+    recorder = Recorder()
+    stride = max(user_count // max(users, 1), 1)
+    clients = [Shopper(i, base_url, recorder, seed_value, 1 + i * stride, book_ids) for i in range(users)]
+    clients += [Admin(users + i, base_url, recorder, seed_value, admin_id) for i in range(admins)]
+
+    with open(os.path.join(_tmp, 'server.log'), 'w') as log:
+        processes = start_server(workers, port, log)
+        try:
+            # Warm every worker's caches and connections before measuring
+            for _ in range(workers * 2):
+                for path in ('/books', f'/book/{book_ids[0]}', f'/search?q={SEARCH_TERMS[0]}'):
+                    requests.get(base_url + path, timeout=REQUEST_TIMEOUT)
+
+            print(f"   {users} shoppers + {admins} admins x {journeys} journeys, {workers} gunicorn workers")
+            threads = [threading.Thread(target=client.run, args=(journeys,)) for client in clients]
+            start = time.perf_counter()
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+            wall = time.perf_counter() - start
+        finally:
+            stop(processes)
+
+    routes, total = summarise(recorder, wall)
+    results = {
+        'run': {
+            'started_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'commit': git('rev-parse', 'HEAD'),
+            'uncommitted': (git('status', '--porcelain', '--', '*.py', 'templates') or '').splitlines(),
+            'scale': scale, 'seed': seed_value, 'users': users, 'admins': admins,
+            'journeys': journeys, 'workers': workers, 'cpus': os.cpu_count(),
+            'python': platform.python_version(), 'duration_s': round(wall, 2),
+        },
+        'routes': routes,
+        'total': total,
+    }
+    with open(output, 'w') as f:
+        json.dump(results, f, indent=2)
+
+    print_results(results)
+    print(f"   Results written to {output} (server log: {log.name})")
+    if total['errors']:
+        print(f"⚠ {total['errors']} requests failed; see the server log")
+    return results
+
+
+def compare(baseline, current, threshold=THRESHOLD):
+    """Print the per-route changes from baseline to current; returns the regressions"""
+    print(f"📊 Compared with baseline ({(baseline['run'].get('commit') or '?')[:10]} -> "
+          f"{(current['run'].get('commit') or '?')[:10]})")
+    print("=" * 40)
+    settings = ('scale', 'seed', 'users', 'admins', 'journeys', 'workers', 'cpus')
+    differing = [key for key in settings if baseline['run'].get(key) != current['run'].get(key)]
+    if differing:
+        print(f"⚠ Runs used different settings ({', '.join(differing)}); numbers may not be comparable")
+    if baseline['run'].get('commit') and current['run'].get('commit'):
+        changed = git('diff', '--name-only', baseline['run']['commit'], current['run']['commit'], '--', '*.py', 'templates')
+        if changed:
+            print(f"   Changed since baseline: {', '.join(changed.splitlines())}")
+    if current['run'].get('uncommitted'):
+        print(f"   Uncommitted changes: {', '.join(line[3:] for line in current['run']['uncommitted'])}")
+
+    regressions = []
+    for route, before in baseline['routes'].items():
+        after = current['routes'].get(route)
+        if after is None:
+            regressions.append(f"{route}: not exercised any more")
+            continue
+        problems = []
+        judged = min(before['requests'], after['requests']) >= MIN_REQUESTS
+        for key in ('p50_ms', 'p95_ms') if judged else ():
+            if after[key] > before[key] * (1 + threshold) and after[key] - before[key] >= MIN_DELTA_MS:
+                problems.append(f"{key[:3]} {before[key]:.1f}ms -> {after[key]:.1f}ms")
+        if after['error_rate'] - before['error_rate'] > MAX_ERROR_RATE_RISE:
+            problems.append(f"errors {before['error_rate']:.1%} -> {after['error_rate']:.1%}")
+        marker = '❌' if problems else ('✓' if judged else '·')
+        print(f"   {marker} {route:<22} p50 {before['p50_ms']:>7.1f} -> {after['p50_ms']:>7.1f}ms   "
+              f"p95 {before['p95_ms']:>7.1f} -> {after['p95_ms']:>7.1f}ms   "
+              f"errors {before['error_rate']:.1%} -> {after['error_rate']:.1%}"
+              f"{'' if judged else '   (too few requests to judge latency)'}")
+        regressions.extend(f"{route}: {problem}" for problem in problems)
+
+    before, after = baseline['total']['throughput_rps'], current['total']['throughput_rps']
+    print(f"   Throughput {before:.1f} -> {after:.1f} req/s")
+    if after < before * (1 - threshold):
+        regressions.append(f"throughput {before:.1f} -> {after:.1f} req/s")
+
+    if regressions:
+        print(f"❌ {len(regressions)} regressions over {threshold:.0%}:")
+        for regression in regressions:
+            print(f"   - {regression}")
+    else:
+        print(f"✓ No route regressed by more than {threshold:.0%}")
+    return regressions
+
+
+def load(path):
+    with open(path) as f:
+        return json.load(f)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description='Load-test the storefront under gunicorn.')
+    parser.add_argument('--scale', type=float, default=0.01, help='seed-data scale (0.01 = 1,000 books, 20,000 orders)')
+    parser.add_argument('--seed', type=int, default=42, help='seed for the data and the journeys')
+    parser.add_argument('--users', type=int, default=8, help='concurrent shoppers')
+    parser.add_argument('--admins', type=int, default=1, help='concurrent back-office admins')
+    parser.add_argument('--journeys', type=int, default=25, help='journeys per virtual user')
+    parser.add_argument('--workers', type=int, default=2, help='gunicorn workers')
+    parser.add_argument('--seed-db', help='seeded database to reuse (created on first use)')
+    parser.add_argument('--output', default=OUTPUT, help='results file')
+    parser.add_argument('--baseline', help='results file to compare this run with')
+    parser.add_argument('--threshold', type=float, default=THRESHOLD, help='regression threshold (0.2 = 20%%)')
+    parser.add_argument('--compare', nargs=2, metavar=('BASELINE', 'RESULTS'), help='only compare two results files')
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(load(args.compare[0]), load(args.compare[1]), args.threshold) else 0)
+
+    results = run_benchmark(args.scale, args.seed, args.users, args.admins, args.journeys, args.workers,
+                            args.seed_db, args.output)
+    if args.baseline:
+        print()
+        sys.exit(1 if compare(load(args.baseline), results, args.threshold) else 0)
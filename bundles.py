@@ -0,0 +1,121 @@
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import db, Book, BundleOffer, bundle_books
+
+# Bundle totals are stored on bundle_offers so listing pages never load the
+# member books to price them. Soft-deleted books no longer count.
+_TOTALS_SQL = """
+UPDATE bundle_offers SET
+    total_mrp = COALESCE((
+        SELECT SUM(COALESCE(NULLIF(b.original_price, 0), b.price, 0))
+        FROM bundle_books bb JOIN books b ON b.id = bb.book_id AND b.is_deleted = 0
+        WHERE bb.bundle_id = bundle_offers.id
+    ), 0),
+    book_count = (
+        SELECT COUNT(*)
+        FROM bundle_books bb JOIN books b ON b.id = bb.book_id AND b.is_deleted = 0
+        WHERE bb.bundle_id = bundle_offers.id
+    )
+WHERE {where}
+"""
+
+_SAVINGS_SQL = """
+UPDATE bundle_offers SET
+    savings_amount = CASE WHEN total_mrp > selling_price THEN total_mrp - selling_price ELSE 0 END,
+    savings_percentage = CASE WHEN total_mrp > selling_price
+                              THEN (total_mrp - selling_price) * 100.0 / total_mrp ELSE 0 END
+WHERE {where}
+"""
+
+STORED_COLUMNS = ['total_mrp', 'savings_amount', 'savings_percentage', 'book_count']
+
+# Book columns that feed the stored totals
+_PRICE_ATTRS = ('price', 'original_price', 'is_deleted')
+
+
+def recompute_bundle_savings(connection, bundle_ids=None):
+    """Refresh stored totals for the given bundles (all bundles if None), returning the row count"""
+    if bundle_ids is None:
+        params = {}
+        where = '1 = 1'
+    else:
+        bundle_ids = list(bundle_ids)
+        if not bundle_ids:
+            return 0
+        params = {'ids': bundle_ids}
+        where = 'id IN :ids'
+
+    rowcount = 0
+    for sql in (_TOTALS_SQL, _SAVINGS_SQL):
+        stmt = text(sql.format(where=where))
+        if params:
+            stmt = stmt.bindparams(bindparam('ids', expanding=True))
+        rowcount = connection.execute(stmt, params).rowcount
+    return rowcount
+
+
+# --- Keep stored totals in sync with ORM writes ---
+
+@event.listens_for(Session, 'before_flush')
+def _collect_bundle_changes(session, flush_context, instances):
+    bundle_ids = set()
+    book_ids = set()
+
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, BundleOffer):
+            # New bundles get their id during the flush
+            session.info.setdefault('bundle_savings_objects', set()).add(obj)
+        elif isinstance(obj, Book) and obj.id is not None:
+            state = inspect(obj)
+            if any(state.attrs[attr].history.has_changes() for attr in _PRICE_ATTRS):
+                book_ids.add(obj.id)
+    for obj in session.deleted:
+        if isinstance(obj, Book) and obj.id is not None:
+            book_ids.add(obj.id)
+
+    if book_ids:
+        bundle_ids.update(session.connection().execute(
+            bundle_books.select().with_only_columns(bundle_books.c.bundle_id)
+            .where(bundle_books.c.book_id.in_(book_ids))
+        ).scalars())
+    if bundle_ids:
+        session.info.setdefault('bundle_savings_ids', set()).update(bundle_ids)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_bundle_changes(session, flush_context):
+    bundle_ids = session.info.pop('bundle_savings_ids', set())
+    bundles = session.info.pop('bundle_savings_objects', set())
+    bundle_ids.update(bundle.id for bundle in bundles if bundle.id is not None and bundle not in session.deleted)
+    if bundle_ids:
+        recompute_bundle_savings(session.connection(), bundle_ids)
+        session.info.setdefault('bundle_savings_expire', set()).update(bundle_ids)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_stored_totals(session, flush_context):
+    # The UPDATE bypassed the ORM, so reload the totals on next access
+    bundle_ids = session.info.pop('bundle_savings_expire', None)
+    if not bundle_ids:
+        return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, BundleOffer) and obj.id in bundle_ids:
+            session.expire(obj, STORED_COLUMNS)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_bundle_changes(session):
+    for key in ('bundle_savings_ids', 'bundle_savings_objects', 'bundle_savings_expire'):
+        session.info.pop(key, None)
+
+
+def init_app(app):
+    """Register the bundle savings CLI command"""
+
+    @app.cli.command('recompute-bundle-savings')
+    def recompute_bundle_savings_command():
+        """Recompute stored MRP and savings for every bundle offer."""
+        with db.engine.begin() as conn:
+            count = recompute_bundle_savings(conn)
+        print(f"✓ Recomputed savings for {count} bundle offers")
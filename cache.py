@@ -0,0 +1,209 @@
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from types import SimpleNamespace
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, inspect
+from sqlalchemy.orm import Session
+
+import metrics
+
+# Two-level cache shared by every gunicorn worker on the host.
+#
+# Values live in a small SQLite file next to the app database and are mirrored
+# in each worker's memory. Every namespace has a version number in the shared
+# file; writes to the models registered for a namespace bump that version on
+# commit, which makes every worker's copy stale at once.
+
+DEFAULT_TTL = 3600
+
+metrics.counter('cache_lookups_total', 'Cache reads by namespace and result (memory_hit, shared_hit, miss)')
+metrics.gauge('cache_hit_ratio', 'Share of cache reads answered from the cache since metrics were reset')
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_versions (
+    namespace TEXT PRIMARY KEY,
+    version INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    version INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    value BLOB NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+_memory = {}        # (namespace, key) -> (version, expires_at, value)
+_memory_lock = threading.Lock()
+_local = threading.local()
+_watched = {}       # model class -> [namespace or namespace(obj)]
+
+
+def _store_path():
+    path = current_app.config.get('CACHE_PATH')
+    return path or os.path.join(current_app.instance_path, 'cache.db')
+
+
+def _connection():
+    """Return this thread's connection to the shared store, opening it on first use"""
+    path = _store_path()
+    conn = getattr(_local, 'conn', None)
+    # A connection must not cross a fork (gunicorn --preload) or a path change
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), path
+    return conn
+
+
+def get_version(namespace):
+    row = _connection().execute(
+        'SELECT version FROM cache_versions WHERE namespace = ?', (namespace,)
+    ).fetchone()
+    return row[0] if row else 0
+
+
+def get(namespace, key):
+    """Return the cached value, or None if missing, expired or invalidated"""
+    version = get_version(namespace)
+    now = time.time()
+
+    entry = _memory.get((namespace, key))
+    if entry and entry[0] == version and entry[1] > now:
+        metrics.inc('cache_lookups_total', namespace=namespace, result='memory_hit')
+        return entry[2]
+
+    row = _connection().execute(
+        'SELECT version, expires_at, value FROM cache_entries WHERE namespace = ? AND key = ?',
+        (namespace, key)
+    ).fetchone()
+    if row and row[0] == version and row[1] > now:
+        value = pickle.loads(row[2])
+        with _memory_lock:
+            _memory[(namespace, key)] = (version, row[1], value)
+        metrics.inc('cache_lookups_total', namespace=namespace, result='shared_hit')
+        return value
+    metrics.inc('cache_lookups_total', namespace=namespace, result='miss')
+    return None
+
+
+def put(namespace, key, value, ttl=DEFAULT_TTL, version=None):
+    """Store a value for this worker and the shared store.
+
+    Pass the version read before computing the value so that a write committed
+    meanwhile is not hidden behind a stale entry.
+    """
+    if version is None:
+        version = get_version(namespace)
+    expires_at = time.time() + ttl
+    with _memory_lock:
+        _memory[(namespace, key)] = (version, expires_at, value)
+    _connection().execute(
+        'INSERT OR REPLACE INTO cache_entries (namespace, key, version, expires_at, value) '
+        'VALUES (?, ?, ?, ?, ?)',
+        (namespace, key, version, expires_at, pickle.dumps(value, pickle.HIGHEST_PROTOCOL))
+    )
+
+
+def get_or_set(namespace, key, producer, ttl=DEFAULT_TTL):
+    """Return the cached value, calling producer() to fill it on a miss"""
+    version = get_version(namespace)
+    value = get(namespace, key)
+    if value is None:
+        value = producer()
+        put(namespace, key, value, ttl=ttl, version=version)
+    return value
+
+
+def invalidate(*namespaces):
+    """Drop every entry of the given namespaces in all workers"""
+    conn = _connection()
+    for namespace in namespaces:
+        conn.execute(
+            'INSERT INTO cache_versions (namespace, version) VALUES (?, 1) '
+            'ON CONFLICT(namespace) DO UPDATE SET version = version + 1',
+            (namespace,)
+        )
+        conn.execute('DELETE FROM cache_entries WHERE namespace = ?', (namespace,))
+        with _memory_lock:
+            for cache_key in [k for k in _memory if k[0] == namespace]:
+                del _memory[cache_key]
+
+
+def snapshot(obj):
+    """Copy a model's column values into a plain, picklable object for templates"""
+    return SimpleNamespace(**{
+        attr.key: getattr(obj, attr.key) for attr in inspect(obj).mapper.column_attrs
+    })
+
+
+# --- Write-driven invalidation ---
+
+def invalidate_on(namespace, *models):
+    """Invalidate namespace whenever a commit inserts, updates or deletes any of models.
+
+    namespace may also be a function of the changed object, for per-user or
+    per-item namespaces.
+    """
+    for model in models:
+        _watched.setdefault(model, []).append(namespace)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_stale_namespaces(session, flush_context):
+    if not _watched:
+        return
+    stale = set()
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        for namespace in _watched.get(type(obj), ()):
+            stale.add(namespace(obj) if callable(namespace) else namespace)
+    if stale:
+        session.info.setdefault('cache_stale_namespaces', set()).update(stale)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_stale_namespaces(session):
+    stale = session.info.pop('cache_stale_namespaces', None)
+    if stale and has_app_context():
+        invalidate(*stale)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_stale_namespaces(session):
+    session.info.pop('cache_stale_namespaces', None)
+
+
+@metrics.collector
+def _hit_ratios():
+    lookups = {}
+    for labels, count in metrics.totals('cache_lookups_total'):
+        hits, total = lookups.get(labels['namespace'], (0, 0))
+        hit = count if labels['result'] != 'miss' else 0
+        lookups[labels['namespace']] = (hits + hit, total + count)
+    return [('cache_hit_ratio', {'namespace': namespace}, hits / total)
+            for namespace, (hits, total) in lookups.items() if total]
+
+
+def clear():
+    """Drop every cached value in all workers, returning the number of namespaces"""
+    namespaces = [row[0] for row in _connection().execute(
+        'SELECT namespace FROM cache_versions UNION SELECT namespace FROM cache_entries'
+    )]
+    invalidate(*namespaces)
+    return len(namespaces)
+
+
+def init_app(app):
+    """Register the cache CLI command"""
+
+    @app.cli.command('clear-cache')
+    def clear_cache_command():
+        """Drop every cached value in all workers."""
+        print(f"✓ Cleared {clear()} cache namespaces")
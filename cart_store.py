@@ -0,0 +1,329 @@
+import json
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app, g, session
+from sqlalchemy.orm import selectinload
+from werkzeug.utils import import_string
+
+import cache
+import catalog
+from models import Book, BookImage, BundleOffer, Category, Course, SubCategory
+
+# Server-side carts. The session cookie only carries an anonymous cart id;
+# logged-in users' carts are keyed by user id and survive across devices.
+# A cart stores (type, id, quantity) per line. Titles, prices and images are
+# hydrated from cached summaries, so carts always show current prices.
+
+CART_TTL = 30 * 24 * 3600
+
+ITEM_TYPES = ('book', 'bundle', 'course')
+
+CartLine = namedtuple('CartLine', ['type', 'id', 'quantity'])
+
+SUMMARY_CACHE = 'cart-summaries'
+cache.invalidate_on(SUMMARY_CACHE, Book, BookImage, Category, SubCategory, BundleOffer, Course)
+
+
+class CartBackend:
+    """Storage interface for carts: a key-value store of cart id -> lines.
+
+    Set CART_BACKEND to 'module:Class' to use another local key-value store;
+    the class is constructed with the app.
+    """
+
+    def load(self, cart_id):
+        """Return the stored lines as [[type, id, quantity], ...] or None"""
+        raise NotImplementedError
+
+    def save(self, cart_id, lines):
+        raise NotImplementedError
+
+    def delete(self, cart_id):
+        raise NotImplementedError
+
+
+class SQLiteCartBackend(CartBackend):
+    """Carts in a SQLite file shared by every worker (CART_STORE_PATH or instance/carts.db)"""
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS carts (
+        cart_id TEXT PRIMARY KEY,
+        lines TEXT NOT NULL,
+        updated_at REAL NOT NULL
+    )
+    """
+
+    def __init__(self, app):
+        self.path = app.config.get('CART_STORE_PATH') or os.path.join(app.instance_path, 'carts.db')
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        # A connection must not cross a fork (gunicorn --preload)
+        if conn is None or self._local.pid != os.getpid():
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(self._SCHEMA)
+            self._local.conn, self._local.pid = conn, os.getpid()
+        return conn
+
+    def load(self, cart_id):
+        row = self._connection().execute(
+            'SELECT lines FROM carts WHERE cart_id = ? AND updated_at > ?',
+            (cart_id, time.time() - CART_TTL)
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, cart_id, lines):
+        self._connection().execute(
+            'INSERT OR REPLACE INTO carts (cart_id, lines, updated_at) VALUES (?, ?, ?)',
+            (cart_id, json.dumps(lines, separators=(',', ':')), time.time())
+        )
+
+    def delete(self, cart_id):
+        self._connection().execute('DELETE FROM carts WHERE cart_id = ?', (cart_id,))
+
+    def purge_expired(self):
+        """Delete carts untouched for CART_TTL, returning how many were removed"""
+        return self._connection().execute(
+            'DELETE FROM carts WHERE updated_at <= ?', (time.time() - CART_TTL,)
+        ).rowcount
+
+
+def backend():
+    """Return the app's cart backend, creating it on first use"""
+    store = current_app.extensions.get('cart_store')
+    if store is None:
+        backend_class = current_app.config.get('CART_BACKEND') or SQLiteCartBackend
+        if isinstance(backend_class, str):
+            backend_class = import_string(backend_class)
+        store = current_app.extensions['cart_store'] = backend_class(current_app)
+    return store
+
+
+# --- The current visitor's cart ---
+
+def current_cart_id(create=False):
+    """Cart id for the logged-in user, or the anonymous cart in the session"""
+    if 'user_id' in session:
+        return f"user:{session['user_id']}"
+    if 'cart_id' not in session:
+        if not create:
+            return None
+        session['cart_id'] = secrets.token_urlsafe(16)
+    return f"anon:{session['cart_id']}"
+
+
+def get_lines():
+    """Return the current cart as a list of CartLine"""
+    if 'cart_lines' not in g:
+        _migrate_cookie_cart()
+        cart_id = current_cart_id()
+        stored = backend().load(cart_id) if cart_id else None
+        g.cart_lines = [CartLine(*line) for line in stored or []]
+    return list(g.cart_lines)
+
+
+def save_lines(lines):
+    """Replace the current cart with lines (an empty list deletes it)"""
+    lines = [CartLine(t, int(i), int(q)) for t, i, q in lines if t in ITEM_TYPES and int(q) > 0]
+    cart_id = current_cart_id(create=bool(lines))
+    if cart_id:
+        if lines:
+            backend().save(cart_id, [list(line) for line in lines])
+        else:
+            backend().delete(cart_id)
+    g.cart_lines = lines
+
+
+def quantity_of(item_type, item_id):
+    return next((line.quantity for line in get_lines() if line[:2] == (item_type, item_id)), 0)
+
+
+def set_quantity(item_type, item_id, quantity):
+    """Set one line's quantity, adding the line if needed and removing it at 0"""
+    lines = get_lines()
+    keys = [line[:2] for line in lines]
+    if (item_type, item_id) in keys:
+        lines[keys.index((item_type, item_id))] = CartLine(item_type, item_id, quantity)
+    else:
+        lines.append(CartLine(item_type, item_id, quantity))
+    save_lines(lines)
+
+
+def remove(item_type, item_id):
+    """Remove a line, returning False if it was not in the cart"""
+    lines = get_lines()
+    remaining = [line for line in lines if line[:2] != (item_type, item_id)]
+    if len(remaining) == len(lines):
+        return False
+    save_lines(remaining)
+    return True
+
+
+def replace(item_type, item_id, quantity=1):
+    """Make the cart hold just one item (buy now / enroll)"""
+    save_lines([CartLine(item_type, item_id, quantity)])
+
+
+def clear():
+    save_lines([])
+
+
+def count():
+    """Number of lines in the current cart, for the navbar badge"""
+    return len(get_lines())
+
+
+def merge_anonymous_cart(user_id):
+    """Move the session's anonymous cart into the user's cart at login"""
+    anon_id = session.pop('cart_id', None)
+    if not anon_id:
+        return
+    store = backend()
+    anon_lines = store.load(f'anon:{anon_id}')
+    store.delete(f'anon:{anon_id}')
+    if not anon_lines:
+        return
+    merged = {(t, i): q for t, i, q in store.load(f'user:{user_id}') or []}
+    for t, i, q in anon_lines:
+        merged[(t, i)] = max(merged.get((t, i), 0), q)
+    store.save(f'user:{user_id}', [[t, i, q] for (t, i), q in merged.items()])
+    g.pop('cart_lines', None)
+
+
+def _migrate_cookie_cart():
+    """Convert a cart left in the cookie by an older version of the app"""
+    if 'cart' not in session:
+        return
+    old_cart = session.pop('cart')
+    if old_cart:
+        lines = [CartLine(item.get('type', 'book'), item['id'], item.get('quantity', 1))
+                 for item in old_cart if isinstance(item, dict) and 'id' in item]
+        cart_id = current_cart_id(create=True)
+        backend().save(cart_id, [list(line) for line in lines])
+
+
+# --- Display data ---
+
+def items():
+    """Hydrate the current cart into the item dicts the cart and checkout pages render.
+
+    Items that no longer exist (deleted books, removed bundles) are dropped.
+    """
+    lines = get_lines()
+    summaries = {}
+    for item_type in ITEM_TYPES:
+        ids = [line.id for line in lines if line.type == item_type]
+        summaries[item_type] = _summaries(item_type, ids) if ids else {}
+
+    cart_items = []
+    for line in lines:
+        summary = summaries[line.type].get(line.id)
+        if summary:
+            cart_items.append(dict(summary, quantity=line.quantity))
+    return cart_items
+
+
+def _summaries(item_type, ids):
+    """Return {id: summary} from the shared cache, loading misses in one query"""
+    version = cache.get_version(SUMMARY_CACHE)
+    found = {}
+    for item_id in set(ids):
+        summary = cache.get(SUMMARY_CACHE, f'{item_type}:{item_id}')
+        if summary is not None:
+            found[item_id] = summary
+
+    missing = [item_id for item_id in set(ids) if item_id not in found]
+    if missing:
+        loaded = _LOADERS[item_type](missing)
+        for item_id in missing:
+            # False caches "does not exist" so deleted items are not reloaded
+            summary = loaded.get(item_id, False)
+            cache.put(SUMMARY_CACHE, f'{item_type}:{item_id}', summary, version=version)
+            found[item_id] = summary
+    return {item_id: summary for item_id, summary in found.items() if summary}
+
+
+def _first_image(book):
+    images = sorted(book.images, key=lambda image: image.id)
+    return images[0].image_filename if images else None
+
+
+def _book_summary(book):
+    return {
+        'id': book.id,
+        'type': 'book',
+        'title': book.title,
+        'author': book.author,
+        'price': book.price,
+        'image': _first_image(book),
+        'category': book.categories[0].name if book.categories else None,
+        'subject': book.subcategories[0].name if book.subcategories else None,
+    }
+
+
+def _load_books(ids):
+    books = Book.query.options(*catalog.catalog_options())\
+        .filter(Book.id.in_(ids), Book.is_deleted == False).all()
+    return {book.id: _book_summary(book) for book in books}
+
+
+def _load_bundles(ids):
+    bundles = BundleOffer.query.options(selectinload(BundleOffer.books).selectinload(Book.images))\
+        .filter(BundleOffer.id.in_(ids)).all()
+    return {
+        bundle.id: {
+            'id': bundle.id,
+            'type': 'bundle',
+            'title': bundle.title,
+            'price': bundle.selling_price,
+            'books': [{
+                'id': book.id,
+                'title': book.title,
+                'author': book.author,
+                'price': book.price,
+                'image': _first_image(book),
+            } for book in bundle.books],
+        }
+        for bundle in bundles
+    }
+
+
+def _load_courses(ids):
+    return {
+        course.id: {
+            'id': course.id,
+            'type': 'course',
+            'title': course.title,
+            'price': course.price,
+            'image': course.image,
+        }
+        for course in Course.query.filter(Course.id.in_(ids)).all()
+    }
+
+
+_LOADERS = {'book': _load_books, 'bundle': _load_bundles, 'course': _load_courses}
+
+
+def init_app(app):
+    """Expose the cart size to templates and register the cart CLI command"""
+
+    @app.context_processor
+    def inject_cart_count():
+        return {'cart_count': count}
+
+    @app.cli.command('purge-carts')
+    def purge_carts_command():
+        """Delete carts that have not been touched for 30 days."""
+        store = backend()
+        if not hasattr(store, 'purge_expired'):
+            print("⚠ The configured cart backend does not support purging")
+            return
+        print(f"✓ Purged {store.purge_expired()} expired carts")
@@ -0,0 +1,462 @@
+import base64
+import json
+from collections import namedtuple
+from datetime import datetime
+
+from flask import url_for
+from sqlalchemy import case, exists, func, literal, select, tuple_, union_all
+from sqlalchemy.orm import joinedload, selectinload
+
+import cache
+from models import (db, Book, BookReview, BundleOffer, Category, Order, OrderItem, SubCategory,
+                    book_categories, book_subcategories)
+
+UNCATEGORIZED = 'Uncategorized'
+
+# Number of category sections rendered per /books page
+SECTIONS_PER_PAGE = 6
+# Books shown in each section before "see more"
+SECTION_PREVIEW_SIZE = 8
+# Books returned per "see more" / list view page
+FEED_PAGE_SIZE = 12
+# Reviews per page on the book detail page
+REVIEWS_PAGE_SIZE = 10
+
+# Price histogram buckets as [low, high) ranges; None means unbounded
+PRICE_BUCKETS = [(0, 200), (200, 500), (500, 1000), (1000, None)]
+
+FACETS_CACHE = 'facets'
+cache.invalidate_on(FACETS_CACHE, Book, Category, SubCategory)
+
+
+# Read-only view of a book for listing pages and JSON responses. Built from
+# rows whose relationships were loaded up front, so templates never trigger
+# lazy loads.
+BookCard = namedtuple('BookCard', [
+    'id', 'title', 'author', 'description', 'price', 'original_price',
+    'quantity', 'avg_rating', 'review_count',
+    'image',          # first image filename or None
+    'images',         # all image filenames
+    'categories',     # category names
+    'subcategories',  # subcategory names
+])
+
+
+def catalog_options():
+    """Loader options that fetch listing relationships in one query each"""
+    return (
+        selectinload(Book.images),
+        selectinload(Book.categories),
+        selectinload(Book.subcategories),
+    )
+
+
+def to_card(book):
+    """Build a BookCard from a Book whose relationships are already loaded"""
+    images = tuple(i.image_filename for i in sorted(book.images, key=lambda i: i.id))
+    return BookCard(
+        id=book.id,
+        title=book.title,
+        author=book.author,
+        description=book.description,
+        price=book.price,
+        original_price=book.original_price,
+        quantity=book.quantity,
+        avg_rating=book.avg_rating or 0,
+        review_count=book.review_count or 0,
+        image=images[0] if images else None,
+        images=images,
+        categories=tuple(c.name for c in book.categories),
+        subcategories=tuple(s.name for s in book.subcategories),
+    )
+
+
+def book_cards(query):
+    """Run a Book query with listing relationships eager-loaded, returning BookCards"""
+    return [to_card(book) for book in query.options(*catalog_options()).all()]
+
+
+def load_book_cards(book_ids):
+    """Fetch BookCards by id, preserving the order of book_ids"""
+    if not book_ids:
+        return []
+    cards = {card.id: card for card in book_cards(Book.query.filter(Book.id.in_(book_ids)))}
+    return [cards[i] for i in book_ids if i in cards]
+
+
+def encode_cursor(values):
+    """Encode a keyset position as an opaque URL-safe token"""
+    raw = json.dumps(values, separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii')
+
+
+# Value types of each listing's cursor
+SECTION_CURSOR = (int, str)     # (uncategorized, section name)
+BOOK_CURSOR = (str, int)        # (title, book id)
+REVIEW_CURSOR = (str, int)      # (created_at ISO timestamp, review id)
+
+
+def decode_cursor(token, types):
+    """Decode a cursor produced by encode_cursor whose values have the given types.
+
+    Returns None without a token; raises ValueError for a malformed one.
+    """
+    if not token:
+        return None
+    try:
+        values = json.loads(base64.urlsafe_b64decode(token.encode('ascii')))
+    except (ValueError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(values, list) or len(values) != len(types) \
+            or any(type(value) is not type_ for value, type_ in zip(values, types)):
+        raise ValueError('Invalid cursor')
+    return values
+
+
+def decode_review_cursor(token):
+    """decode_cursor for review_page, with the timestamp parsed"""
+    after = decode_cursor(token, REVIEW_CURSOR)
+    return after and [datetime.fromisoformat(after[0]), after[1]]
+
+
+def parse_filters(args):
+    """Read the /books filter parameters from request args"""
+    def text(name):
+        return (args.get(name) or '').strip() or None
+
+    return {
+        'title': text('title'),
+        'author': text('author'),
+        'category': text('category'),
+        'subject': text('subject'),   # subject = subcategory filter
+        'min_price': args.get('min_price', type=float),
+        'max_price': args.get('max_price', type=float),
+    }
+
+
+def filtered_books(filters):
+    """Select non-deleted books matching the listing filters"""
+    stmt = select(Book.id, Book.title).where(Book.is_deleted == False)
+
+    if filters.get('title'):
+        stmt = stmt.where(Book.title.ilike(f"%{filters['title']}%"))
+    if filters.get('author'):
+        stmt = stmt.where(Book.author.ilike(f"%{filters['author']}%"))
+    if filters.get('category'):
+        stmt = stmt.where(Book.categories.any(Category.name.ilike(f"%{filters['category']}%")))
+    if filters.get('subject'):
+        stmt = stmt.where(Book.subcategories.any(SubCategory.name.ilike(f"%{filters['subject']}%")))
+    if filters.get('min_price') is not None:
+        stmt = stmt.where(Book.price >= filters['min_price'])
+    if filters.get('max_price') is not None:
+        stmt = stmt.where(Book.price <= filters['max_price'])
+
+    return stmt
+
+
+def filter_key(filters):
+    """Normalize a filter dict into a stable cache key"""
+    normalized = {
+        name: value.strip().lower() if isinstance(value, str) else value
+        for name, value in filters.items()
+        if value is not None and value != ''
+    }
+    return json.dumps(normalized, sort_keys=True)
+
+
+def _price_bucket_label(low, high):
+    if high is None:
+        return f'₹{low}+'
+    if not low:
+        return f'Under ₹{high}'
+    return f'₹{low} – ₹{high}'
+
+
+def _facet_rows(filters):
+    """Count categories, subcategories and price buckets in one grouped query.
+
+    Each facet ignores its own filter, so picking a category still lists the
+    other categories the rest of the filters would match.
+    """
+    category_books = filtered_books({**filters, 'category': None}).subquery()
+    subject_books = filtered_books({**filters, 'subject': None}).subquery()
+    price_books = filtered_books({**filters, 'min_price': None, 'max_price': None})\
+        .add_columns(Book.price).subquery()
+
+    bucket = case(
+        *[(price_books.c.price < high, index) for index, (low, high) in enumerate(PRICE_BUCKETS) if high is not None],
+        else_=len(PRICE_BUCKETS) - 1
+    )
+
+    stmt = union_all(
+        select(literal('category').label('facet'), Category.name.label('value'),
+               func.count(func.distinct(category_books.c.id)).label('count'))
+        .select_from(category_books)
+        .join(book_categories, book_categories.c.book_id == category_books.c.id)
+        .join(Category, Category.id == book_categories.c.category_id)
+        .group_by(Category.name),
+        select(literal('subcategory'), SubCategory.name, func.count(func.distinct(subject_books.c.id)))
+        .select_from(subject_books)
+        .join(book_subcategories, book_subcategories.c.book_id == subject_books.c.id)
+        .join(SubCategory, SubCategory.id == book_subcategories.c.subcategory_id)
+        .group_by(SubCategory.name),
+        select(literal('price'), bucket, func.count())
+        .select_from(price_books)
+        .group_by(bucket),
+    )
+    return db.session.execute(stmt).all()
+
+
+def facet_counts(filters):
+    """Return category, subcategory and price-bucket counts for the current filters.
+
+    Cached per normalized filter set until the catalog changes.
+    """
+    return cache.get_or_set(FACETS_CACHE, filter_key(filters), lambda: _build_facets(filters))
+
+
+def _build_facets(filters):
+    categories, subcategories, price_counts = {}, {}, {}
+    for facet, value, count in _facet_rows(filters):
+        if facet == 'category':
+            categories[value] = count
+        elif facet == 'subcategory':
+            subcategories[value] = count
+        else:
+            price_counts[int(value)] = count
+
+    return {
+        'categories': [{'name': name, 'count': categories[name]} for name in sorted(categories)],
+        'subcategories': [{'name': name, 'count': subcategories[name]} for name in sorted(subcategories)],
+        'price_buckets': [
+            {
+                'label': _price_bucket_label(low, high),
+                'min_price': low,
+                # Price filters are inclusive, so stop just below the next bucket
+                'max_price': round(high - 0.01, 2) if high is not None else None,
+                'count': price_counts[index],
+            }
+            for index, (low, high) in enumerate(PRICE_BUCKETS) if price_counts.get(index)
+        ],
+    }
+
+
+def _section_rows(filters):
+    """One row per (book, category) pair; books without categories fall into Uncategorized"""
+    books = filtered_books(filters).subquery()
+    return (
+        select(
+            books.c.id.label('book_id'),
+            books.c.title.label('title'),
+            # Sort key that keeps 'Uncategorized' after every real category
+            case((Category.id.is_(None), 1), else_=0).label('uncategorized'),
+            func.coalesce(Category.name, UNCATEGORIZED).label('section'),
+        )
+        .select_from(books)
+        .outerjoin(book_categories, book_categories.c.book_id == books.c.id)
+        .outerjoin(Category, Category.id == book_categories.c.category_id)
+        .subquery()
+    )
+
+
+def category_sections(filters, after=None, limit=SECTIONS_PER_PAGE, preview=SECTION_PREVIEW_SIZE):
+    """Return one page of category sections, each holding its top `preview` books.
+
+    Sections are ordered by (category, title, id) and paged by seeking past the
+    last category of the previous page, so every page costs the same number of
+    queries regardless of catalog size.
+    """
+    rows = _section_rows(filters)
+
+    # 1. Page of section names with their book counts
+    sections_stmt = (
+        select(rows.c.uncategorized, rows.c.section, func.count().label('total'))
+        .group_by(rows.c.uncategorized, rows.c.section)
+        .order_by(rows.c.uncategorized, rows.c.section)
+        .limit(limit + 1)
+    )
+    if after:
+        sections_stmt = sections_stmt.having(
+            tuple_(rows.c.uncategorized, rows.c.section) > tuple_(after[0], after[1])
+        )
+    section_rows = db.session.execute(sections_stmt).all()
+
+    has_next = len(section_rows) > limit
+    section_rows = section_rows[:limit]
+    if not section_rows:
+        return {'sections': [], 'next_cursor': None}
+
+    # 2. Top-N books of every section on this page in a single windowed query
+    ranked = (
+        select(
+            rows.c.book_id,
+            rows.c.title,
+            rows.c.uncategorized,
+            rows.c.section,
+            func.row_number().over(
+                partition_by=(rows.c.uncategorized, rows.c.section),
+                order_by=(rows.c.title, rows.c.book_id)
+            ).label('rn'),
+        )
+        .where(tuple_(rows.c.uncategorized, rows.c.section).in_(
+            [(r.uncategorized, r.section) for r in section_rows]
+        ))
+        .subquery()
+    )
+    preview_rows = db.session.execute(
+        select(ranked.c.book_id, ranked.c.title, ranked.c.uncategorized, ranked.c.section)
+        .where(ranked.c.rn <= preview)
+        .order_by(ranked.c.uncategorized, ranked.c.section, ranked.c.rn)
+    ).all()
+
+    books = {b.id: b for b in load_book_cards(list({r.book_id for r in preview_rows}))}
+
+    sections = []
+    for section_row in section_rows:
+        section_books = [
+            r for r in preview_rows
+            if r.uncategorized == section_row.uncategorized and r.section == section_row.section
+        ]
+        last = section_books[-1] if section_books else None
+        sections.append({
+            'name': section_row.section,
+            'total': section_row.total,
+            'books': [books[r.book_id] for r in section_books if r.book_id in books],
+            'more_cursor': encode_cursor([last.title, last.book_id])
+                if last and section_row.total > len(section_books) else None,
+        })
+
+    last_section = section_rows[-1]
+    next_cursor = encode_cursor([last_section.uncategorized, last_section.section]) if has_next else None
+    return {'sections': sections, 'next_cursor': next_cursor}
+
+
+def section_feed(filters, section, after=None, limit=FEED_PAGE_SIZE):
+    """Return the next keyset page of books inside one category section"""
+    books = filtered_books(filters).subquery()
+    stmt = select(Book.id, Book.title).join(books, books.c.id == Book.id)
+
+    if section == UNCATEGORIZED:
+        stmt = stmt.where(~Book.categories.any())
+    else:
+        stmt = stmt.where(Book.categories.any(Category.name == section))
+
+    return _keyset_page(stmt, after, limit)
+
+
+def book_list_page(filters, after=None, limit=FEED_PAGE_SIZE):
+    """Return one keyset page of the flat (list view) catalog"""
+    books = filtered_books(filters).subquery()
+    stmt = select(books.c.id, books.c.title)
+    return _keyset_page(stmt, after, limit)
+
+
+def _keyset_page(stmt, after, limit):
+    """Seek past (title, id) and fetch `limit` books ordered by title"""
+    columns = stmt.selected_columns
+    id_col, title_col = columns[0], columns[1]
+
+    if after:
+        stmt = stmt.where(tuple_(title_col, id_col) > tuple_(after[0], after[1]))
+    rows = db.session.execute(stmt.order_by(title_col, id_col).limit(limit + 1)).all()
+
+    has_next = len(rows) > limit
+    rows = rows[:limit]
+    next_cursor = encode_cursor([rows[-1][1], rows[-1][0]]) if has_next else None
+    return {'books': load_book_cards([r[0] for r in rows]), 'next_cursor': next_cursor}
+
+
+def book_card_json(book):
+    """Serialize a BookCard for the lazily loaded catalog sections"""
+    return {
+        'id': book.id,
+        'title': book.title,
+        'author': book.author,
+        'description': book.description or '',
+        'price': book.price,
+        'original_price': book.original_price,
+        'quantity': book.quantity,
+        'avg_rating': book.avg_rating,
+        'review_count': book.review_count,
+        'image_url': url_for('static', filename='uploads/books/' + book.image) if book.image else None,
+        'detail_url': url_for('book_detail', book_id=book.id),
+        'buy_url': url_for('buy_now', book_id=book.id),
+        'cart_url': url_for('add_to_cart', book_id=book.id),
+    }
+
+
+def load_book_page(book_id):
+    """Load everything book_detail renders in a fixed number of queries.
+
+    Returns None if the book does not exist, otherwise a dict with the book
+    (images and categories loaded), the first page of its reviews with their
+    authors, and the active bundles containing it (member books and their
+    images loaded).
+    """
+    book = db.session.get(Book, book_id, options=catalog_options())
+    if not book:
+        return None
+
+    reviews = review_page(book_id)
+
+    bundles = BundleOffer.query.options(selectinload(BundleOffer.books).selectinload(Book.images))\
+        .filter(BundleOffer.is_active == True, BundleOffer.books.any(id=book_id)).all()
+
+    return {'book': book, 'reviews': reviews['reviews'], 'reviews_cursor': reviews['next_cursor'],
+            'bundles': bundles}
+
+
+def review_page(book_id, after=None, limit=REVIEWS_PAGE_SIZE):
+    """Return one newest-first keyset page of a book's reviews, seeking past (created_at, id)"""
+    query = BookReview.query.options(joinedload(BookReview.user)).filter(BookReview.book_id == book_id)
+
+    if after:
+        query = query.filter(tuple_(BookReview.created_at, BookReview.id) < tuple_(after[0], after[1]))
+
+    # Walks idx_book_reviews_book_created backwards: no sort however many reviews a book has
+    reviews = query.order_by(BookReview.created_at.desc(), BookReview.id.desc()).limit(limit + 1).all()
+
+    has_next = len(reviews) > limit
+    reviews = reviews[:limit]
+    next_cursor = encode_cursor([reviews[-1].created_at.isoformat(), reviews[-1].id]) if has_next else None
+    return {'reviews': reviews, 'next_cursor': next_cursor}
+
+
+def review_json(review):
+    """Serialize a BookReview for the "load more reviews" endpoint"""
+    return {
+        'id': review.id,
+        'author': review.user.email.split('@')[0] if review.user else 'Anonymous',
+        'rating': review.rating,
+        'review_text': review.review_text or '',
+        'created_at': review.created_at.strftime('%B %d, %Y') if review.created_at else '',
+    }
+
+
+def user_books_cache(user_id):
+    """Cache namespace holding one user's purchase/review flags"""
+    return f'user-books:{user_id}'
+
+
+# A user's flags are dropped whenever their orders or reviews change
+cache.invalidate_on(lambda obj: user_books_cache(obj.user_id), Order, BookReview)
+
+
+def user_book_flags(user_id, book_id):
+    """Return {'purchased', 'review_id'} for a user and book, cached per (user, book)"""
+    return cache.get_or_set(user_books_cache(user_id), str(book_id),
+                            lambda: _load_user_book_flags(user_id, book_id))
+
+
+def _load_user_book_flags(user_id, book_id):
+    purchased = exists().where(
+        OrderItem.order_id == Order.id,
+        Order.user_id == user_id,
+        OrderItem.book_id == book_id,
+        Order.status == 'completed'
+    )
+    review_id = select(BookReview.id)\
+        .where(BookReview.user_id == user_id, BookReview.book_id == book_id)\
+        .limit(1).scalar_subquery()
+    row = db.session.execute(select(purchased.label('purchased'), review_id.label('review_id'))).one()
+    return {'purchased': bool(row.purchased), 'review_id': row.review_id}
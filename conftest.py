@@ -0,0 +1,38 @@
+"""
+Shared pytest setup: run the test scripts against a throwaway SQLite database
+instead of the development database, cache and cart store in instance/
+"""
+
+import os
+import tempfile
+
+import pytest
+
+_test_db_dir = tempfile.mkdtemp(prefix='easy2learning-test-')
+os.environ.setdefault('DATABASE_URL', 'sqlite:///' + os.path.join(_test_db_dir, 'test.db'))
+os.environ.setdefault('CACHE_PATH', os.path.join(_test_db_dir, 'cache.db'))
+os.environ.setdefault('CART_STORE_PATH', os.path.join(_test_db_dir, 'carts.db'))
+os.environ.setdefault('METRICS_PATH', os.path.join(_test_db_dir, 'metrics.db'))
+os.environ.setdefault('SLOW_QUERY_PATH', os.path.join(_test_db_dir, 'slow_queries.db'))
+os.environ.setdefault('SUGGEST_CHANGES_PATH', os.path.join(_test_db_dir, 'suggest_index.changes'))
+# Tests that send mail point MAIL_* at a local SMTP sink
+os.environ.setdefault('MAIL_ENABLED', '0')
+
+
+@pytest.fixture(autouse=True, scope='session')
+def create_test_schema():
+    from app import app
+    from models import db
+
+    with app.app_context():
+        db.create_all()
+    yield
+
+
+@pytest.fixture(autouse=True)
+def run_background_refreshes_inline():
+    """Run BatchRunner jobs inline so they cannot race the query counters"""
+    from app import app
+
+    app.config['BACKGROUND_REFRESH_ASYNC'] = False
+    yield
@@ -0,0 +1,78 @@
+import threading
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from models import db
+
+# Connection settings for the application database. It is SQLite, written by
+# every gunicorn worker and by `flask run-jobs`:
+#
+# - WAL journal: readers never wait for a writer, and a writer never waits
+#   for readers.
+# - busy_timeout: a writer waits its turn instead of failing at once with
+#   "database is locked".
+# - Transactions stay pysqlite's default: reads run outside a transaction and
+#   BEGIN is issued just before the first INSERT/UPDATE/DELETE, which waits
+#   for the lock like any writer. A transaction that read first could not: in
+#   WAL mode it fails at once with SQLITE_BUSY if another writer committed
+#   after its read, as SQLite will not upgrade a stale snapshot.
+# - Paths whose reads must stay valid until they write (the checkout, job
+#   handlers, bulk refreshes) start with begin_immediate() or begin_write()
+#   instead, which take the write lock with BEGIN IMMEDIATE up front.
+
+BUSY_TIMEOUT_MS = 15_000
+
+_local = threading.local()
+
+
+def _configure_connection(dbapi_conn, connection_record):
+    dbapi_conn.execute(f'PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}')
+    dbapi_conn.execute('PRAGMA journal_mode = WAL')
+
+
+def _begin(conn):
+    # On the driver connection, like pysqlite's own BEGIN: not a statement to
+    # the query counters and slow-query log. pysqlite then sees the open
+    # transaction and issues no BEGIN of its own.
+    if _local.__dict__.pop('immediate', False):
+        driver_conn = conn.connection.driver_connection
+        if not driver_conn.in_transaction:
+            driver_conn.execute('BEGIN IMMEDIATE')
+
+
+@contextmanager
+def immediate():
+    """The first transaction begun in this thread inside the block takes the write lock at BEGIN"""
+    _local.immediate = True
+    try:
+        yield
+    finally:
+        _local.__dict__.pop('immediate', None)
+
+
+def begin_immediate():
+    """End the session's transaction and start one that holds the write lock.
+
+    Pending changes are committed first; loaded objects are expired.
+    """
+    db.session.commit()
+    with immediate():
+        db.session.connection()
+
+
+@contextmanager
+def begin_write():
+    """db.engine.begin() for a transaction that reads before it writes"""
+    with immediate(), db.engine.begin() as conn:
+        yield conn
+
+
+def init_app(app):
+    """Apply the SQLite connection settings to app's database engine"""
+    with app.app_context():
+        engine = db.engine
+    if engine.dialect.name != 'sqlite':
+        return
+    event.listen(engine, 'connect', _configure_connection)
+    event.listen(engine, 'begin', _begin)
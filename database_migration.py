@@ -1,5 +1,10 @@
 from app import app, db
-from models import Customer, BundleOffer, User, Certificate, FullOrderDetail
+from models import Customer, BookReview, BundleOffer, User, Certificate, FullOrderDetail
+import search_index
+import related
+import recommendations
+import bundles
+import ratings
 import sqlalchemy as sa
 from sqlalchemy import inspect, text
 from datetime import datetime, timezone
@@ -358,6 +363,204 @@ def rebuild_full_order_details_with_foreign_keys():
     except Exception as e:
         print(f"    ⚠ Error rebuilding full_order_details table: {e}")
 
+def build_search_index():
+    """Create and populate the FTS5 full-text search index for books"""
+    try:
+        count = search_index.rebuild_search_index()
+        print(f"✓ Built books_fts search index with {count} books")
+    except Exception as e:
+        print(f"⚠ Error building search index: {e}")
+
+def build_related_books():
+    """Create and fill the precomputed related_books table"""
+    try:
+        related_books_sql = """
+        CREATE TABLE IF NOT EXISTS related_books (
+            book_id INTEGER NOT NULL,
+            related_id INTEGER NOT NULL,
+            score FLOAT NOT NULL DEFAULT 0.0,
+            PRIMARY KEY (book_id, related_id),
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (related_id) REFERENCES books (id)
+        )
+        """
+        create_table_if_not_exists('related_books', related_books_sql)
+        with db.engine.connect() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS idx_related_books_book_score ON related_books (book_id, score)'))
+            conn.commit()
+        count = related.rebuild_related_books()
+        print(f"✓ Stored {count} related book pairs")
+    except Exception as e:
+        print(f"⚠ Error building related books: {e}")
+
+def build_recommendations():
+    """Create and fill the "customers also bought" table"""
+    try:
+        book_recommendations_sql = """
+        CREATE TABLE IF NOT EXISTS book_recommendations (
+            book_id INTEGER NOT NULL,
+            recommended_id INTEGER NOT NULL,
+            co_purchases INTEGER NOT NULL DEFAULT 0,
+            rank INTEGER NOT NULL DEFAULT 0,
+            PRIMARY KEY (book_id, recommended_id),
+            FOREIGN KEY (book_id) REFERENCES books (id),
+            FOREIGN KEY (recommended_id) REFERENCES books (id)
+        )
+        """
+        create_table_if_not_exists('book_recommendations', book_recommendations_sql)
+        with db.engine.connect() as conn:
+            conn.execute(text('CREATE INDEX IF NOT EXISTS idx_book_recommendations_book_rank ON book_recommendations (book_id, rank)'))
+            conn.commit()
+        count = recommendations.rebuild_recommendations()
+        print(f"✓ Stored {count} book recommendations")
+    except Exception as e:
+        print(f"⚠ Error building recommendations: {e}")
+
+def backfill_rating_histogram():
+    """Fill avg_rating, review_count and the 1-5 star counts from book_reviews in one pass"""
+    try:
+        drift = ratings.reconcile_ratings()
+        print(f"✓ Stored rating histograms for {len(drift)} books")
+    except Exception as e:
+        print(f"⚠ Error backfilling rating histograms: {e}")
+
+def build_payments_ledger():
+    """Create the payments ledger and record every past transaction's payment id once"""
+    try:
+        payments_sql = """
+        CREATE TABLE IF NOT EXISTS payments (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            payment_id VARCHAR(100) NOT NULL UNIQUE,
+            user_id INTEGER NOT NULL,
+            order_id INTEGER,
+            custom_order_id VARCHAR(30),
+            amount FLOAT NOT NULL,
+            created_at DATETIME DEFAULT CURRENT_TIMESTAMP,
+            FOREIGN KEY (user_id) REFERENCES users (id),
+            FOREIGN KEY (order_id) REFERENCES orders (id)
+        )
+        """
+        create_table_if_not_exists('payments', payments_sql)
+        # Duplicate orders from before the ledger keep their rows; the first one owns the payment
+        with db.engine.begin() as conn:
+            count = conn.execute(text("""
+                INSERT OR IGNORE INTO payments (payment_id, user_id, order_id, custom_order_id, amount, created_at)
+                SELECT t.payment_id, t.user_id, t.order_id,
+                       (SELECT custom_order_id FROM full_order_details WHERE order_id = t.order_id LIMIT 1),
+                       t.amount, t.date_created
+                FROM transactions t
+                WHERE t.payment_id IS NOT NULL AND t.payment_id != 'N/A'
+                ORDER BY t.id
+            """)).rowcount
+        print(f"✓ Recorded {count} past payments in the ledger")
+    except Exception as e:
+        print(f"⚠ Error building payments ledger: {e}")
+
+def create_job_tables():
+    """Create the background job queue and its dead-letter table"""
+    job_queue_sql = """
+    CREATE TABLE IF NOT EXISTS job_queue (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        task VARCHAR(100) NOT NULL,
+        payload TEXT NOT NULL DEFAULT '{}',
+        attempts INTEGER NOT NULL DEFAULT 0,
+        max_attempts INTEGER NOT NULL DEFAULT 5,
+        run_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+        locked_until DATETIME,
+        last_error TEXT,
+        created_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    create_table_if_not_exists('job_queue', job_queue_sql)
+    create_index_if_not_exists('idx_job_queue_run_at', 'job_queue', 'run_at, id')
+
+    dead_letter_jobs_sql = """
+    CREATE TABLE IF NOT EXISTS dead_letter_jobs (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        job_id INTEGER NOT NULL,
+        task VARCHAR(100) NOT NULL,
+        payload TEXT NOT NULL,
+        attempts INTEGER NOT NULL,
+        last_error TEXT,
+        created_at DATETIME,
+        failed_at DATETIME DEFAULT CURRENT_TIMESTAMP
+    )
+    """
+    create_table_if_not_exists('dead_letter_jobs', dead_letter_jobs_sql)
+
+def require_review_timestamps():
+    """Backfill missing book_reviews.created_at and make the column NOT NULL (SQLite rebuild)"""
+    try:
+        inspector = inspect(db.engine)
+        if 'book_reviews' not in inspector.get_table_names():
+            print("- book_reviews table doesn't exist yet")
+            return
+        columns = {col['name']: col for col in inspector.get_columns('book_reviews')}
+        if not columns['created_at']['nullable']:
+            print("- book_reviews.created_at is already NOT NULL")
+            return
+
+        with db.engine.begin() as conn:
+            # A review can only follow the purchase: date it at the reviewer's first order of the book
+            count = conn.execute(text("""
+                UPDATE book_reviews SET created_at = COALESCE(
+                    (SELECT MIN(o.date_created) FROM orders o
+                     JOIN order_items i ON i.order_id = o.id
+                     WHERE o.user_id = book_reviews.user_id AND i.book_id = book_reviews.book_id),
+                    CURRENT_TIMESTAMP)
+                WHERE created_at IS NULL
+            """)).rowcount
+            print(f"    Backfilled created_at on {count} reviews")
+
+            print("    Rebuilding book_reviews table to make created_at NOT NULL...")
+            conn.execute(text("""
+                CREATE TABLE book_reviews_temp (
+                    id INTEGER PRIMARY KEY AUTOINCREMENT,
+                    book_id INTEGER NOT NULL,
+                    user_id INTEGER NOT NULL,
+                    rating INTEGER NOT NULL,
+                    review_text TEXT,
+                    created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                    FOREIGN KEY (book_id) REFERENCES books (id),
+                    FOREIGN KEY (user_id) REFERENCES users (id)
+                )
+            """))
+            conn.execute(text("""
+                INSERT INTO book_reviews_temp (id, book_id, user_id, rating, review_text, created_at)
+                SELECT id, book_id, user_id, rating, review_text, created_at
+                FROM book_reviews
+            """))
+            conn.execute(text("DROP TABLE book_reviews"))
+            conn.execute(text("ALTER TABLE book_reviews_temp RENAME TO book_reviews"))
+            # Dropping the table dropped its indexes
+            for index in BookReview.__table__.indexes:
+                index.create(conn)
+
+        print("    ✓ Successfully rebuilt book_reviews table with required created_at")
+
+    except Exception as e:
+        print(f"    ⚠ Error rebuilding book_reviews table: {e}")
+
+def create_model_indexes():
+    """Create every index declared in models.py (hot-path and partial indexes) that is missing"""
+    tables = set(inspect(db.engine).get_table_names())
+    for table in db.metadata.sorted_tables:
+        if table.name not in tables:
+            continue
+        for index in sorted(table.indexes, key=lambda index: index.name):
+            try:
+                index.create(db.engine, checkfirst=True)
+                print(f"✓ Index {index.name} on {table.name} is in place")
+            except Exception as e:
+                print(f"⚠ Error creating index {index.name}: {e}")
+    try:
+        # Refresh planner statistics so the new indexes are picked up
+        with db.engine.begin() as conn:
+            conn.execute(text('ANALYZE'))
+        print("✓ Updated query planner statistics")
+    except Exception as e:
+        print(f"⚠ Error running ANALYZE: {e}")
+
 def check_for_schema_drift():
     """Check for schema drift if db.create_all() was run before migration"""
     print("0. Checking for potential schema drift:")
@@ -394,9 +597,11 @@ def check_for_schema_drift():
             expected_columns = ['id', 'title', 'description', 'mrp', 'selling_price',
                               'discount_type', 'discount_value', 'is_active',
                               'created_at', 'updated_at']
+            # Stored savings columns are added by step 10
+            optional_columns = ['total_mrp', 'savings_amount', 'savings_percentage', 'book_count']
             
             missing_columns = set(expected_columns) - set(column_names)
-            extra_columns = set(column_names) - set(expected_columns)
+            extra_columns = set(column_names) - set(expected_columns) - set(optional_columns)
             
             if missing_columns or extra_columns:
                 print(f"    ⚠ bundle_offers table schema mismatch detected!")
@@ -533,6 +738,53 @@ def run_migration():
         except Exception as e:
             print(f"⚠ Error setting default values: {e}")
         
+        # Step 7: Full-text search index
+        print("\n7. Building full-text search index:")
+        build_search_index()
+        
+        # Step 8: Precomputed related books
+        print("\n8. Building related books:")
+        build_related_books()
+        
+        # Step 9: Customers-also-bought recommendations
+        print("\n9. Building book recommendations:")
+        build_recommendations()
+        
+        # Step 10: Stored bundle savings
+        print("\n10. Storing bundle savings:")
+        add_column_if_not_exists('bundle_offers', 'total_mrp', 'FLOAT NOT NULL DEFAULT 0.0')
+        add_column_if_not_exists('bundle_offers', 'savings_amount', 'FLOAT NOT NULL DEFAULT 0.0')
+        add_column_if_not_exists('bundle_offers', 'savings_percentage', 'FLOAT NOT NULL DEFAULT 0.0')
+        add_column_if_not_exists('bundle_offers', 'book_count', 'INTEGER NOT NULL DEFAULT 0')
+        try:
+            with db.engine.begin() as conn:
+                count = bundles.recompute_bundle_savings(conn)
+            print(f"✓ Recomputed savings for {count} bundle offers")
+        except Exception as e:
+            print(f"⚠ Error recomputing bundle savings: {e}")
+        
+        # Step 11: Rating histogram
+        print("\n11. Storing rating histograms:")
+        for stars in range(1, 6):
+            add_column_if_not_exists('books', f'rating_count_{stars}', 'INTEGER NOT NULL DEFAULT 0')
+        backfill_rating_histogram()
+        
+        # Step 12: Hot-path indexes declared in models.py
+        print("\n12. Creating hot-path indexes:")
+        create_model_indexes()
+        
+        # Step 13: Payments ledger for idempotent payment_success
+        print("\n13. Building payments ledger:")
+        build_payments_ledger()
+        
+        # Step 14: Background job queue (run the worker with `flask run-jobs`)
+        print("\n14. Creating background job tables:")
+        create_job_tables()
+        
+        # Step 15: Required review timestamps (review pages are keyset-paged on them)
+        print("\n15. Requiring review timestamps:")
+        require_review_timestamps()
+        
         print("\n" + "=" * 50)
         print("✓ Database migration completed successfully!")
         print("\nNext steps:")
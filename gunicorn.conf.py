@@ -0,0 +1,13 @@
+# Gunicorn settings: gunicorn -c gunicorn.conf.py app:app
+# Order follow-up work (order details, recommendations) is done by a separate
+# job worker: flask --app app run-jobs
+# Workers share their metrics through instance/metrics.db; Prometheus scrapes
+# any one of them at /metrics for the whole server's numbers
+
+def post_worker_init(worker):
+    """Warm the in-memory autocomplete index before the worker takes requests"""
+    from app import app
+    import suggest_index
+
+    with app.app_context():
+        suggest_index.build_index()
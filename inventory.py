@@ -0,0 +1,44 @@
+from sqlalchemy import bindparam
+
+from models import db, Book
+
+# Stock is taken with one conditional UPDATE per book, so the check and the
+# decrement happen under SQLite's write lock and two workers can never both
+# sell the last copy. Callers run it inside the order's transaction and roll
+# back on InsufficientStock, which undoes the lines already taken.
+
+_books = Book.__table__
+
+_DECREMENT = _books.update()\
+    .where(_books.c.id == bindparam('book_id'), _books.c.quantity >= bindparam('quantity'))\
+    .values(quantity=_books.c.quantity - bindparam('quantity'))
+
+
+class InsufficientStock(Exception):
+    """A book did not have enough stock left when the order was placed"""
+
+    def __init__(self, book_id, quantity):
+        super().__init__(f"Book {book_id} has fewer than {quantity} copies in stock")
+        self.book_id = book_id
+        self.quantity = quantity
+
+
+def take_stock(needed):
+    """Decrement {book_id: quantity} in the current transaction, all lines or none.
+
+    Each line is a conditional UPDATE. SQLite has no row locks: the caller's
+    BEGIN IMMEDIATE holds the database-wide write lock, which serializes
+    concurrent orders, so no ordering is needed to avoid deadlocks. Raises
+    InsufficientStock for the first short book in id order.
+    """
+    session = db.session
+    for book_id, quantity in sorted(needed.items()):
+        result = session.execute(_DECREMENT, {'book_id': book_id, 'quantity': quantity})
+        if result.rowcount != 1:
+            raise InsufficientStock(book_id, quantity)
+
+    # The UPDATE bypassed the ORM: reload quantities. Cached pages stay warm, as
+    # none of them shows stock; the book pages and listings that do are not cached.
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Book) and obj.id in needed:
+            session.expire(obj, ['quantity'])
@@ -0,0 +1,135 @@
+import json
+import time
+import traceback
+from datetime import timedelta
+
+import click
+from flask import current_app
+from sqlalchemy import or_, select
+
+import database
+from models import db, DeadLetterJob, QueuedJob, utc_now
+
+# A persistent job queue in the application database, so background work
+# needs no outside service. enqueue() adds the job to the caller's
+# transaction: it exists exactly when the order it belongs to was committed.
+# `flask run-jobs` claims due jobs with a lease (a crashed worker's job runs
+# again once the lease expires), retries failures with exponential backoff
+# and moves jobs that keep failing to dead_letter_jobs.
+
+LEASE = timedelta(minutes=5)
+RETRY_BASE_SECONDS = 10
+RETRY_MAX_SECONDS = 3600
+POLL_INTERVAL = 1.0
+
+_jobs = QueuedJob.__table__
+_tasks = {}
+
+
+def task(name):
+    """Register the decorated function as the handler for jobs called name"""
+    def register(fn):
+        _tasks[name] = fn
+        return fn
+    return register
+
+
+def enqueue(task_name, /, max_attempts=5, **payload):
+    """Queue a job in the current transaction; payload must be JSON-serialisable"""
+    db.session.add(QueuedJob(task=task_name, payload=json.dumps(payload), max_attempts=max_attempts))
+
+
+def claim_next():
+    """Lease the next due job and return its row, or None if nothing is due"""
+    now = utc_now()
+    due = select(_jobs.c.id)\
+        .where(_jobs.c.run_at <= now, or_(_jobs.c.locked_until.is_(None), _jobs.c.locked_until < now))\
+        .order_by(_jobs.c.run_at, _jobs.c.id)\
+        .limit(1).scalar_subquery()
+    # One UPDATE ... RETURNING, so two workers can never claim the same job
+    job = db.session.execute(
+        _jobs.update().where(_jobs.c.id == due)
+        .values(attempts=_jobs.c.attempts + 1, locked_until=now + LEASE)
+        .returning(*_jobs.c)
+    ).first()
+    db.session.commit()
+    return job
+
+
+def run_job(job):
+    """Run a claimed job, returning True on success.
+
+    Writes the handler makes through db.session are committed together with
+    the job's removal, so they happen once even if the worker dies mid-job.
+    """
+    try:
+        # Handlers read before they write: their transaction holds the write lock from the start
+        with database.immediate():
+            _tasks[job.task](**json.loads(job.payload))
+        db.session.execute(_jobs.delete().where(_jobs.c.id == job.id))
+        db.session.commit()
+        return True
+    except Exception as e:
+        db.session.rollback()
+        _record_failure(job, ''.join(traceback.format_exception_only(e)).strip())
+        return False
+
+
+def _record_failure(job, error):
+    if job.attempts >= job.max_attempts:
+        db.session.add(DeadLetterJob(job_id=job.id, task=job.task, payload=job.payload,
+                                     attempts=job.attempts, last_error=error, created_at=job.created_at))
+        db.session.execute(_jobs.delete().where(_jobs.c.id == job.id))
+        current_app.logger.error('Job %s (%s) failed %s times, moved to dead letters: %s',
+                                 job.id, job.task, job.attempts, error)
+    else:
+        delay = min(RETRY_BASE_SECONDS * 2 ** (job.attempts - 1), RETRY_MAX_SECONDS)
+        db.session.execute(
+            _jobs.update().where(_jobs.c.id == job.id)
+            .values(run_at=utc_now() + timedelta(seconds=delay), locked_until=None, last_error=error)
+        )
+        current_app.logger.warning('Job %s (%s) failed, retrying in %ss: %s', job.id, job.task, delay, error)
+    db.session.commit()
+
+
+def work(burst=False, poll_interval=POLL_INTERVAL):
+    """Run jobs as they become due; with burst=True return once none are due.
+
+    Returns the number of jobs run.
+    """
+    count = 0
+    while True:
+        job = claim_next()
+        if job is None:
+            if burst:
+                return count
+            time.sleep(poll_interval)
+            continue
+        run_job(job)
+        count += 1
+
+
+def retry_dead_jobs():
+    """Move every dead-lettered job back into the queue, returning how many"""
+    dead = DeadLetterJob.query.order_by(DeadLetterJob.id).all()
+    for job in dead:
+        db.session.add(QueuedJob(task=job.task, payload=job.payload))
+        db.session.delete(job)
+    db.session.commit()
+    return len(dead)
+
+
+def init_app(app):
+    """Register the job worker CLI commands"""
+
+    @app.cli.command('run-jobs')
+    @click.option('--burst', is_flag=True, help='Exit once no jobs are due.')
+    def run_jobs_command(burst):
+        """Run queued background jobs (run one or more alongside the web workers)."""
+        count = work(burst=burst)
+        print(f"✓ Ran {count} jobs")
+
+    @app.cli.command('retry-dead-jobs')
+    def retry_dead_jobs_command():
+        """Queue jobs from the dead-letter table again."""
+        print(f"✓ Queued {retry_dead_jobs()} dead-lettered jobs")
@@ -0,0 +1,198 @@
+import heapq
+import itertools
+import os
+import queue
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+
+from flask import current_app, render_template
+
+import metrics
+
+# Outgoing email. Requests never talk to the SMTP server: send() hands the
+# message to a per-worker background sender, which delivers queued messages in
+# batches over one reused SMTP connection and retries temporary failures with
+# exponential backoff. deliver() sends synchronously and raises on failure,
+# for the job worker, which has its own retries.
+#
+# Settings come from app.config: MAIL_SERVER, MAIL_PORT, MAIL_USE_TLS,
+# MAIL_USERNAME, MAIL_PASSWORD, MAIL_SENDER and MAIL_ENABLED (when False,
+# messages are logged instead of sent).
+
+BATCH_SIZE = 50
+MAX_ATTEMPTS = 5
+RETRY_BASE_SECONDS = 2.0
+# Close the connection after this long unused, before the server drops it
+MAX_IDLE_SECONDS = 60
+SMTP_TIMEOUT = 30
+
+
+def compose(to, subject, template, **context):
+    """Render templates/emails/<template> into a message for `to`"""
+    message = EmailMessage()
+    message['Subject'] = subject
+    message['From'] = current_app.config['MAIL_SENDER']
+    message['To'] = to
+    message.set_content(render_template(f'emails/{template}', **context), subtype='html')
+    return message
+
+
+# --- SMTP connection reuse ---
+
+class SMTPConnection:
+    """A persistent SMTP connection for one thread, reopened when it goes stale"""
+
+    def __init__(self):
+        self._smtp = None
+        self._settings = None
+        self._last_used = 0.0
+
+    def _open(self, config):
+        smtp = smtplib.SMTP(config['MAIL_SERVER'], config['MAIL_PORT'], timeout=SMTP_TIMEOUT)
+        if config.get('MAIL_USE_TLS'):
+            smtp.starttls()
+        if config.get('MAIL_USERNAME'):
+            smtp.login(config['MAIL_USERNAME'], config['MAIL_PASSWORD'])
+        return smtp
+
+    def send(self, config, message):
+        settings = tuple(config.get(key) for key in ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USERNAME'))
+        if self._smtp is not None and (settings != self._settings or
+                                       time.monotonic() - self._last_used > MAX_IDLE_SECONDS):
+            self.close()
+        # A kept-open connection may have been dropped by the server: reconnect once
+        for reused in (self._smtp is not None, False):
+            if self._smtp is None:
+                self._smtp, self._settings = self._open(config), settings
+            try:
+                self._smtp.send_message(message)
+                self._last_used = time.monotonic()
+                return
+            except smtplib.SMTPServerDisconnected:
+                self.close()
+                if not reused:
+                    raise
+
+    def close(self):
+        if self._smtp is not None:
+            try:
+                self._smtp.quit()
+            except (smtplib.SMTPException, OSError):
+                pass
+        self._smtp = None
+
+
+_local = threading.local()
+
+
+def deliver(message):
+    """Send a message now over this thread's connection; raises on failure"""
+    config = current_app.config
+    if not config.get('MAIL_ENABLED', True):
+        print(f"[TEST MODE] Would send '{message['Subject']}' to {message['To']}")
+        return
+    connection = getattr(_local, 'connection', None)
+    if connection is None:
+        connection = _local.connection = SMTPConnection()
+    try:
+        connection.send(config, message)
+    except smtplib.SMTPResponseException:
+        # The server answered (e.g. 451 try later): the connection is still good
+        raise
+    except OSError:
+        # Timeouts and broken sockets: start the next attempt from a fresh connection
+        connection.close()
+        raise
+
+
+def _is_permanent(error):
+    """5xx replies and refused recipients will fail the same way on every retry"""
+    if isinstance(error, smtplib.SMTPRecipientsRefused):
+        return True
+    return isinstance(error, smtplib.SMTPResponseException) and error.smtp_code >= 500
+
+
+# --- Background sender ---
+
+class Outbox:
+    """Messages waiting for the background sender of this worker process"""
+
+    def __init__(self):
+        self._queue = queue.Queue()
+        self._retries = []  # heap of (due, seq, attempts, message)
+        self._seq = itertools.count()
+        self._pending = 0
+        self._idle = threading.Condition()
+        self._thread = None
+        self._pid = None
+
+    def put(self, app, message):
+        with self._idle:
+            self._pending += 1
+            # Threads do not survive a fork, so each gunicorn worker starts its own
+            if self._thread is None or self._pid != os.getpid() or not self._thread.is_alive():
+                self._thread = threading.Thread(target=self._run, args=(app,), name='mailer', daemon=True)
+                self._pid = os.getpid()
+                self._thread.start()
+        self._queue.put((1, message))
+
+    def flush(self, timeout=None):
+        """Wait until every queued message was sent or given up; False on timeout"""
+        with self._idle:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+
+    def _next_batch(self):
+        timeout = None
+        if self._retries:
+            timeout = max(0.0, self._retries[0][0] - time.monotonic())
+        batch = []
+        try:
+            batch.append(self._queue.get(timeout=timeout))
+            while len(batch) < BATCH_SIZE:
+                batch.append(self._queue.get_nowait())
+        except queue.Empty:
+            pass
+        now = time.monotonic()
+        while self._retries and self._retries[0][0] <= now and len(batch) < BATCH_SIZE:
+            _, _, attempts, message = heapq.heappop(self._retries)
+            batch.append((attempts, message))
+        return batch
+
+    def _run(self, app):
+        while True:
+            batch = self._next_batch()
+            with app.app_context():
+                for attempts, message in batch:
+                    self._send(attempts, message)
+
+    def _send(self, attempts, message):
+        try:
+            deliver(message)
+        except Exception as e:
+            if attempts < MAX_ATTEMPTS and not _is_permanent(e):
+                delay = RETRY_BASE_SECONDS * 2 ** (attempts - 1)
+                heapq.heappush(self._retries, (time.monotonic() + delay, next(self._seq), attempts + 1, message))
+                current_app.logger.warning('Email to %s failed, retrying in %.0fs: %s', message['To'], delay, e)
+                return
+            current_app.logger.error('Giving up on email to %s after %d attempts: %s', message['To'], attempts, e)
+        with self._idle:
+            self._pending -= 1
+            self._idle.notify_all()
+
+
+_outbox = Outbox()
+
+metrics.gauge('email_queue_depth', 'Emails waiting to be sent: in the workers\' outboxes or as queued jobs')
+metrics.gauge_source('email_queue_depth', lambda: _outbox._pending, queue='outbox')
+
+
+def send(message):
+    """Queue a message for the background sender; returns immediately"""
+    _outbox.put(current_app._get_current_object(), message)
+
+
+def flush(timeout=None):
+    """Wait for this worker's queued messages to be delivered (tests, shutdown)"""
+    return _outbox.flush(timeout)
@@ -0,0 +1,260 @@
+import atexit
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import Response, abort, request
+
+# Prometheus metrics for the whole server, not one gunicorn worker.
+#
+# Each worker adds to counters in memory and a background thread flushes the
+# increments every FLUSH_INTERVAL seconds into a SQLite file shared by all
+# workers (METRICS_PATH or instance/metrics.db), so totals also survive
+# restarts. Gauges are stored per worker process and summed over the workers
+# still alive. /metrics serves the totals in the Prometheus text format to
+# the addresses in METRICS_ALLOW (loopback by default).
+
+FLUSH_INTERVAL = 1.0
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS metric_counters (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels)
+);
+CREATE TABLE IF NOT EXISTS metric_gauges (
+    name TEXT NOT NULL,
+    labels TEXT NOT NULL,
+    pid INTEGER NOT NULL,
+    value REAL NOT NULL,
+    PRIMARY KEY (name, labels, pid)
+);
+"""
+
+_registry = {}      # name -> (type, help, buckets)
+_gauge_sources = [] # (name, labels, fn) read by each worker when it flushes
+_collectors = []    # fn() -> [(name, labels, value)] read when /metrics is scraped
+_deltas = {}        # (name, labels) -> increment not yet flushed
+_lock = threading.Lock()
+_local = threading.local()
+_state = {'path': None, 'pid': None, 'thread': None, 'logger': None}
+_LABEL = re.compile(r'(\w+)="((?:[^"\\]|\\.)*)"')
+
+
+def counter(name, help):
+    _registry[name] = ('counter', help, None)
+
+
+def gauge(name, help):
+    _registry[name] = ('gauge', help, None)
+
+
+def histogram(name, help, buckets):
+    _registry[name] = ('histogram', help, tuple(sorted(buckets)))
+
+
+def _labels(labels):
+    """Render labels once, in the form they appear in the exposition format"""
+    def escape(value):
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return ','.join(f'{key}="{escape(value)}"' for key, value in sorted(labels.items()))
+
+
+def _add(name, labels, amount):
+    with _lock:
+        _deltas[(name, labels)] = _deltas.get((name, labels), 0) + amount
+    _ensure_flusher()
+
+
+def inc(name, amount=1, **labels):
+    """Add to a counter"""
+    _add(name, _labels(labels), amount)
+
+
+def observe(name, value, **labels):
+    """Record one value in a histogram"""
+    buckets = _registry[name][2]
+    base = _labels(labels)
+    with _lock:
+        for bound in buckets:
+            if value <= bound:
+                key = (f'{name}_bucket', ','.join(filter(None, [base, f'le="{bound}"'])))
+                _deltas[key] = _deltas.get(key, 0) + 1
+        for key, amount in (((f'{name}_bucket', ','.join(filter(None, [base, 'le="+Inf"']))), 1),
+                            ((f'{name}_count', base), 1),
+                            ((f'{name}_sum', base), value)):
+            _deltas[key] = _deltas.get(key, 0) + amount
+    _ensure_flusher()
+
+
+def gauge_source(name, fn, **labels):
+    """Report fn() for this worker process as the gauge name"""
+    _gauge_sources.append((name, _labels(labels), fn))
+
+
+def collector(fn):
+    """Register fn() -> [(name, labels dict, value)], called at scrape time with an app context"""
+    _collectors.append(fn)
+    return fn
+
+
+# --- Shared store ---
+
+def _connection():
+    path = _state['path']
+    conn = getattr(_local, 'conn', None)
+    # A connection must not cross a fork (gunicorn --preload) or a path change
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), path
+    return conn
+
+
+def flush():
+    """Write this worker's pending increments and gauges to the shared store"""
+    if _state['path'] is None:
+        return
+    with _lock:
+        deltas = list(_deltas.items())
+        _deltas.clear()
+    gauges = []
+    for name, labels, fn in _gauge_sources:
+        try:
+            gauges.append((name, labels, os.getpid(), fn()))
+        except Exception as e:
+            _state['logger'].warning('Could not read gauge %s: %s', name, e)
+
+    conn = _connection()
+    try:
+        conn.execute('BEGIN IMMEDIATE')
+        conn.executemany(
+            'INSERT INTO metric_counters (name, labels, value) VALUES (?, ?, ?) '
+            'ON CONFLICT(name, labels) DO UPDATE SET value = value + excluded.value',
+            [(name, labels, amount) for (name, labels), amount in deltas]
+        )
+        conn.executemany('INSERT OR REPLACE INTO metric_gauges (name, labels, pid, value) VALUES (?, ?, ?, ?)',
+                         gauges)
+        conn.execute('COMMIT')
+    except sqlite3.Error as e:
+        if conn.in_transaction:
+            conn.execute('ROLLBACK')
+        # Keep the increments for the next flush
+        with _lock:
+            for key, amount in deltas:
+                _deltas[key] = _deltas.get(key, 0) + amount
+        _state['logger'].warning('Could not flush metrics: %s', e)
+
+
+def _flush_forever():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        flush()
+
+
+def _ensure_flusher():
+    # Threads do not survive a fork, so each gunicorn worker starts its own
+    if _state['path'] is None or _state['pid'] == os.getpid():
+        return
+    with _lock:
+        if _state['pid'] != os.getpid():
+            _state['pid'] = os.getpid()
+            _state['thread'] = threading.Thread(target=_flush_forever, name='metrics', daemon=True)
+            _state['thread'].start()
+
+
+def _is_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+
+def totals(name):
+    """Server-wide [(labels dict, value)] of a counter, for collectors deriving other metrics"""
+    rows = _connection().execute('SELECT labels, value FROM metric_counters WHERE name = ?', (name,))
+    return [({key: re.sub(r'\\(.)', lambda m: '\n' if m[1] == 'n' else m[1], value)
+              for key, value in _LABEL.findall(labels)}, total) for labels, total in rows]
+
+
+# --- Exposition ---
+
+def _series_key(name, labels):
+    """Sort series by labels, and histogram buckets by their bound"""
+    parts = labels.split(',') if labels else []
+    le = [p for p in parts if p.startswith('le=')]
+    bound = float(le[0][4:-1]) if le else 0.0
+    suffix = 0 if name.endswith('_bucket') else 1 if name.endswith('_sum') else 2
+    return [p for p in parts if not p.startswith('le=')], suffix, bound
+
+
+def render():
+    """Every metric in the Prometheus text format, summed over all workers"""
+    flush()
+    conn = _connection()
+    series = {}
+    for name, labels, value in conn.execute('SELECT name, labels, value FROM metric_counters'):
+        series[(name, labels)] = value
+
+    gauge_pids = [pid for (pid,) in conn.execute('SELECT DISTINCT pid FROM metric_gauges')]
+    dead = [pid for pid in gauge_pids if not _is_alive(pid)]
+    conn.executemany('DELETE FROM metric_gauges WHERE pid = ?', [(pid,) for pid in dead])
+    for name, labels, value in conn.execute('SELECT name, labels, SUM(value) FROM metric_gauges GROUP BY name, labels'):
+        series[(name, labels)] = value
+
+    for fn in _collectors:
+        try:
+            for name, labels, value in fn():
+                series[(name, _labels(labels))] = value
+        except Exception as e:
+            _state['logger'].exception('Metrics collector %s failed', fn.__name__)
+
+    lines = []
+    for metric, (kind, help, _) in _registry.items():
+        names = {f'{metric}_bucket', f'{metric}_sum', f'{metric}_count'} if kind == 'histogram' else {metric}
+        rows = sorted(((name, labels, value) for (name, labels), value in series.items() if name in names),
+                      key=lambda row: _series_key(row[0], row[1]))
+        lines.append(f'# HELP {metric} {help}')
+        lines.append(f'# TYPE {metric} {kind}')
+        for name, labels, value in rows:
+            value = int(value) if float(value).is_integer() else value
+            lines.append(f'{name}{{{labels}}} {value}' if labels else f'{name} {value}')
+    return '\n'.join(lines) + '\n'
+
+
+def reset():
+    """Forget every recorded value"""
+    with _lock:
+        _deltas.clear()
+    if _state['path'] is not None:
+        _connection().executescript('DELETE FROM metric_counters; DELETE FROM metric_gauges;')
+
+
+def init_app(app):
+    """Serve /metrics and register the metrics CLI command"""
+    _state['path'] = app.config.get('METRICS_PATH') or os.path.join(app.instance_path, 'metrics.db')
+    # The flusher thread has no app context
+    _state['logger'] = app.logger
+    allowed = {address.strip() for address in app.config.get('METRICS_ALLOW', '127.0.0.1,::1').split(',')}
+    atexit.register(flush)
+
+    def metrics_view():
+        if request.remote_addr not in allowed:
+            abort(404)
+        return Response(render(), mimetype='text/plain; version=0.0.4')
+
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
+
+    @app.cli.command('reset-metrics')
+    def reset_metrics_command():
+        """Zero every metric (all workers share the totals)."""
+        reset()
+        print("✓ Metrics reset")
@@ -66,7 +66,9 @@ class Customer(db.Model):
 book_categories = db.Table(
     'book_categories',
     db.Column('book_id', db.Integer, db.ForeignKey('books.id'), primary_key=True),
-    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True)
+    db.Column('category_id', db.Integer, db.ForeignKey('categories.id'), primary_key=True),
+    # Category members in id order: related-book candidates are read from it
+    db.Index('idx_book_categories_category_book', 'category_id', 'book_id')
 )
 
 # Association table for Book-SubCategory
@@ -86,6 +88,9 @@ bundle_books = db.Table(
 
 class Book(db.Model):
     __tablename__ = 'books'
+    __table_args__ = (
+        db.Index('idx_books_active_title', 'title', sqlite_where=db.text('is_deleted = 0')),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(150), nullable=False)
@@ -96,6 +101,12 @@ class Book(db.Model):
     price = db.Column(db.Float, nullable=False, default=0.0)
     avg_rating = db.Column(db.Float, default=0.0)   # Average rating out of 5
     review_count = db.Column(db.Integer, default=0) # Number of reviews
+    # Rating histogram: number of 1..5 star reviews
+    rating_count_1 = db.Column(db.Integer, nullable=False, default=0)
+    rating_count_2 = db.Column(db.Integer, nullable=False, default=0)
+    rating_count_3 = db.Column(db.Integer, nullable=False, default=0)
+    rating_count_4 = db.Column(db.Integer, nullable=False, default=0)
+    rating_count_5 = db.Column(db.Integer, nullable=False, default=0)
     is_deleted = db.Column(db.Boolean, default=False) # Soft delete flag
     deleted_at = db.Column(db.DateTime, nullable=True) # When the book was deleted
 
@@ -119,6 +130,13 @@ class Book(db.Model):
         backref=db.backref('books', lazy='dynamic')
     )
 
+    @property
+    def rating_histogram(self):
+        """[(stars, count, percent)] from 5 stars down to 1"""
+        counts = {stars: getattr(self, f'rating_count_{stars}') or 0 for stars in range(1, 6)}
+        total = sum(counts.values())
+        return [(stars, counts[stars], counts[stars] * 100 / total if total else 0) for stars in range(5, 0, -1)]
+
 
 class Category(db.Model):
     __tablename__ = 'categories'
@@ -150,15 +168,44 @@ class BookImage(db.Model):
     image_filename = db.Column(db.String(255), nullable=False)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
 
+class RelatedBook(db.Model):
+    __tablename__ = 'related_books'
+
+    # Precomputed by related.py; book_detail reads the top rows by score
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    related_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    score = db.Column(db.Float, nullable=False, default=0.0)
+
+    __table_args__ = (
+        db.Index('idx_related_books_book_score', 'book_id', 'score'),
+    )
+
+class BookRecommendation(db.Model):
+    __tablename__ = 'book_recommendations'
+
+    # "Customers also bought": top co-purchased books, precomputed by recommendations.py
+    book_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    recommended_id = db.Column(db.Integer, db.ForeignKey('books.id'), primary_key=True)
+    co_purchases = db.Column(db.Integer, nullable=False, default=0)
+    rank = db.Column(db.Integer, nullable=False, default=0)
+
+    __table_args__ = (
+        db.Index('idx_book_recommendations_book_rank', 'book_id', 'rank'),
+    )
+
 class BookReview(db.Model):
     __tablename__ = 'book_reviews'
+    __table_args__ = (
+        db.Index('idx_book_reviews_book_created', 'book_id', 'created_at', 'id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('books.id'), nullable=False)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
     rating = db.Column(db.Integer, nullable=False)  # 1-5 stars
     review_text = db.Column(db.Text, nullable=True)
-    created_at = db.Column(db.DateTime, default=utc_now)
+    # Required: review pages are keyset-paged on (created_at, id)
+    created_at = db.Column(db.DateTime, nullable=False, default=utc_now, server_default=db.func.current_timestamp())
     
     # Relationships
     user = db.relationship('User', backref='reviews')
@@ -174,6 +221,11 @@ class BundleOffer(db.Model):
     discount_type = db.Column(db.String(20), nullable=False, default='percentage')  # 'percentage' or 'fixed'
     discount_value = db.Column(db.Float, nullable=False, default=0.0)
     is_active = db.Column(db.Boolean, default=True)
+    # Derived from the member books; maintained by bundles.py, never set by hand
+    total_mrp = db.Column(db.Float, nullable=False, default=0.0)
+    savings_amount = db.Column(db.Float, nullable=False, default=0.0)
+    savings_percentage = db.Column(db.Float, nullable=False, default=0.0)
+    book_count = db.Column(db.Integer, nullable=False, default=0)
     created_at = db.Column(db.DateTime, default=utc_now)
     updated_at = db.Column(db.DateTime, default=utc_now, onupdate=utc_now)
 
@@ -186,6 +238,9 @@ class BundleOffer(db.Model):
     
 class Order(db.Model):
     __tablename__ = 'orders'
+    __table_args__ = (
+        db.Index('idx_orders_user_status', 'user_id', 'status'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -198,6 +253,10 @@ class Order(db.Model):
 
 class OrderItem(db.Model):
     __tablename__ = 'order_items'
+    __table_args__ = (
+        db.Index('idx_order_items_book_id', 'book_id', 'order_id'),
+        db.Index('idx_order_items_order_id', 'order_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=False)
@@ -210,6 +269,9 @@ class OrderItem(db.Model):
 
 class Transaction(db.Model):
     __tablename__ = 'transactions'
+    __table_args__ = (
+        db.Index('idx_transactions_order_id', 'order_id'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -222,6 +284,20 @@ class Transaction(db.Model):
     # Relationship
     order = db.relationship('Order', backref='transactions')
 
+class Payment(db.Model):
+    __tablename__ = 'payments'
+
+    # Ledger of processed payments, one row per gateway payment id (see payments.py)
+    id = db.Column(db.Integer, primary_key=True)
+    payment_id = db.Column(db.String(100), unique=True, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    order_id = db.Column(db.Integer, db.ForeignKey('orders.id'), nullable=True)
+    custom_order_id = db.Column(db.String(30), nullable=True)
+    amount = db.Column(db.Float, nullable=False)
+    created_at = db.Column(db.DateTime, default=utc_now)
+
+    order = db.relationship('Order', backref=db.backref('payment', uselist=False))
+
 class Admin(db.Model):
     __tablename__ = 'admins'
     
@@ -233,6 +309,9 @@ class Admin(db.Model):
 
 class Certificate(db.Model):
     __tablename__ = 'certificates'
+    __table_args__ = (
+        db.Index('idx_certificates_user_course', 'user_id', 'course_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -246,6 +325,9 @@ class Certificate(db.Model):
 
 class UserCourse(db.Model):
     __tablename__ = 'user_courses'
+    __table_args__ = (
+        db.Index('idx_user_courses_user_course', 'user_id', 'course_id'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
@@ -306,6 +388,14 @@ class Testimonial(db.Model):
     
 class FullOrderDetail(db.Model):
     __tablename__ = 'full_order_details'
+    __table_args__ = (
+        db.Index('idx_full_order_details_created_at', 'created_at'),
+        db.CheckConstraint(
+            "(item_type = 'bundle' AND bundle_id IS NOT NULL AND item_id = bundle_id) OR "
+            "(item_type != 'bundle' AND bundle_id IS NULL)",
+            name='ck_full_order_details_bundle_id'
+        ),
+    )
     
     # DATA CONSISTENCY RULE: For bundle orders, item_id must equal bundle_id
     # For non-bundle orders, bundle_id must be NULL
@@ -336,4 +426,37 @@ class FullOrderDetail(db.Model):
     order = db.relationship('Order', backref='full_order_details')
     transaction = db.relationship('Transaction', backref='full_order_details')
     customer = db.relationship('Customer', backref='orders')
-    bundle = db.relationship('BundleOffer', backref='order_details')
\ No newline at end of file
+    bundle = db.relationship('BundleOffer', backref='order_details')
+
+
+class QueuedJob(db.Model):
+    __tablename__ = 'job_queue'
+    __table_args__ = (
+        db.Index('idx_job_queue_run_at', 'run_at', 'id'),
+        {'sqlite_autoincrement': True},  # Ids are never reused, so dead letters keep pointing at one job
+    )
+
+    # Background work waiting for `flask run-jobs` (see jobs.py)
+    id = db.Column(db.Integer, primary_key=True)
+    task = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False, default='{}')  # JSON keyword arguments
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    run_at = db.Column(db.DateTime, nullable=False, default=utc_now)
+    locked_until = db.Column(db.DateTime, nullable=True)  # Set while a worker runs the job
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=utc_now)
+
+
+class DeadLetterJob(db.Model):
+    __tablename__ = 'dead_letter_jobs'
+
+    # Jobs that failed max_attempts times; `flask retry-dead-jobs` queues them again
+    id = db.Column(db.Integer, primary_key=True)
+    job_id = db.Column(db.Integer, nullable=False)
+    task = db.Column(db.String(100), nullable=False)
+    payload = db.Column(db.Text, nullable=False)
+    attempts = db.Column(db.Integer, nullable=False)
+    last_error = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, nullable=True)
+    failed_at = db.Column(db.DateTime, default=utc_now)
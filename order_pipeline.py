@@ -0,0 +1,204 @@
+from collections import namedtuple
+from datetime import datetime
+
+from sqlalchemy import insert
+from sqlalchemy.orm import selectinload
+
+import jobs
+import mailer
+import metrics
+from models import db, Book, BundleOffer, Customer, FullOrderDetail, OrderItem, QueuedJob, utc_now
+
+# Everything the order pipeline needs from the catalog, loaded once up front:
+# books and bundles by id, with each bundle's books already loaded.
+CartSnapshot = namedtuple('CartSnapshot', ['books', 'bundles'])
+
+metrics.counter('checkouts_total', 'Checkouts by result (success, failure, duplicate) and reason')
+metrics.counter('stock_outs_total', 'Checkouts stopped by missing stock: at validation or taken meanwhile (race)')
+
+
+def load_cart_snapshot(cart):
+    """Resolve every book and bundle in the cart with one IN query per table"""
+    bundle_ids = {item['id'] for item in cart if item.get('type') == 'bundle'}
+    book_ids = {item['id'] for item in cart if item.get('type', 'book') == 'book'}
+
+    bundles = {}
+    if bundle_ids:
+        bundles = {bundle.id: bundle for bundle in BundleOffer.query
+                   .options(selectinload(BundleOffer.books))
+                   .filter(BundleOffer.id.in_(bundle_ids))}
+
+    books = {book.id: book for bundle in bundles.values() for book in bundle.books}
+    missing = book_ids - set(books)
+    if missing:
+        books.update((book.id, book) for book in Book.query.filter(Book.id.in_(missing)))
+    return CartSnapshot(books=books, bundles=bundles)
+
+
+def required_stock(cart, snapshot):
+    """Return {book_id: quantity} the cart takes out of stock, bundles included"""
+    needed = {}
+    for item in cart:
+        quantity = item.get('quantity', 1)
+        if item.get('type') == 'bundle':
+            bundle = snapshot.bundles.get(item['id'])
+            book_ids = [book.id for book in bundle.books] if bundle else []
+        elif item.get('type', 'book') == 'book':
+            book_ids = [item['id']]
+        else:
+            continue
+        for book_id in book_ids:
+            needed[book_id] = needed.get(book_id, 0) + quantity
+    return needed
+
+
+def stock_error(cart, snapshot):
+    """Return a message for the first line that cannot be fulfilled, or None"""
+    needed = required_stock(cart, snapshot)
+    for item in cart:
+        item_type = item.get('type', 'book')
+        if item_type == 'bundle':
+            bundle = snapshot.bundles.get(item['id'])
+            if not bundle or not bundle.is_active:
+                return f"Bundle '{item.get('title', 'Unknown')}' is no longer available."
+            for book in bundle.books:
+                if book.quantity < needed[book.id]:
+                    return (f"Insufficient stock for '{book.title}' in bundle '{bundle.title}'. "
+                            f"Only {book.quantity} available.")
+        elif item_type == 'book':
+            book = snapshot.books.get(item['id'])
+            if not book or book.quantity < needed[item['id']]:
+                available = book.quantity if book else 0
+                return f"Insufficient stock for '{item.get('title', 'Unknown')}'. Only {available} available."
+    return None
+
+
+# --- Persisting the order ---
+# The request commits only what the order needs: stock, the order, its items
+# and the transaction. The customer record, the denormalised order details and
+# the purchase-driven refreshes are queued as jobs in the same transaction.
+# Rows are written with one executemany INSERT per table.
+
+CUSTOMER_FIELDS = ('full_name', 'email', 'phone', 'street_address', 'city', 'state', 'pincode')
+DETAIL_KEYS = ('type', 'id', 'title', 'quantity', 'price')
+
+def order_item_rows(order_id, cart, snapshot):
+    """Return OrderItem rows for the cart; bundles become one row per book"""
+    rows = []
+    for item in cart:
+        quantity = item.get('quantity', 1)
+        if item.get('type') == 'bundle':
+            bundle = snapshot.bundles.get(item['id'])
+            if bundle and bundle.is_active and bundle.books:
+                # The bundle price is split evenly over its books
+                per_book_price = bundle.selling_price / len(bundle.books)
+                rows.extend({'order_id': order_id, 'book_id': book.id, 'quantity': quantity,
+                             'price': per_book_price} for book in bundle.books)
+        elif item.get('type', 'book') == 'book':
+            rows.append({'order_id': order_id, 'book_id': item['id'], 'quantity': quantity,
+                         'price': item.get('price', 0.0)})
+    return rows
+
+
+def order_detail_rows(cart, **common):
+    """Return one FullOrderDetail row per cart line, sharing the common columns.
+
+    bundle_id follows the table's CHECK rule: it equals item_id for bundles
+    and is NULL for everything else.
+    """
+    rows = []
+    for item in cart:
+        item_type = item.get('type', 'book')
+        rows.append(dict(
+            common,
+            bundle_id=item['id'] if item_type == 'bundle' else None,
+            item_id=item['id'],
+            item_type=item_type,
+            item_title=item.get('title', 'Untitled'),
+            quantity=item.get('quantity', 1),
+            price=item['price'],
+        ))
+    return rows
+
+
+def insert_order_items(rows):
+    """Insert OrderItem rows with one executemany"""
+    if rows:
+        db.session.execute(insert(OrderItem), rows)
+
+
+def insert_order_details(rows):
+    """Insert FullOrderDetail rows with one executemany"""
+    if rows:
+        db.session.execute(insert(FullOrderDetail), rows)
+
+
+def save_customer(user_id, customer_info):
+    """Create or update the user's Customer record from the checkout details"""
+    customer = Customer.query.filter_by(user_id=user_id).first()
+    if customer:
+        for field in CUSTOMER_FIELDS:
+            setattr(customer, field, customer_info.get(field, getattr(customer, field)))
+        customer.updated_at = utc_now()
+    else:
+        customer = Customer(user_id=user_id, **{field: customer_info.get(field, '') for field in CUSTOMER_FIELDS})
+        db.session.add(customer)
+    db.session.flush()
+    return customer
+
+
+def queue_order_jobs(order, transaction, custom_order_id, customer_info, cart, book_ids):
+    """Queue the work that can follow the order's commit"""
+    lines = [{key: item.get(key) for key in DETAIL_KEYS} for item in cart]
+    jobs.enqueue(
+        'write-order-details',
+        user_id=order.user_id,
+        customer_info=customer_info,
+        cart=lines,
+        order_id=order.id,
+        transaction_id=transaction.id,
+        custom_order_id=custom_order_id,
+        created_at=order.date_created.isoformat()
+    )
+    jobs.enqueue(
+        'send-order-confirmation',
+        to=customer_info['email'],
+        full_name=customer_info.get('full_name', ''),
+        address=customer_info.get('address', ''),
+        cart=lines,
+        custom_order_id=custom_order_id,
+        amount=order.total_amount
+    )
+    if book_ids:
+        book_ids = sorted(book_ids)
+        jobs.enqueue('update-recommendations', book_ids=book_ids)
+        jobs.enqueue('refresh-related-books', book_ids=book_ids)
+
+
+@jobs.task('write-order-details')
+def write_order_details(user_id, customer_info, cart, created_at, **order):
+    """Job: upsert the customer and write one FullOrderDetail row per cart line"""
+    customer = save_customer(user_id, customer_info)
+    insert_order_details(order_detail_rows(
+        cart,
+        customer_id=customer.id,
+        full_name=customer_info.get('full_name', ''),
+        email=customer_info.get('email', ''),
+        phone=customer_info.get('phone', ''),
+        address=customer_info.get('address', ''),
+        created_at=datetime.fromisoformat(created_at),
+        **order
+    ))
+
+
+@metrics.collector
+def _queued_confirmations():
+    count = QueuedJob.query.filter_by(task='send-order-confirmation').count()
+    return [('email_queue_depth', {'queue': 'jobs'}, count)]
+
+
+@jobs.task('send-order-confirmation')
+def send_order_confirmation(to, custom_order_id, **context):
+    """Job: email the order summary (failures are retried by the job queue)"""
+    mailer.deliver(mailer.compose(to, f"Order {custom_order_id} confirmed - Easy2Learning",
+                                  'order_confirmation.html', custom_order_id=custom_order_id, **context))
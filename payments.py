@@ -0,0 +1,44 @@
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+
+from models import db, Payment
+
+# Every processed payment gets one row in the payments ledger, keyed by the
+# gateway's payment id. Reloads and retries of /payment/success find the row
+# and show the order already created instead of building another one.
+#
+# The ledger row is also the lock: payment_success claims the payment with
+# INSERT ... ON CONFLICT DO NOTHING as the first write of the order
+# transaction. SQLite serialises writers, so of several concurrent requests
+# for one payment exactly one inserts the row and creates the order; the
+# others wait for its commit, insert nothing and roll back.
+
+
+def find_payment(payment_id):
+    """Return the ledger row for payment_id, or None if it was never processed"""
+    return Payment.query.filter_by(payment_id=payment_id).first()
+
+
+def claim_payment(payment_id, user_id, custom_order_id, amount):
+    """Record the payment in the current transaction; False if it is already recorded"""
+    result = db.session.execute(
+        insert(Payment)
+        .values(payment_id=payment_id, user_id=user_id, custom_order_id=custom_order_id, amount=amount)
+        .on_conflict_do_nothing(index_elements=['payment_id'])
+    )
+    return result.rowcount == 1
+
+
+def attach_order(payment_id, order_id):
+    """Link a claimed payment to the order created for it"""
+    db.session.execute(update(Payment).where(Payment.payment_id == payment_id).values(order_id=order_id))
+
+
+def order_summary(payment):
+    """The values payment_success.html shows for a recorded payment"""
+    return {
+        'order_id': payment.custom_order_id,
+        'payment_id': payment.payment_id,
+        'payment_date': payment.created_at.strftime('%B %d, %Y'),
+        'amount': payment.amount
+    }
@@ -0,0 +1,220 @@
+import threading
+import time
+from collections import Counter
+
+from flask import before_render_template, current_app, g, has_request_context, request, session, template_rendered
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.orm import Mapper
+
+import metrics
+
+# Per-request cost accounting: wall time, SQL statements and time, model rows
+# loaded and template render time, aggregated per endpoint in this worker
+# process. A statement run N_PLUS_ONE_THRESHOLD or more times in one request
+# (same SQL, any parameters) is reported as a likely N+1 query.
+# Admins see the aggregates at /admin/perf and /admin/perf.json; the same
+# measurements feed the server-wide request metrics at /metrics. Responses
+# carry a Server-Timing header for admins, or for everyone with SERVER_TIMING.
+
+LATENCY_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000)
+N_PLUS_ONE_THRESHOLD = 5
+# Suspect statements remembered per endpoint
+SUSPECTS_KEPT = 10
+
+metrics.counter('http_requests_total', 'Requests handled, by endpoint, method and status')
+metrics.histogram('http_request_duration_seconds', 'Request wall time by endpoint',
+                  [ms / 1000 for ms in LATENCY_BUCKETS_MS])
+metrics.counter('db_queries_total', 'SQL statements executed while handling requests, by endpoint')
+metrics.counter('db_query_seconds_total', 'Time spent in SQL while handling requests, by endpoint')
+
+
+class RequestCost:
+    """What the current request has spent so far"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.sql_count = 0
+        self.sql_seconds = 0.0
+        self.rows = 0
+        self.template_seconds = 0.0
+        self.statements = Counter()
+        self.template_starts = []
+
+    def suspects(self, threshold):
+        return [(statement, count) for statement, count in self.statements.most_common()
+                if count >= threshold]
+
+
+class EndpointStats:
+    """Running totals and a latency histogram for one endpoint"""
+
+    def __init__(self):
+        self.requests = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.sql_count = 0
+        self.sql_ms = 0.0
+        self.rows = 0
+        self.template_ms = 0.0
+        self.buckets = [0] * (len(LATENCY_BUCKETS_MS) + 1)
+        self.flagged_requests = 0
+        self.suspects = {}  # statement -> highest repeat count seen
+
+    def add(self, wall_ms, cost, suspects):
+        self.requests += 1
+        self.total_ms += wall_ms
+        self.max_ms = max(self.max_ms, wall_ms)
+        self.sql_count += cost.sql_count
+        self.sql_ms += cost.sql_seconds * 1000
+        self.rows += cost.rows
+        self.template_ms += cost.template_seconds * 1000
+        self.buckets[_bucket(wall_ms)] += 1
+        if suspects:
+            self.flagged_requests += 1
+            for statement, count in suspects:
+                self.suspects[statement] = max(count, self.suspects.get(statement, 0))
+            if len(self.suspects) > SUSPECTS_KEPT:
+                kept = sorted(self.suspects.items(), key=lambda item: -item[1])[:SUSPECTS_KEPT]
+                self.suspects = dict(kept)
+
+    def percentile(self, fraction):
+        """Upper bound of the histogram bucket holding the given fraction of requests"""
+        target = fraction * self.requests
+        seen = 0
+        for index, count in enumerate(self.buckets):
+            seen += count
+            if seen >= target and count:
+                return LATENCY_BUCKETS_MS[index] if index < len(LATENCY_BUCKETS_MS) else self.max_ms
+        return 0.0
+
+    def as_dict(self, endpoint):
+        n = self.requests or 1
+        return {
+            'endpoint': endpoint,
+            'requests': self.requests,
+            'total_ms': round(self.total_ms, 1),
+            'avg_ms': round(self.total_ms / n, 2),
+            'max_ms': round(self.max_ms, 2),
+            'p50_ms': self.percentile(0.5),
+            'p95_ms': self.percentile(0.95),
+            'avg_sql_count': round(self.sql_count / n, 2),
+            'avg_sql_ms': round(self.sql_ms / n, 2),
+            'avg_rows': round(self.rows / n, 2),
+            'avg_template_ms': round(self.template_ms / n, 2),
+            'histogram': {
+                **{f'le_{bound}': count for bound, count in zip(LATENCY_BUCKETS_MS, self.buckets)},
+                'le_inf': self.buckets[-1],
+            },
+            'n_plus_one_requests': self.flagged_requests,
+            'n_plus_one': [{'statement': statement, 'count': count}
+                           for statement, count in sorted(self.suspects.items(), key=lambda item: -item[1])],
+        }
+
+
+def _bucket(ms):
+    for index, bound in enumerate(LATENCY_BUCKETS_MS):
+        if ms <= bound:
+            return index
+    return len(LATENCY_BUCKETS_MS)
+
+
+_endpoints = {}
+_lock = threading.Lock()
+
+
+def snapshot():
+    """Per-endpoint aggregates for this worker, slowest total time first"""
+    with _lock:
+        rows = [stats.as_dict(endpoint) for endpoint, stats in _endpoints.items()]
+    return sorted(rows, key=lambda row: -row['total_ms'])
+
+
+def reset():
+    with _lock:
+        _endpoints.clear()
+
+
+def _current():
+    return g.get('request_cost') if has_request_context() else None
+
+
+# --- SQLAlchemy hooks ---
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    if _current() is not None:
+        conn.info.setdefault('perf_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+    cost = _current()
+    starts = conn.info.get('perf_query_start')
+    if cost is None or not starts:
+        return
+    cost.sql_seconds += time.perf_counter() - starts.pop()
+    cost.sql_count += 1
+    cost.statements[statement] += 1
+
+
+@event.listens_for(Mapper, 'load')
+def _count_loaded_row(target, context):
+    cost = _current()
+    if cost is not None:
+        cost.rows += 1
+
+
+# --- Flask hooks ---
+
+def _start_request():
+    g.request_cost = RequestCost()
+
+
+def _before_render(sender, template, context, **extra):
+    cost = _current()
+    if cost is not None:
+        cost.template_starts.append(time.perf_counter())
+
+
+def _after_render(sender, template, context, **extra):
+    cost = _current()
+    if cost is not None and cost.template_starts:
+        elapsed = time.perf_counter() - cost.template_starts.pop()
+        # Only count the outermost render; nested renders are part of it
+        if not cost.template_starts:
+            cost.template_seconds += elapsed
+
+
+def _finish_request(response):
+    cost = g.pop('request_cost', None)
+    endpoint = request.endpoint or '<unmatched>'
+    if cost is None or endpoint == 'static':
+        return response
+
+    wall_ms = (time.perf_counter() - cost.start) * 1000
+    suspects = cost.suspects(N_PLUS_ONE_THRESHOLD)
+    for statement, count in suspects:
+        current_app.logger.warning('Possible N+1 in %s: %dx %s', endpoint, count, ' '.join(statement.split())[:160])
+    with _lock:
+        _endpoints.setdefault(endpoint, EndpointStats()).add(wall_ms, cost, suspects)
+    metrics.inc('http_requests_total', endpoint=endpoint, method=request.method, status=response.status_code)
+    metrics.observe('http_request_duration_seconds', wall_ms / 1000, endpoint=endpoint)
+    metrics.inc('db_queries_total', cost.sql_count, endpoint=endpoint)
+    metrics.inc('db_query_seconds_total', cost.sql_seconds, endpoint=endpoint)
+
+    # Query counts and timings are for us, not for every visitor
+    if current_app.config.get('SERVER_TIMING') or session.get('admin_id'):
+        response.headers['Server-Timing'] = (
+            f'app;dur={wall_ms:.1f}, db;dur={cost.sql_seconds * 1000:.1f};desc="{cost.sql_count} queries", '
+            f'tpl;dur={cost.template_seconds * 1000:.1f}'
+        )
+    return response
+
+
+def init_app(app):
+    """Instrument every request of app"""
+    app.before_request(_start_request)
+    app.after_request(_finish_request)
+    before_render_template.connect(_before_render, app)
+    template_rendered.connect(_after_render, app)
@@ -0,0 +1,180 @@
+import click
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+from models import db, Book, BookReview
+import suggest_index
+
+# Book ratings are aggregates of book_reviews. The star histogram
+# (rating_count_1..5) is the source of truth; avg_rating and review_count are
+# derived from it in the same UPDATE, so every review add or delete is one
+# atomic statement per book and concurrent writers never lose an update.
+STARS = range(1, 6)
+
+STORED_COLUMNS = ['avg_rating', 'review_count'] + [f'rating_count_{stars}' for stars in STARS]
+
+_TOTAL = ' + '.join(f'rating_count_{stars}' for stars in STARS)
+_WEIGHTED = ' + '.join(f'rating_count_{stars} * {stars}' for stars in STARS)
+
+_APPLY_SQL = text(f"""
+UPDATE books SET
+    {', '.join(f'rating_count_{stars} = rating_count_{stars} + :d{stars}' for stars in STARS)},
+    review_count = {_TOTAL} + :count_delta,
+    avg_rating = CASE WHEN {_TOTAL} + :count_delta > 0
+                      THEN ({_WEIGHTED} + :weighted_delta) * 1.0 / ({_TOTAL} + :count_delta)
+                      ELSE 0.0 END
+WHERE id = :book_id
+""")
+
+# One GROUP BY pass over book_reviews, joined to the stored aggregates
+_ACTUAL_SQL = f"""
+SELECT b.id AS book_id,
+       b.avg_rating AS stored_avg, b.review_count AS stored_count,
+       {', '.join(f'b.rating_count_{stars} AS stored_{stars}' for stars in STARS)},
+       COALESCE(r.avg_rating, 0.0) AS actual_avg, COALESCE(r.review_count, 0) AS actual_count,
+       {', '.join(f'COALESCE(r.stars_{stars}, 0) AS actual_{stars}' for stars in STARS)}
+FROM books b
+LEFT JOIN (
+    SELECT book_id, AVG(rating) AS avg_rating, COUNT(*) AS review_count,
+           {', '.join(f'SUM(rating = {stars}) AS stars_{stars}' for stars in STARS)}
+    FROM book_reviews GROUP BY book_id
+) r ON r.book_id = b.id
+WHERE {{where}}
+"""
+
+_FIX_SQL = text(f"""
+UPDATE books SET
+    avg_rating = :actual_avg,
+    review_count = :actual_count,
+    {', '.join(f'rating_count_{stars} = :actual_{stars}' for stars in STARS)}
+WHERE id = :book_id
+""")
+
+
+def apply_review_deltas(connection, deltas):
+    """Apply {book_id: {stars: +/-n}} to the stored aggregates, one UPDATE per book"""
+    for book_id, stars_delta in deltas.items():
+        if not any(stars_delta.values()):
+            continue
+        params = {f'd{stars}': stars_delta.get(stars, 0) for stars in STARS}
+        params['count_delta'] = sum(stars_delta.values())
+        params['weighted_delta'] = sum(stars * n for stars, n in stars_delta.items())
+        params['book_id'] = book_id
+        connection.execute(_APPLY_SQL, params)
+
+
+def _drifted(row):
+    stored = (row.stored_count, *(getattr(row, f'stored_{stars}') for stars in STARS))
+    actual = (row.actual_count, *(getattr(row, f'actual_{stars}') for stars in STARS))
+    return stored != actual or abs((row.stored_avg or 0.0) - row.actual_avg) > 1e-6
+
+
+def reconcile_ratings(book_ids=None, fix=True):
+    """Recompute rating aggregates from book_reviews and return the rows that had drifted.
+
+    Every book (or only book_ids) is checked in one GROUP BY pass; with fix
+    the drifted books are rewritten with the recomputed values.
+    """
+    if book_ids is None:
+        stmt = text(_ACTUAL_SQL.format(where='1 = 1'))
+        params = {}
+    else:
+        stmt = text(_ACTUAL_SQL.format(where='b.id IN :ids')).bindparams(bindparam('ids', expanding=True))
+        params = {'ids': list(book_ids)}
+        if not params['ids']:
+            return []
+
+    conn = db.session.connection()
+    drift = [row for row in conn.execute(stmt, params) if _drifted(row)]
+    if fix and drift:
+        conn.execute(_FIX_SQL, [row._asdict() for row in drift])
+        # review_count ranks search suggestions
+        suggest_index.reload_books(db.session, [row.book_id for row in drift])
+        # Committing also expires the aggregates of loaded books
+        db.session.commit()
+    return drift
+
+
+# --- Keep stored aggregates in sync with ORM writes ---
+
+def _add_delta(deltas, book_id, stars, n):
+    if book_id is not None and stars in STARS:
+        book_deltas = deltas.setdefault(book_id, {})
+        book_deltas[stars] = book_deltas.get(stars, 0) + n
+
+
+def _previous(state, attr):
+    """Value of attr as loaded from the database, before this flush"""
+    history = state.attrs[attr].history
+    if history.deleted:
+        return history.deleted[0]
+    return history.unchanged[0] if history.unchanged else None
+
+
+# Load the old rating/book before they are overwritten so edits can be undone
+@event.listens_for(BookReview.rating, 'set', active_history=True)
+@event.listens_for(BookReview.book_id, 'set', active_history=True)
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_review_changes(session, flush_context, instances):
+    deltas = session.info.setdefault('rating_deltas', {})
+    for obj in session.new:
+        if isinstance(obj, BookReview):
+            _add_delta(deltas, obj.book_id, obj.rating, 1)
+    for obj in session.deleted:
+        if isinstance(obj, BookReview):
+            # Attribute access reloads an expired review; the row still exists
+            _add_delta(deltas, obj.book_id, obj.rating, -1)
+    for obj in session.dirty:
+        if isinstance(obj, BookReview):
+            state = inspect(obj)
+            if state.attrs.rating.history.has_changes() or state.attrs.book_id.history.has_changes():
+                _add_delta(deltas, _previous(state, 'book_id'), _previous(state, 'rating'), -1)
+                _add_delta(deltas, obj.book_id, obj.rating, 1)
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_review_changes(session, flush_context):
+    deltas = session.info.pop('rating_deltas', None)
+    if deltas:
+        apply_review_deltas(session.connection(), deltas)
+        session.info.setdefault('rating_expire', set()).update(deltas)
+        suggest_index.reload_books(session, deltas)
+
+
+@event.listens_for(Session, 'after_flush_postexec')
+def _expire_rating_columns(session, flush_context):
+    book_ids = session.info.pop('rating_expire', None)
+    if not book_ids:
+        return
+    for obj in list(session.identity_map.values()):
+        if isinstance(obj, Book) and obj.id in book_ids:
+            session.expire(obj, STORED_COLUMNS)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_rating_changes(session):
+    for key in ('rating_deltas', 'rating_expire'):
+        session.info.pop(key, None)
+
+
+def init_app(app):
+    """Register the rating reconciliation CLI command"""
+
+    @app.cli.command('reconcile-ratings')
+    @click.option('--dry-run', is_flag=True, help='Only report drift, do not fix it.')
+    def reconcile_ratings_command(dry_run):
+        """Recompute book ratings from reviews and report any drift (run periodically, e.g. nightly cron)."""
+        drift = reconcile_ratings(fix=not dry_run)
+        for row in drift:
+            print(f"  Book {row.book_id}: stored {row.stored_count} reviews / {row.stored_avg or 0:.2f}, "
+                  f"actual {row.actual_count} / {row.actual_avg:.2f}")
+        if not drift:
+            print("✓ All book ratings match their reviews")
+        elif dry_run:
+            print(f"⚠ {len(drift)} books have drifted ratings (run without --dry-run to fix)")
+        else:
+            print(f"✓ Fixed ratings for {len(drift)} books")
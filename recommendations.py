@@ -0,0 +1,199 @@
+import numpy as np
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, insert, inspect, text
+from sqlalchemy.orm import Session
+
+import database
+import jobs
+from background import BatchRunner
+from models import db, Book, BookRecommendation, Order, OrderItem
+
+# Neighbours stored per book
+TOP_K = 10
+# Orders with more distinct books than this are left out: they are bulk
+# purchases that say little about taste and cost size^2 pairs to count
+MAX_ORDER_SIZE = 50
+# Rows written per INSERT executemany
+INSERT_BATCH_SIZE = 5000
+
+_EMPTY = np.empty(0, dtype=np.int64)
+
+_ORDER_ITEMS_SQL = """
+SELECT oi.order_id, oi.book_id
+FROM order_items oi
+JOIN orders o ON o.id = oi.order_id AND o.status = 'completed'
+JOIN books b ON b.id = oi.book_id AND b.is_deleted = 0
+"""
+
+
+def top_k_neighbours(order_ids, book_ids, k=TOP_K, rows=None, max_order_size=MAX_ORDER_SIZE):
+    """Count co-purchases and keep the top k neighbours per book.
+
+    order_ids and book_ids are parallel arrays with one entry per order item.
+    The item-item co-occurrence matrix is built in coordinate form with
+    vectorized NumPy operations. If rows is given, only those books' rows are
+    computed. Returns (book_id, recommended_id, co_purchases, rank) arrays.
+    """
+    order_ids = np.asarray(order_ids, dtype=np.int64)
+    book_ids = np.asarray(book_ids, dtype=np.int64)
+    if not len(book_ids):
+        return _EMPTY, _EMPTY, _EMPTY, _EMPTY
+
+    # One entry per distinct (order, book), sorted by order
+    span = int(book_ids.max()) + 1
+    orders, books = np.divmod(np.unique(order_ids * span + book_ids), span)
+
+    # Size and start of the order each entry belongs to
+    starts = np.flatnonzero(np.r_[True, orders[1:] != orders[:-1]])
+    sizes = np.diff(np.r_[starts, len(orders)])
+    entry_sizes = np.repeat(sizes, sizes)
+    entry_starts = np.repeat(starts, sizes)
+
+    keep = (entry_sizes > 1) & (entry_sizes <= max_order_size)
+    if rows is not None:
+        keep &= np.isin(books, np.asarray(list(rows), dtype=np.int64))
+    left = np.flatnonzero(keep)
+    if not len(left):
+        return _EMPTY, _EMPTY, _EMPTY, _EMPTY
+
+    # Pair every kept entry with every entry of its order (itself excluded)
+    counts = entry_sizes[left]
+    pair_left = np.repeat(left, counts)
+    pair_right = np.repeat(entry_starts[left], counts) + \
+        np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    distinct = pair_left != pair_right
+    source = books[pair_left[distinct]]
+    target = books[pair_right[distinct]]
+
+    # Sparse co-occurrence matrix: (source, target) -> number of orders
+    cells, co_purchases = np.unique(source * span + target, return_counts=True)
+    source, target = np.divmod(cells, span)
+
+    # Rank each row by co-purchases (ties: lower book id) and cut at k
+    order = np.lexsort((target, -co_purchases, source))
+    source, target, co_purchases = source[order], target[order], co_purchases[order]
+    row_starts = np.flatnonzero(np.r_[True, source[1:] != source[:-1]])
+    rank = np.arange(len(source)) - np.repeat(row_starts, np.diff(np.r_[row_starts, len(source)]))
+    top = rank < k
+    return source[top], target[top], co_purchases[top], rank[top]
+
+
+def _order_item_arrays(conn, book_ids=None):
+    """Load (order_id, book_id) arrays for completed orders, optionally only orders containing book_ids"""
+    if book_ids is None:
+        result = conn.execute(text(_ORDER_ITEMS_SQL))
+    else:
+        result = conn.execute(
+            text(_ORDER_ITEMS_SQL + ' WHERE oi.order_id IN (SELECT order_id FROM order_items WHERE book_id IN :ids)')
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(book_ids)}
+        )
+    pairs = np.array(result.all(), dtype=np.int64).reshape(-1, 2)
+    return pairs[:, 0], pairs[:, 1]
+
+
+def _store(conn, neighbours):
+    rows = [
+        {'book_id': int(b), 'recommended_id': int(r), 'co_purchases': int(c), 'rank': int(n)}
+        for b, r, c, n in zip(*neighbours)
+    ]
+    for start in range(0, len(rows), INSERT_BATCH_SIZE):
+        conn.execute(insert(BookRecommendation.__table__), rows[start:start + INSERT_BATCH_SIZE])
+    return len(rows)
+
+
+def rebuild_recommendations():
+    """Recompute every book's neighbours from all completed orders, returning the row count"""
+    with database.begin_write() as conn:
+        neighbours = top_k_neighbours(*_order_item_arrays(conn))
+        conn.execute(text('DELETE FROM book_recommendations'))
+        return _store(conn, neighbours)
+
+
+def update_recommendations(book_ids=(), order_ids=()):
+    """Recompute the neighbours of books in new or changed orders.
+
+    A new order only changes counts between books it contains, so recomputing
+    those books' rows from the orders they appear in keeps the table exact.
+    """
+    with database.begin_write() as conn:
+        book_ids = set(book_ids)
+        if order_ids:
+            book_ids.update(conn.execute(
+                text('SELECT book_id FROM order_items WHERE order_id IN :ids')
+                .bindparams(bindparam('ids', expanding=True)),
+                {'ids': list(order_ids)}
+            ).scalars())
+        if not book_ids:
+            return 0
+
+        neighbours = top_k_neighbours(*_order_item_arrays(conn, book_ids), rows=book_ids)
+        conn.execute(
+            text('DELETE FROM book_recommendations WHERE book_id IN :ids')
+            .bindparams(bindparam('ids', expanding=True)),
+            {'ids': list(book_ids)}
+        )
+        return _store(conn, neighbours)
+
+
+def also_bought(book_ids, limit=4):
+    """Return ids of books most often bought with any of book_ids, best first"""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return []
+    total = db.func.sum(BookRecommendation.co_purchases)
+    rows = db.session.query(BookRecommendation.recommended_id)\
+        .join(Book, Book.id == BookRecommendation.recommended_id)\
+        .filter(BookRecommendation.book_id.in_(book_ids),
+                BookRecommendation.recommended_id.notin_(book_ids),
+                Book.is_deleted == False)\
+        .group_by(BookRecommendation.recommended_id)\
+        .order_by(total.desc(), BookRecommendation.recommended_id)\
+        .limit(limit).all()
+    return [row.recommended_id for row in rows]
+
+
+# --- Incremental updates for new orders ---
+
+_runner = BatchRunner('recommendations', update_recommendations)
+# Orders placed through payment_success queue their update as a job instead
+jobs.task('update-recommendations')(update_recommendations)
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_purchases(session, flush_context):
+    book_ids = {
+        obj.book_id for obj in list(session.new) + list(session.deleted) if isinstance(obj, OrderItem)
+    }
+    order_ids = {
+        obj.id for obj in list(session.dirty) + list(session.deleted)
+        if isinstance(obj, Order) and (obj in session.deleted or inspect(obj).attrs.status.history.has_changes())
+    }
+    book_ids.discard(None)
+    if book_ids or order_ids:
+        changes = session.info.setdefault('recommendation_changes', (set(), set()))
+        changes[0].update(book_ids)
+        changes[1].update(order_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _update_after_commit(session):
+    changes = session.info.pop('recommendation_changes', None)
+    if changes and has_app_context():
+        book_ids, order_ids = changes
+        _runner.submit(current_app._get_current_object(), book_ids=book_ids, order_ids=order_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_purchases(session):
+    session.info.pop('recommendation_changes', None)
+
+
+def init_app(app):
+    """Register the recommendations CLI command"""
+
+    @app.cli.command('rebuild-recommendations')
+    def rebuild_recommendations_command():
+        """Recompute "customers also bought" from all completed orders."""
+        count = rebuild_recommendations()
+        print(f"✓ Stored {count} book recommendations")
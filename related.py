@@ -0,0 +1,235 @@
+from flask import current_app, has_app_context
+from sqlalchemy import bindparam, event, inspect, text
+from sqlalchemy.orm import Session
+
+import database
+import jobs
+from background import BatchRunner
+from models import db, Book, Category, Order, OrderItem, RelatedBook
+
+# Related books kept per book, and how each signal contributes to the score
+RELATED_LIMIT = 8
+CATEGORY_WEIGHT = 1.0
+CO_PURCHASE_WEIGHT = 2.0
+# Candidates scored per book from each signal: its most co-purchased books and
+# the first books (by id) of each of its categories. Bounds the work per book
+# however large a category grows; the top RELATED_LIMIT are kept.
+CANDIDATE_LIMIT = 50
+# Books recomputed per statement (keeps the IN lists bounded)
+REFRESH_BATCH_SIZE = 500
+
+# Score each book's candidates by shared categories and by completed orders
+# containing both books, then keep the top RELATED_LIMIT per book.
+_REFRESH_SQL = """
+INSERT INTO related_books (book_id, related_id, score)
+WITH co_purchases AS (
+    SELECT a.book_id AS book_id, b.book_id AS related_id, COUNT(DISTINCT a.order_id) AS orders
+    FROM order_items a
+    JOIN orders o ON o.id = a.order_id AND o.status = 'completed'
+    JOIN order_items b ON b.order_id = a.order_id AND b.book_id != a.book_id
+    WHERE {book_filter}
+    GROUP BY a.book_id, b.book_id
+),
+category_cutoffs AS (
+    SELECT a.book_id AS book_id, a.category_id AS category_id,
+           COALESCE((SELECT m.book_id FROM book_categories m
+                     WHERE m.category_id = a.category_id AND m.book_id != a.book_id
+                     ORDER BY m.book_id LIMIT 1 OFFSET :candidates - 1), 9223372036854775807) AS last_id
+    FROM book_categories a
+    WHERE {book_filter}
+),
+candidates AS (
+    SELECT book_id, related_id FROM (
+        SELECT book_id, related_id,
+               ROW_NUMBER() OVER (PARTITION BY book_id ORDER BY orders DESC, related_id) AS rn
+        FROM co_purchases
+    ) WHERE rn <= :candidates
+    UNION
+    SELECT c.book_id, m.book_id
+    FROM category_cutoffs c
+    JOIN book_categories m ON m.category_id = c.category_id AND m.book_id <= c.last_id
+    WHERE m.book_id != c.book_id
+),
+scored AS (
+    SELECT c.book_id, c.related_id,
+           COALESCE(p.orders, 0) * :co_purchase_weight
+           + (SELECT COUNT(*) FROM book_categories x
+              JOIN book_categories y ON y.category_id = x.category_id AND y.book_id = c.related_id
+              WHERE x.book_id = c.book_id) * :category_weight AS score
+    FROM candidates c
+    LEFT JOIN co_purchases p ON p.book_id = c.book_id AND p.related_id = c.related_id
+),
+ranked AS (
+    SELECT s.book_id, s.related_id, s.score,
+           ROW_NUMBER() OVER (PARTITION BY s.book_id ORDER BY s.score DESC, s.related_id) AS rn
+    FROM scored s
+    JOIN books source ON source.id = s.book_id AND source.is_deleted = 0
+    JOIN books related ON related.id = s.related_id AND related.is_deleted = 0
+)
+SELECT book_id, related_id, score FROM ranked WHERE rn <= :limit
+"""
+
+# Books whose related list can change when the given books' categories change
+# or they are added or deleted: the books themselves, anything sharing a
+# category with them, and anything currently listing them.
+_NEIGHBOURS_SQL = """
+SELECT b.book_id FROM book_categories a
+JOIN book_categories b ON b.category_id = a.category_id
+WHERE a.book_id IN :ids
+UNION
+SELECT book_id FROM related_books WHERE related_id IN :ids
+"""
+
+
+def _score_params():
+    return {
+        'category_weight': CATEGORY_WEIGHT,
+        'co_purchase_weight': CO_PURCHASE_WEIGHT,
+        'candidates': CANDIDATE_LIMIT,
+        'limit': RELATED_LIMIT,
+    }
+
+
+def _in(sql):
+    return text(sql).bindparams(bindparam('ids', expanding=True))
+
+
+def rebuild_related_books():
+    """Recompute the whole related_books table, returning the number of rows"""
+    with db.engine.begin() as conn:
+        conn.execute(text('DELETE FROM related_books'))
+        conn.execute(text(_REFRESH_SQL.format(book_filter='1 = 1')), _score_params())
+        return conn.execute(text('SELECT COUNT(*) FROM related_books')).scalar()
+
+
+def _recompute(conn, book_ids):
+    refresh = _in(_REFRESH_SQL.format(book_filter='a.book_id IN :ids'))
+    book_ids = list(book_ids)
+    for start in range(0, len(book_ids), REFRESH_BATCH_SIZE):
+        batch = book_ids[start:start + REFRESH_BATCH_SIZE]
+        conn.execute(_in('DELETE FROM related_books WHERE book_id IN :ids'), {'ids': batch})
+        conn.execute(refresh, {**_score_params(), 'ids': batch})
+    return len(book_ids)
+
+
+def refresh_related_books(book_ids=()):
+    """Recompute related rows after catalog changes to the given books, and their neighbours'"""
+    book_ids = set(book_ids)
+    if not book_ids:
+        return 0
+    with database.begin_write() as conn:
+        affected = set(book_ids)
+        seeds = list(book_ids)
+        for start in range(0, len(seeds), REFRESH_BATCH_SIZE):
+            affected.update(conn.execute(
+                _in(_NEIGHBOURS_SQL), {'ids': seeds[start:start + REFRESH_BATCH_SIZE]}
+            ).scalars())
+        return _recompute(conn, affected)
+
+
+def refresh_purchased_books(book_ids=(), order_ids=()):
+    """Recompute related rows of the books in new or changed orders.
+
+    An order only changes co-purchase counts between the books it contains,
+    so no other book's list can change.
+    """
+    with database.begin_write() as conn:
+        book_ids = set(book_ids)
+        if order_ids:
+            book_ids.update(conn.execute(
+                _in('SELECT book_id FROM order_items WHERE order_id IN :ids'), {'ids': list(order_ids)}
+            ).scalars())
+        return _recompute(conn, book_ids)
+
+
+def related_book_ids(book_id, limit=4):
+    """Return ids of the best related books for book_id, best first"""
+    rows = db.session.query(RelatedBook.related_id)\
+        .filter(RelatedBook.book_id == book_id)\
+        .order_by(RelatedBook.score.desc(), RelatedBook.related_id)\
+        .limit(limit).all()
+    return [row.related_id for row in rows]
+
+
+# Incremental refreshes run on a per-worker background thread, or from the
+# job queue for orders placed through payment_success
+_runner = BatchRunner('related-books', refresh_related_books)
+_purchase_runner = BatchRunner('related-books-purchases', refresh_purchased_books)
+jobs.task('refresh-related-books')(refresh_purchased_books)
+
+
+# --- Track writes that change relatedness ---
+
+@event.listens_for(Session, 'after_flush')
+def _collect_related_changes(session, flush_context):
+    book_ids = set()
+    purchased_ids = set()
+    order_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Book):
+            state = inspect(obj)
+            if obj in session.new or obj in session.deleted or \
+                    state.attrs.categories.history.has_changes() or \
+                    state.attrs.is_deleted.history.has_changes():
+                book_ids.add(obj.id)
+        elif isinstance(obj, OrderItem):
+            purchased_ids.add(obj.book_id)
+        elif isinstance(obj, Order) and obj not in session.new:
+            # New orders come from checkout, which queues a refresh-related-books job
+            if obj in session.deleted or inspect(obj).attrs.status.history.has_changes():
+                order_ids.add(obj.id)
+
+    book_ids.discard(None)
+    purchased_ids.discard(None)
+    order_ids.discard(None)
+    _stash_changes(session, book_ids)
+    if purchased_ids or order_ids:
+        purchases = session.info.setdefault('related_books_purchases', (set(), set()))
+        purchases[0].update(purchased_ids)
+        purchases[1].update(order_ids)
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_deleted_categories(session, flush_context, instances):
+    # Read category members now: the flush removes the association rows
+    category_ids = [obj.id for obj in session.deleted if isinstance(obj, Category) and obj.id is not None]
+    if category_ids:
+        book_ids = session.connection().execute(
+            _in('SELECT book_id FROM book_categories WHERE category_id IN :ids'), {'ids': category_ids}
+        ).scalars()
+        _stash_changes(session, set(book_ids))
+
+
+def _stash_changes(session, book_ids):
+    if book_ids:
+        session.info.setdefault('related_books_changes', set()).update(book_ids)
+
+
+@event.listens_for(Session, 'after_commit')
+def _refresh_after_commit(session):
+    book_ids = session.info.pop('related_books_changes', None)
+    purchases = session.info.pop('related_books_purchases', None)
+    if not has_app_context():
+        return
+    app = current_app._get_current_object()
+    if book_ids:
+        _runner.submit(app, book_ids=book_ids)
+    if purchases:
+        _purchase_runner.submit(app, book_ids=purchases[0], order_ids=purchases[1])
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_related_changes(session):
+    session.info.pop('related_books_changes', None)
+    session.info.pop('related_books_purchases', None)
+
+
+def init_app(app):
+    """Register the related books CLI command"""
+
+    @app.cli.command('rebuild-related-books')
+    def rebuild_related_books_command():
+        """Recompute the related_books table for every book."""
+        count = rebuild_related_books()
+        print(f"✓ Stored {count} related book pairs")
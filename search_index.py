@@ -0,0 +1,198 @@
+import re
+
+from sqlalchemy import DDL, bindparam, event, text
+from sqlalchemy.orm import Session
+
+from models import db, Book, Category, SubCategory, book_categories, book_subcategories
+
+# FTS5 mirror of the books table. rowid is the book id; category and
+# subcategory names are denormalized so one MATCH covers everything /search
+# used to OR together with ilike.
+CREATE_SEARCH_INDEX_SQL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS books_fts USING fts5(
+    title,
+    author,
+    description,
+    categories,
+    subcategories,
+    prefix = '2 3',
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# bm25 column weights: title, author, description, categories, subcategories
+RANK_SQL = 'bm25(books_fts, 10.0, 5.0, 1.0, 3.0, 3.0)'
+
+SEARCH_PAGE_SIZE = 20
+
+_INDEX_ROWS_SQL = """
+INSERT INTO books_fts (rowid, title, author, description, categories, subcategories)
+SELECT b.id, b.title, b.author, COALESCE(b.description, ''),
+       COALESCE((SELECT group_concat(c.name, ' ')
+                 FROM book_categories bc JOIN categories c ON c.id = bc.category_id
+                 WHERE bc.book_id = b.id), ''),
+       COALESCE((SELECT group_concat(s.name, ' ')
+                 FROM book_subcategories bs JOIN subcategories s ON s.id = bs.subcategory_id
+                 WHERE bs.book_id = b.id), '')
+FROM books b
+WHERE b.is_deleted = 0
+"""
+
+# Create/drop the index alongside the books table (db.create_all / drop_all)
+event.listen(Book.__table__, 'after_create', DDL(CREATE_SEARCH_INDEX_SQL).execute_if(dialect='sqlite'))
+event.listen(Book.__table__, 'before_drop', DDL('DROP TABLE IF EXISTS books_fts').execute_if(dialect='sqlite'))
+
+
+def index_available(connection):
+    """Return True if the connected database has the FTS5 search index"""
+    if connection.dialect.name != 'sqlite':
+        return False
+    return connection.execute(
+        text("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'books_fts'")
+    ).first() is not None
+
+
+def reindex_books(connection, book_ids):
+    """Replace the index rows of the given books (deleted books are just removed)"""
+    book_ids = list(book_ids)
+    if not book_ids:
+        return
+    connection.execute(
+        text('DELETE FROM books_fts WHERE rowid IN :ids').bindparams(bindparam('ids', expanding=True)),
+        {'ids': book_ids}
+    )
+    connection.execute(
+        text(_INDEX_ROWS_SQL + ' AND b.id IN :ids').bindparams(bindparam('ids', expanding=True)),
+        {'ids': book_ids}
+    )
+
+
+def rebuild_search_index():
+    """Drop and repopulate the whole search index, returning the number of books indexed"""
+    with db.engine.begin() as conn:
+        conn.execute(text(CREATE_SEARCH_INDEX_SQL))
+        conn.execute(text('DELETE FROM books_fts'))
+        conn.execute(text(_INDEX_ROWS_SQL))
+        conn.execute(text("INSERT INTO books_fts (books_fts) VALUES ('optimize')"))
+        return conn.execute(text('SELECT COUNT(*) FROM books_fts')).scalar()
+
+
+# --- Keep the index in sync with ORM writes ---
+
+def _affected_book_ids(session):
+    """Collect ids of books whose indexed text may change in this flush"""
+    book_ids = set()
+    category_ids = set()
+    subcategory_ids = set()
+
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Book):
+            if obj.id is not None:
+                book_ids.add(obj.id)
+            else:
+                session.info.setdefault('search_index_new_books', set()).add(obj)
+        elif isinstance(obj, Category) and obj.id is not None:
+            category_ids.add(obj.id)
+        elif isinstance(obj, SubCategory) and obj.id is not None:
+            subcategory_ids.add(obj.id)
+            if obj.category_id is not None:
+                category_ids.add(obj.category_id)
+
+    # Read association rows now: deleting a category removes them during the flush
+    connection = session.connection()
+    if category_ids:
+        book_ids.update(connection.execute(
+            book_categories.select().with_only_columns(book_categories.c.book_id)
+            .where(book_categories.c.category_id.in_(category_ids))
+        ).scalars())
+    if subcategory_ids:
+        book_ids.update(connection.execute(
+            book_subcategories.select().with_only_columns(book_subcategories.c.book_id)
+            .where(book_subcategories.c.subcategory_id.in_(subcategory_ids))
+        ).scalars())
+    return book_ids
+
+
+@event.listens_for(Session, 'before_flush')
+def _collect_search_index_changes(session, flush_context, instances):
+    if not any(isinstance(obj, (Book, Category, SubCategory))
+               for obj in list(session.new) + list(session.dirty) + list(session.deleted)):
+        return
+    if not index_available(session.connection()):
+        return
+    session.info.setdefault('search_index_book_ids', set()).update(_affected_book_ids(session))
+
+
+@event.listens_for(Session, 'after_flush')
+def _apply_search_index_changes(session, flush_context):
+    book_ids = session.info.pop('search_index_book_ids', set())
+    new_books = session.info.pop('search_index_new_books', set())
+    book_ids.update(book.id for book in new_books if book.id is not None)
+    if book_ids:
+        reindex_books(session.connection(), book_ids)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_search_index_changes(session):
+    session.info.pop('search_index_book_ids', None)
+    session.info.pop('search_index_new_books', None)
+
+
+# --- Queries ---
+
+def match_expression(query):
+    """Turn free text into an FTS5 prefix query, e.g. 'hc verm' -> '"hc"* AND "verm"*'"""
+    tokens = re.findall(r'\w+', query.lower())
+    if not tokens:
+        return None
+    return ' AND '.join(f'"{token}"*' for token in tokens)
+
+
+def search_book_ids(query, page=1, per_page=SEARCH_PAGE_SIZE):
+    """Return (book_ids, has_more) for one BM25-ranked page of search results"""
+    if not query.strip():
+        return [], False
+
+    # FTS5 only sees word characters: queries with none, like '++', fall back to
+    # substring matching
+    expression = match_expression(query)
+    connection = db.session.connection()
+    if not expression or not index_available(connection):
+        return _search_book_ids_like(query, page, per_page)
+
+    rows = connection.execute(text(f"""
+        SELECT books_fts.rowid
+        FROM books_fts
+        WHERE books_fts MATCH :expression
+        ORDER BY {RANK_SQL}
+        LIMIT :limit OFFSET :offset
+    """), {'expression': expression, 'limit': per_page + 1, 'offset': (page - 1) * per_page}).scalars().all()
+    return rows[:per_page], len(rows) > per_page
+
+
+def _search_book_ids_like(query, page, per_page):
+    """Unranked substring search for databases without the FTS5 index, or queries it cannot match"""
+    pattern = f"%{query}%"
+    ids = [b.id for b in Book.query.with_entities(Book.id)
+           .filter(Book.is_deleted == False)
+           .filter(db.or_(
+               Book.title.ilike(pattern),
+               Book.author.ilike(pattern),
+               Book.description.ilike(pattern),
+               Book.categories.any(Category.name.ilike(pattern)),
+               Book.subcategories.any(SubCategory.name.ilike(pattern))
+           ))
+           .order_by(Book.id)
+           .offset((page - 1) * per_page)
+           .limit(per_page + 1)]
+    return ids[:per_page], len(ids) > per_page
+
+
+def init_app(app):
+    """Register the search index CLI command"""
+
+    @app.cli.command('rebuild-search-index')
+    def rebuild_search_index_command():
+        """Rebuild the full-text search index from the books table."""
+        count = rebuild_search_index()
+        print(f"✓ Indexed {count} books into books_fts")
@@ -0,0 +1,194 @@
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from flask import has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+# Slow-query log. Every SQL statement that takes THRESHOLD_MS or longer is
+# recorded with its parameters (personal data redacted), the route that ran
+# it and SQLite's EXPLAIN QUERY PLAN, in a SQLite file of its own
+# (SLOW_QUERY_PATH or instance/slow_queries.db) that keeps the latest
+# KEEP_ENTRIES entries. /admin/slow-queries ranks the statements by total time.
+
+THRESHOLD_MS = 100
+KEEP_ENTRIES = 5000
+# Values of parameters bound to these columns are never stored
+PII_FIELDS = {
+    'email', 'phone', 'password', 'password_hash', 'reset_token', 'otp', 'name', 'full_name',
+    'address', 'street_address', 'city', 'state', 'pincode', 'payload', 'customer_info',
+    'review_text', 'message',
+}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS slow_queries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    recorded_at REAL NOT NULL,
+    duration_ms REAL NOT NULL,
+    fingerprint TEXT NOT NULL,
+    statement TEXT NOT NULL,
+    parameters TEXT NOT NULL,
+    route TEXT NOT NULL,
+    plan TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_slow_queries_fingerprint ON slow_queries (fingerprint);
+"""
+
+_EMAIL = re.compile(r'[^@\s]+@[^@\s]+\.\w+')
+_PHONE = re.compile(r'\+?\d[\d\s-]{6,}\d')
+_EXPANDED_IN = re.compile(r'\bIN \(\?(?:, \?)+\)', re.IGNORECASE)
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_local = threading.local()
+_state = {'path': None, 'logger': None}
+
+
+def _connection():
+    path = _state['path']
+    conn = getattr(_local, 'conn', None)
+    # A connection must not cross a fork (gunicorn --preload) or a path change
+    if conn is None or _local.pid != os.getpid() or _local.path != path:
+        os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        conn = sqlite3.connect(path, timeout=5, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.executescript(_SCHEMA)
+        _local.conn, _local.pid, _local.path = conn, os.getpid(), path
+    return conn
+
+
+def fingerprint(statement):
+    """One key for a statement whatever the size of its expanded IN lists"""
+    return _EXPANDED_IN.sub('IN (?, ...)', ' '.join(statement.split()))
+
+
+def _redact_value(value):
+    if isinstance(value, str):
+        return _PHONE.sub('<redacted>', _EMAIL.sub('<redacted>', value))[:200]
+    if isinstance(value, bytes):
+        return f'<{len(value)} bytes>'
+    return value
+
+
+def redact(names, row):
+    """Parameter values safe to store: PII columns and unnamed strings are hidden"""
+    row = list(row.values()) if isinstance(row, dict) else list(row)
+    if names is None or len(names) != len(row):
+        # Batched inserts renumber their parameters: without names hide every string
+        return ['<redacted>' if isinstance(value, (str, bytes)) else value for value in row]
+    redacted = []
+    for name, value in zip(names, row):
+        column = re.sub(r'_\d+$', '', name)
+        redacted.append('<redacted>' if column in PII_FIELDS and value is not None else _redact_value(value))
+    return redacted
+
+
+def _query_plan(cursor, statement, parameters):
+    if not statement.lstrip().upper().startswith(_EXPLAINABLE):
+        return ''
+    try:
+        rows = cursor.connection.execute(f'EXPLAIN QUERY PLAN {statement}', parameters).fetchall()
+    except sqlite3.Error as e:
+        return f'(no plan: {e})'
+    depth = {0: -1}
+    lines = []
+    for node_id, parent, _, detail in rows:
+        depth[node_id] = depth.get(parent, -1) + 1
+        lines.append('  ' * depth[node_id] + detail)
+    return '\n'.join(lines)
+
+
+def _route():
+    if has_request_context():
+        return f'{request.method} {request.endpoint or request.path}'
+    return '<background>'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _start_timer(conn, cursor, statement, parameters, context, executemany):
+    if _state['path'] is not None:
+        conn.info.setdefault('slow_query_start', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _record_if_slow(conn, cursor, statement, parameters, context, executemany):
+    starts = conn.info.get('slow_query_start')
+    if not starts:
+        return
+    duration_ms = (time.perf_counter() - starts.pop()) * 1000
+    if THRESHOLD_MS is None or duration_ms < THRESHOLD_MS:
+        return
+
+    compiled = getattr(context, 'compiled', None)
+    names = getattr(compiled, 'positiontup', None)
+    first = parameters[0] if executemany and parameters else parameters
+    stored = redact(names, first or ())
+    if executemany:
+        stored = {'first_row': stored, 'rows': len(parameters)}
+    plan = _query_plan(cursor, statement, first or ()) if conn.dialect.name == 'sqlite' else ''
+    try:
+        record(duration_ms, statement, stored, _route(), plan)
+    except sqlite3.Error as e:
+        _state['logger'].warning('Could not record slow query: %s', e)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _discard_timer(context):
+    # A failed statement never reaches after_cursor_execute: drop its start time
+    starts = context.connection.info.get('slow_query_start') if context.connection is not None else None
+    if starts:
+        starts.pop()
+
+
+def record(duration_ms, statement, parameters, route, plan):
+    conn = _connection()
+    cursor = conn.execute(
+        'INSERT INTO slow_queries (recorded_at, duration_ms, fingerprint, statement, parameters, route, plan) '
+        'VALUES (?, ?, ?, ?, ?, ?, ?)',
+        (time.time(), round(duration_ms, 2), fingerprint(statement), statement,
+         json.dumps(parameters, default=str), route, plan)
+    )
+    _state['logger'].warning('Slow query (%.0f ms) in %s: %s', duration_ms, route, fingerprint(statement)[:160])
+    # Rotate: keep the latest KEEP_ENTRIES entries
+    if cursor.lastrowid % 100 == 0:
+        conn.execute('DELETE FROM slow_queries WHERE id <= ?', (cursor.lastrowid - KEEP_ENTRIES,))
+
+
+def ranking(limit=50):
+    """Statements by total time spent in their slow runs, with the latest run's details"""
+    rows = _connection().execute("""
+        SELECT s.fingerprint, s.calls, s.total_ms, s.avg_ms, s.max_ms, s.routes,
+               latest.parameters, latest.plan, latest.recorded_at
+        FROM (
+            SELECT fingerprint, COUNT(*) AS calls, SUM(duration_ms) AS total_ms,
+                   AVG(duration_ms) AS avg_ms, MAX(duration_ms) AS max_ms,
+                   GROUP_CONCAT(DISTINCT route) AS routes, MAX(id) AS latest_id
+            FROM slow_queries GROUP BY fingerprint
+        ) AS s
+        JOIN slow_queries AS latest ON latest.id = s.latest_id
+        ORDER BY s.total_ms DESC
+        LIMIT ?
+    """, (limit,)).fetchall()
+    keys = ('statement', 'calls', 'total_ms', 'avg_ms', 'max_ms', 'routes', 'parameters', 'plan', 'last_seen')
+    return [dict(zip(keys, row)) for row in rows]
+
+
+def clear():
+    _connection().execute('DELETE FROM slow_queries')
+
+
+def init_app(app):
+    """Record slow queries of app and register the slow-query CLI command"""
+    global THRESHOLD_MS
+    THRESHOLD_MS = app.config.get('SLOW_QUERY_MS', THRESHOLD_MS)
+    _state['path'] = app.config.get('SLOW_QUERY_PATH') or os.path.join(app.instance_path, 'slow_queries.db')
+    _state['logger'] = app.logger
+
+    @app.cli.command('clear-slow-queries')
+    def clear_slow_queries_command():
+        """Empty the slow-query log."""
+        clear()
+        print("✓ Slow-query log cleared")
@@ -0,0 +1,406 @@
+import bisect
+import os
+import re
+import threading
+import time
+
+from flask import current_app, has_app_context
+from sqlalchemy import event, func, inspect, select
+from sqlalchemy.orm import Session
+
+from models import db, Book, Category, SubCategory, book_categories, book_subcategories
+
+# Suggestion groups, in the order they are returned to the search box
+GROUPS = ('books', 'author', 'category', 'subcategory')
+
+MAX_KEY_LENGTH = 64
+# How often a worker checks whether another worker changed the catalog
+CHANGE_CHECK_INTERVAL = 1.0
+# The shared change log starts over past this size (workers then rebuild once)
+MAX_CHANGE_LOG_BYTES = 1 << 20
+
+
+def normalize(value):
+    """Lowercase and collapse whitespace so keys compare consistently"""
+    return ' '.join((value or '').lower().split())
+
+
+def word_keys(text):
+    """One key per word start: the rest of the text from that word on"""
+    normalized = normalize(text)
+    return [normalized[match.start():match.start() + MAX_KEY_LENGTH] for match in re.finditer(r'\w+', normalized)]
+
+
+class PrefixIndex:
+    """In-memory autocomplete index kept as a sorted array searched with bisect.
+
+    Every word start of an entry's text becomes a key, so 'phys' finds
+    'Concepts of Physics'. Entries are (group, item_id) pairs ranked by a
+    popularity score; results for a prefix are memoized until the next update.
+    """
+
+    def __init__(self):
+        self._keys = []          # sorted [(key, entry_id)]
+        self._entries = {}       # entry_id -> (text, popularity)
+        self._entry_keys = {}    # entry_id -> [key, ...]
+        self._books = {}         # book_id -> (title, author, popularity)
+        self._authors = {}       # normalized author -> {book_id: popularity}
+        self._author_names = {}  # normalized author -> display name
+        self._results = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    # --- Mutations (callers hold no lock; each method takes it) ---
+
+    def _put(self, entry_id, text, popularity):
+        self._drop(entry_id)
+        keys = word_keys(text)
+        for key in keys:
+            bisect.insort(self._keys, (key, entry_id))
+        self._entries[entry_id] = (text, popularity)
+        self._entry_keys[entry_id] = keys
+
+    def _drop(self, entry_id):
+        for key in self._entry_keys.pop(entry_id, ()):
+            i = bisect.bisect_left(self._keys, (key, entry_id))
+            if i < len(self._keys) and self._keys[i] == (key, entry_id):
+                del self._keys[i]
+        self._entries.pop(entry_id, None)
+
+    def _refresh_author(self, author_key):
+        entry_id = ('author', author_key)
+        books = self._authors.get(author_key)
+        if books:
+            self._put(entry_id, self._author_names[author_key], sum(books.values()))
+        else:
+            self._authors.pop(author_key, None)
+            self._author_names.pop(author_key, None)
+            self._drop(entry_id)
+
+    def load(self, books, terms):
+        """Fill an empty index at once, sorting the keys a single time.
+
+        books are (book_id, title, author, popularity) rows and terms
+        (group, item_id, text, popularity) rows.
+        """
+        entries = []
+        with self._lock:
+            for book_id, title, author, popularity in books:
+                self._books[book_id] = (title, author, popularity)
+                entries.append((('books', book_id), title, popularity))
+                if author:
+                    author_key = normalize(author)
+                    self._authors.setdefault(author_key, {})[book_id] = popularity
+                    self._author_names.setdefault(author_key, author)
+            entries.extend((('author', author_key), self._author_names[author_key], sum(books.values()))
+                           for author_key, books in self._authors.items())
+            entries.extend(((group, item_id), text, popularity) for group, item_id, text, popularity in terms)
+
+            pairs = []
+            for entry_id, text, popularity in entries:
+                keys = word_keys(text)
+                pairs.extend((key, entry_id) for key in keys)
+                self._entries[entry_id] = (text, popularity)
+                self._entry_keys[entry_id] = keys
+            pairs.sort()
+            self._keys = pairs
+            self._results.clear()
+
+    def put_book(self, book_id, title, author, popularity):
+        with self._lock:
+            self._remove_book(book_id)
+            self._books[book_id] = (title, author, popularity)
+            self._put(('books', book_id), title, popularity)
+            if author:
+                author_key = normalize(author)
+                self._authors.setdefault(author_key, {})[book_id] = popularity
+                self._author_names.setdefault(author_key, author)
+                self._refresh_author(author_key)
+            self._results.clear()
+
+    def remove_book(self, book_id):
+        with self._lock:
+            self._remove_book(book_id)
+            self._results.clear()
+
+    def _remove_book(self, book_id):
+        previous = self._books.pop(book_id, None)
+        if previous is None:
+            return
+        self._drop(('books', book_id))
+        author_key = normalize(previous[1])
+        self._authors.get(author_key, {}).pop(book_id, None)
+        self._refresh_author(author_key)
+
+    def put_term(self, group, item_id, text, popularity=None):
+        """Add or replace a category or subcategory entry, keeping its popularity if known"""
+        with self._lock:
+            if popularity is None:
+                popularity = self._entries.get((group, item_id), (None, 0))[1]
+            self._put((group, item_id), text, popularity)
+            self._results.clear()
+
+    def remove_term(self, group, item_id):
+        with self._lock:
+            self._drop((group, item_id))
+            self._results.clear()
+
+    # --- Queries ---
+
+    def suggest(self, prefix, limit=5):
+        """Return {group: [(text, item_id), ...]} for entries with a word starting with prefix"""
+        prefix = normalize(prefix)
+        with self._lock:
+            cached = self._results.get((prefix, limit))
+            if cached is not None:
+                return cached
+
+            matched = {}
+            i = bisect.bisect_left(self._keys, (prefix,))
+            keys = self._keys
+            while i < len(keys) and keys[i][0].startswith(prefix):
+                entry_id = keys[i][1]
+                matched[entry_id] = self._entries[entry_id]
+                i += 1
+
+            results = {group: [] for group in GROUPS}
+            ranked = sorted(matched.items(), key=lambda item: (-item[1][1], item[1][0]))
+            for (group, item_id), (text, _) in ranked:
+                if len(results[group]) < limit:
+                    results[group].append((text, 0 if group == 'author' else item_id))
+
+            self._results[(prefix, limit)] = results
+            return results
+
+
+# Per-worker index state. Workers tell each other which books and terms
+# changed through an append-only log in the instance folder; each worker
+# remembers how far it has read and reloads just those rows.
+_index = None
+_log_position = None     # (inode, offset) of the change log read so far
+_last_change_check = 0.0
+
+
+def _change_log_path():
+    return (current_app.config.get('SUGGEST_CHANGES_PATH')
+            or os.path.join(current_app.instance_path, 'suggest_index.changes'))
+
+
+def _log_end():
+    try:
+        stat = os.stat(_change_log_path())
+    except OSError:
+        return (None, 0)
+    return (stat.st_ino, stat.st_size)
+
+
+def _publish(changes):
+    """Append the (kind, id) pairs another worker must reload to the change log"""
+    path = _change_log_path()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    with open(path, 'a') as f:
+        f.write(''.join(f'{kind} {item_id}\n' for kind, item_id in changes))
+        size = f.tell()
+    if size > MAX_CHANGE_LOG_BYTES:
+        # A new file: every worker sees the inode change and rebuilds once
+        fresh = f'{path}.{os.getpid()}'
+        open(fresh, 'w').close()
+        os.replace(fresh, path)
+
+
+# kind -> (model, association table, its term column)
+_TERMS = {
+    'category': (Category, book_categories, book_categories.c.category_id),
+    'subcategory': (SubCategory, book_subcategories, book_subcategories.c.subcategory_id),
+}
+
+
+def _term_rows(kind):
+    """(id, name, number of live books) of every category or subcategory"""
+    model, members, term_id = _TERMS[kind]
+    return select(model.id, model.name, func.count(Book.id))\
+        .outerjoin(members, term_id == model.id)\
+        .outerjoin(Book, (Book.id == members.c.book_id) & (Book.is_deleted == False))\
+        .group_by(model.id)
+
+
+def _load_rows(connection, kind, ids):
+    ids = list(ids)
+    if kind == 'book':
+        return connection.execute(select(Book.id, Book.title, Book.author, Book.review_count)
+                                  .where(Book.id.in_(ids), Book.is_deleted == False)).all()
+    model = _TERMS[kind][0]
+    return connection.execute(_term_rows(kind).where(model.id.in_(ids))).all()
+
+
+def _reload(index, changed):
+    """Bring the given {kind: ids} up to date from the database"""
+    for kind, ids in changed.items():
+        rows = _load_rows(db.session.connection(), kind, ids)
+        if kind == 'book':
+            for book_id, title, author, review_count in rows:
+                index.put_book(book_id, title, author, review_count or 0)
+            for book_id in set(ids) - {row[0] for row in rows}:
+                index.remove_book(book_id)
+        else:
+            for item_id, name, book_count in rows:
+                index.put_term(kind, item_id, name, book_count)
+            for item_id in set(ids) - {row[0] for row in rows}:
+                index.remove_term(kind, item_id)
+
+
+def build_index():
+    """Load every suggestion source from the database into a fresh index"""
+    global _index, _log_position, _last_change_check
+    # Changes logged while loading are replayed afterwards, so note the position first
+    position = _log_end()
+    index = PrefixIndex()
+
+    books = db.session.query(
+        Book.id, Book.title, Book.author, Book.review_count
+    ).filter(Book.is_deleted == False).all()
+
+    connection = db.session.connection()
+    index.load(
+        ((book_id, title, author, review_count or 0) for book_id, title, author, review_count in books),
+        [(kind, *row) for kind in _TERMS for row in connection.execute(_term_rows(kind))],
+    )
+
+    _index = index
+    _log_position = position
+    _last_change_check = time.monotonic()
+    return index
+
+
+def _apply_logged_changes():
+    """Reload what other workers changed since the last check; False if a rebuild is needed"""
+    global _log_position
+    inode, offset = _log_position
+    end_inode, end = _log_end()
+    if inode is None:
+        # No log when the index was built: everything in it is new
+        inode = end_inode
+    if end_inode != inode or end < offset:
+        # The log started over
+        return False
+    if end == offset:
+        return True
+    with open(_change_log_path(), 'rb') as f:
+        f.seek(offset)
+        data = f.read(end - offset)
+    # A line being appended right now is read on the next check
+    data = data[:data.rfind(b'\n') + 1]
+    changed = {}
+    for line in data.decode().splitlines():
+        kind, item_id = line.split()
+        changed.setdefault(kind, set()).add(int(item_id))
+    _reload(_index, changed)
+    _log_position = (inode, offset + len(data))
+    return True
+
+
+def get_index():
+    """Return this worker's index, applying catalog changes other workers logged"""
+    global _last_change_check
+    if _index is None:
+        return build_index()
+
+    now = time.monotonic()
+    if now - _last_change_check >= CHANGE_CHECK_INTERVAL:
+        _last_change_check = now
+        if not _apply_logged_changes():
+            return build_index()
+    return _index
+
+
+def suggest(prefix, limit=5):
+    return get_index().suggest(prefix, limit=limit)
+
+
+# --- Incremental updates from ORM writes ---
+
+def reload_books(session, book_ids):
+    """Refresh books on commit whose suggestion fields were changed by SQL the ORM did not see"""
+    book_ids = set(book_ids)
+    if not book_ids:
+        return
+    rows = _load_rows(session.connection(), 'book', book_ids)
+    changes = session.info.setdefault('suggest_index_reloads', [])
+    changes.extend(('put_book', book_id, title, author, review_count or 0)
+                   for book_id, title, author, review_count in rows)
+    changes.extend(('remove_book', book_id) for book_id in book_ids - {row[0] for row in rows})
+
+
+def _changed_term_ids(session, book):
+    """{kind: ids} of the terms whose live book count may change with this book's flush"""
+    state = inspect(book)
+    if not (state.deleted or book in session.new or state.attrs.is_deleted.history.has_changes()
+            or any(state.attrs[attr].history.has_changes() for attr in ('categories', 'subcategories'))):
+        return {}
+    changed = {}
+    for kind, attr in (('category', 'categories'), ('subcategory', 'subcategories')):
+        if attr in state.dict:
+            # Old and new members: the collection is loaded or was just changed
+            changed[kind] = {term.id for term in state.attrs[attr].history.sum() if term.id is not None}
+        else:
+            members, term_id = _TERMS[kind][1:]
+            changed[kind] = set(session.connection().execute(
+                select(term_id).where(members.c.book_id == book.id)).scalars())
+    return changed
+
+
+@event.listens_for(Session, 'after_flush')
+def _snapshot_suggestion_changes(session, flush_context):
+    changes = session.info.setdefault('suggest_index_changes', [])
+    recount = {}
+    for obj in session.deleted:
+        if isinstance(obj, Book):
+            changes.append(('remove_book', obj.id))
+        elif isinstance(obj, Category):
+            changes.append(('remove_term', 'category', obj.id))
+        elif isinstance(obj, SubCategory):
+            changes.append(('remove_term', 'subcategory', obj.id))
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Book):
+            if obj.is_deleted:
+                changes.append(('remove_book', obj.id))
+            else:
+                changes.append(('put_book', obj.id, obj.title, obj.author, obj.review_count or 0))
+        elif isinstance(obj, Category):
+            changes.append(('put_term', 'category', obj.id, obj.name))
+        elif isinstance(obj, SubCategory):
+            changes.append(('put_term', 'subcategory', obj.id, obj.name))
+
+    # Books added, removed or moved change their terms' book counts
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        if isinstance(obj, Book):
+            for kind, ids in _changed_term_ids(session, obj).items():
+                recount.setdefault(kind, set()).update(ids)
+    for kind, ids in recount.items():
+        if ids:
+            changes.extend(('put_term', kind, *row) for row in _load_rows(session.connection(), kind, ids))
+    if not changes:
+        session.info.pop('suggest_index_changes')
+
+
+@event.listens_for(Session, 'after_commit')
+def _apply_suggestion_changes(session):
+    changes = session.info.pop('suggest_index_changes', []) + session.info.pop('suggest_index_reloads', [])
+    if not changes or not has_app_context():
+        return
+    # This worker sees its own writes at once; the others reload the ids from the log
+    if _index is not None:
+        for change in changes:
+            getattr(_index, change[0])(*change[1:])
+    kinds = {'remove_book': 'book', 'put_book': 'book'}
+    _publish(dict.fromkeys(
+        (kinds[change[0]], change[1]) if change[0] in kinds else (change[1], change[2]) for change in changes
+    ))
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_suggestion_changes(session):
+    session.info.pop('suggest_index_changes', None)
+    session.info.pop('suggest_index_reloads', None)
@@ -0,0 +1,79 @@
+#!/usr/bin/env python3
+"""
+Test script to verify book_detail runs a fixed number of queries and caches
+the purchase/review flags per user and book
+"""
+
+from app import app, db
+from models import Book, BookReview, BundleOffer, Order, OrderItem, User
+from test_catalog_queries import count_queries, seed_books
+
+
+def seed_book_page(review_count):
+    """Book 1 with review_count reviews, two bundles and a buyer; returns the buyer's id"""
+    seed_books(6)
+    with app.app_context():
+        buyer = User(email='buyer@example.com', phone='7000000000', password_hash='x')
+        reviewers = [User(email=f'reader{i}@example.com', phone=f'71{i:08d}', password_hash='x')
+                     for i in range(review_count)]
+        db.session.add_all([buyer] + reviewers)
+        db.session.flush()
+
+        books = [db.session.get(Book, i) for i in range(1, 7)]
+        for i, reviewer in enumerate(reviewers):
+            db.session.add(BookReview(book_id=1, user_id=reviewer.id, rating=1 + i % 5, review_text='Good'))
+        for size in (2, 5):
+            bundle = BundleOffer(title=f'Pack of {size}', mrp=0, selling_price=100)
+            bundle.books = books[:size]
+            db.session.add(bundle)
+
+        order = Order(user_id=buyer.id, status='completed', total_amount=100)
+        order.items = [OrderItem(book_id=1, price=100)]
+        db.session.add(order)
+        db.session.commit()
+        return buyer.id
+
+
+def book_page_queries(client):
+    with count_queries() as statements:
+        response = client.get('/book/1')
+    assert response.status_code == 200
+    return len(statements), response
+
+
+def test_book_detail_query_count_is_fixed():
+    """More reviews and bundle books must not add queries"""
+    counts = []
+    for review_count in (1, 8):
+        buyer_id = seed_book_page(review_count)
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = buyer_id
+            book_page_queries(client)   # fills the flags cache
+            count, response = book_page_queries(client)
+            assert b'Submit Review' in response.data
+            counts.append(count)
+    print(f"   book_detail: {counts[0]} queries with 1 review, {counts[1]} with 8")
+    assert counts[0] == counts[1]
+
+
+def test_user_book_flags_invalidated_by_review():
+    """Writing a review clears the cached 'can review' flag"""
+    buyer_id = seed_book_page(1)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = buyer_id
+        _, response = book_page_queries(client)
+        assert b'Submit Review' in response.data
+
+        with app.app_context():
+            db.session.add(BookReview(book_id=1, user_id=buyer_id, rating=5))
+            db.session.commit()
+
+        _, response = book_page_queries(client)
+        assert b'You have already reviewed this book' in response.data
+
+
+if __name__ == "__main__":
+    test_book_detail_query_count_is_fixed()
+    test_user_book_flags_invalidated_by_review()
@@ -0,0 +1,33 @@
+#!/usr/bin/env python3
+"""
+Test script to verify /books facet counts come from one query and respect the filters
+"""
+
+from app import app
+from test_catalog_queries import count_queries, seed_books
+
+
+def test_facets_single_query_and_counts():
+    """Facets run one SQL statement and each facet ignores only its own filter"""
+    seed_books(30)
+
+    with app.test_client() as client:
+        with count_queries() as statements:
+            data = client.get('/books/facets?category=Category 1').get_json()
+        print(f"   Facets ran {len(statements)} queries")
+        assert len(statements) == 1
+
+        # The category facet still lists every category
+        assert [c['count'] for c in data['categories']] == [10, 10, 10]
+        # Other facets are narrowed by the category filter
+        assert data['subcategories'] == [{'name': 'Subject 1', 'count': 10}]
+        assert sum(b['count'] for b in data['price_buckets']) == 10
+
+        # A repeat request for the same (normalized) filters is served from cache
+        with count_queries() as statements:
+            client.get('/books/facets?category=category 1 ')
+        assert statements == []
+
+
+if __name__ == "__main__":
+    test_facets_single_query_and_counts()
@@ -0,0 +1,136 @@
+#!/usr/bin/env python3
+"""
+Test script to verify book reviews are paged newest-first and the detail
+header renders from the stored rating histogram
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+from sqlalchemy import inspect, text
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import Book, BookReview, Order, OrderItem, User
+import catalog
+import database_migration
+from test_catalog_queries import seed_books
+
+
+def seed_reviews(count):
+    """Book 1 with `count` reviews, one minute apart; returns their ids newest first"""
+    seed_books(1)
+    with app.app_context():
+        users = [User(email=f'reader{i}@example.com', phone=f'72{i:08d}', password_hash='x') for i in range(count)]
+        db.session.add_all(users)
+        db.session.flush()
+        start = datetime(2024, 1, 1)
+        # Two reviews share each timestamp so the id breaks ties
+        reviews = [BookReview(book_id=1, user_id=user.id, rating=1 + i % 5, review_text=f'Review {i}',
+                              created_at=start + timedelta(minutes=i // 2))
+                   for i, user in enumerate(users)]
+        db.session.add_all(reviews)
+        db.session.commit()
+        return [r.id for r in sorted(reviews, key=lambda r: (r.created_at, r.id), reverse=True)]
+
+
+def test_reviews_are_keyset_paged():
+    """Following next_cursor visits every review once, newest first"""
+    expected = seed_reviews(catalog.REVIEWS_PAGE_SIZE * 2 + 3)
+
+    with app.test_client() as client:
+        response = client.get('/book/1')
+        assert response.status_code == 200
+        assert b'Load more reviews' in response.data
+        assert response.data.count(b'>Review ') == catalog.REVIEWS_PAGE_SIZE
+
+        with app.app_context():
+            first = catalog.review_page(1)
+        seen = [review.id for review in first['reviews']]
+        cursor = first['next_cursor']
+        while cursor:
+            data = client.get(f'/book/1/reviews?after={cursor}').get_json()
+            assert data['success']
+            seen.extend(review['id'] for review in data['reviews'])
+            cursor = data['next_cursor']
+
+    assert seen == expected
+
+
+def test_migration_requires_review_timestamps():
+    """Step 15 dates NULL reviews at the reviewer's purchase and makes created_at NOT NULL"""
+    expected = seed_reviews(catalog.REVIEWS_PAGE_SIZE + 2)
+    with app.app_context():
+        undated, bought = expected[0], expected[1]
+        order = Order(user_id=db.session.get(BookReview, bought).user_id, status='completed',
+                      total_amount=100, date_created=datetime(2023, 6, 1))
+        order.items = [OrderItem(book_id=1, price=100)]
+        db.session.add(order)
+        db.session.commit()
+
+        # The schema from before the migration, with created_at nullable
+        with db.engine.begin() as conn:
+            conn.execute(text('ALTER TABLE book_reviews RENAME TO book_reviews_old'))
+            conn.execute(text('DROP INDEX idx_book_reviews_book_created'))
+            conn.execute(text('CREATE TABLE book_reviews (id INTEGER PRIMARY KEY AUTOINCREMENT, '
+                              'book_id INTEGER NOT NULL, user_id INTEGER NOT NULL, rating INTEGER NOT NULL, '
+                              'review_text TEXT, created_at DATETIME)'))
+            conn.execute(text('INSERT INTO book_reviews SELECT * FROM book_reviews_old'))
+            conn.execute(text('DROP TABLE book_reviews_old'))
+            conn.execute(text('UPDATE book_reviews SET created_at = NULL WHERE id IN (:a, :b)'),
+                         {'a': undated, 'b': bought})
+
+        database_migration.require_review_timestamps()
+
+        columns = {col['name']: col for col in inspect(db.engine).get_columns('book_reviews')}
+        assert not columns['created_at']['nullable']
+        assert 'idx_book_reviews_book_created' in {i['name'] for i in inspect(db.engine).get_indexes('book_reviews')}
+        db.session.expire_all()
+        assert db.session.get(BookReview, bought).created_at == datetime(2023, 6, 1)
+        assert db.session.get(BookReview, undated).created_at > datetime(2024, 1, 1)
+        with pytest.raises(IntegrityError):
+            db.session.execute(text('INSERT INTO book_reviews (book_id, user_id, rating, created_at) '
+                                    'VALUES (1, 1, 5, NULL)'))
+        db.session.rollback()
+
+    expected = [undated] + [i for i in expected if i not in (undated, bought)] + [bought]
+    with app.test_client() as client:
+        seen, cursor = [], ''
+        while cursor is not None:
+            data = client.get(f'/book/1/reviews?after={cursor}').get_json()
+            seen.extend(review['id'] for review in data['reviews'])
+            cursor = data['next_cursor']
+    assert seen == expected
+
+
+def test_review_updates_stored_histogram():
+    """Adding a review updates the average, count and star histogram shown in the header"""
+    seed_books(1)
+    with app.app_context():
+        user = User(email='buyer@example.com', phone='7300000000', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        order = Order(user_id=user.id, status='completed', total_amount=100)
+        order.items = [OrderItem(book_id=1, price=100)]
+        db.session.add(order)
+        book = db.session.get(Book, 1)
+        book.avg_rating, book.review_count, book.rating_count_5 = 5.0, 1, 1
+        db.session.commit()
+        user_id = user.id
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        client.post('/book/1/review', data={'rating': '2', 'review_text': 'Not for me'})
+        response = client.get('/book/1')
+        assert b'3.5 (2 reviews)' in response.data
+
+    with app.app_context():
+        book = db.session.get(Book, 1)
+        assert [count for _, count, _ in book.rating_histogram] == [1, 0, 0, 1, 0]
+
+
+if __name__ == "__main__":
+    test_reviews_are_keyset_paged()
+    test_migration_requires_review_timestamps()
+    test_review_updates_stored_histogram()
@@ -0,0 +1,57 @@
+#!/usr/bin/env python3
+"""
+Test script to verify stored bundle savings follow price, soft-delete and membership changes
+"""
+
+from app import app, db
+from models import Book, BundleOffer
+from test_catalog_queries import count_queries, seed_books
+
+
+def test_bundle_savings_are_maintained():
+    """Stored totals match the member books after every kind of change"""
+    seed_books(3)   # original prices 150, 151, 152
+
+    with app.app_context():
+        books = [db.session.get(Book, i) for i in (1, 2, 3)]
+        bundle = BundleOffer(title='Starter Pack', mrp=0, selling_price=200)
+        bundle.books = books[:2]
+        db.session.add(bundle)
+        db.session.commit()
+
+        assert (bundle.total_mrp, bundle.book_count) == (301, 2)
+        assert bundle.savings_amount == 101
+        assert round(bundle.savings_percentage, 2) == round(101 * 100 / 301, 2)
+
+        # Price change of a member book
+        books[0].original_price = 250
+        db.session.commit()
+        assert bundle.total_mrp == 401
+
+        # Membership change
+        bundle.books.append(books[2])
+        db.session.commit()
+        assert (bundle.total_mrp, bundle.book_count) == (553, 3)
+
+        # Soft delete drops the book from the totals
+        books[1].is_deleted = True
+        db.session.commit()
+        assert (bundle.total_mrp, bundle.book_count) == (402, 2)
+
+        # Selling price above the total means no savings
+        bundle.selling_price = 500
+        db.session.commit()
+        assert (bundle.savings_amount, bundle.savings_percentage) == (0, 0)
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['admin_id'] = 1
+        with count_queries() as statements:
+            response = client.get('/admin/manage-bundles')
+        assert response.status_code == 200
+        assert b'2 books' in response.data
+        assert not any('bundle_books' in s for s in statements), 'bundle list should not load member books'
+
+
+if __name__ == "__main__":
+    test_bundle_savings_are_maintained()
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the server-side cart: the cookie only carries a cart id,
+items are hydrated with current prices, anonymous carts merge at login and the
+storage backend is pluggable
+"""
+
+from flask import session
+
+from app import app, db
+from models import Book, BundleOffer, User
+import cart_store
+from test_catalog_queries import seed_books
+
+
+class MemoryCartBackend(cart_store.CartBackend):
+    """Minimal key-value backend used to check CART_BACKEND"""
+
+    def __init__(self, app):
+        self.carts = {}
+
+    def load(self, cart_id):
+        return self.carts.get(cart_id)
+
+    def save(self, cart_id, lines):
+        self.carts[cart_id] = lines
+
+    def delete(self, cart_id):
+        self.carts.pop(cart_id, None)
+
+
+def seed_cart_catalog():
+    seed_books(6)
+    with app.app_context():
+        books = [db.session.get(Book, i) for i in range(1, 6)]
+        bundle = BundleOffer(title='Big Pack', mrp=0, selling_price=300)
+        bundle.books = books
+        user = User(email='shopper@example.com', phone='7700000000', password_hash='x')
+        db.session.add_all([bundle, user])
+        db.session.commit()
+        return bundle.id
+
+
+def session_cookie(client):
+    """Decode the signed session cookie"""
+    cookie = client.get_cookie('session')
+    return app.session_interface.get_signing_serializer(app).loads(cookie.value) if cookie else {}
+
+
+def test_cart_lines_live_server_side():
+    """Items added anonymously are stored by id and survive login"""
+    bundle_id = seed_cart_catalog()
+
+    with app.test_client() as client:
+        client.get('/cart/add/1')
+        client.get('/cart/add/1')
+        client.get('/cart/add/2')
+        client.get(f'/cart/add-bundle/{bundle_id}')
+        cookie = session_cookie(client)
+        assert set(cookie) - {'_flashes'} == {'cart_id'}, 'cart contents leaked into the cookie'
+
+        response = client.get('/cart')
+        assert b'Book 000' in response.data and b'Big Pack' in response.data
+        with client.session_transaction() as sess:
+            anon_id = sess['cart_id']
+
+        # Prices are hydrated at render time
+        with app.app_context():
+            db.session.get(Book, 2).price = 999
+            db.session.commit()
+        assert b'999.00' in client.get('/cart').data
+
+        # What /login does once the password checks out
+        with app.test_request_context():
+            session['cart_id'] = anon_id
+            cart_store.merge_anonymous_cart(1)
+            assert 'cart_id' not in session
+            store = cart_store.backend()
+            assert store.load(f'anon:{anon_id}') is None
+            user_lines = store.load('user:1')
+        assert user_lines == [['book', 1, 2], ['book', 2, 1], ['bundle', bundle_id, 1]]
+
+        with client.session_transaction() as sess:
+            sess.pop('cart_id')
+            sess['user_id'] = 1
+        client.get('/cart/remove/book/2')
+        client.get('/buy/3')
+        with app.test_request_context():
+            assert cart_store.backend().load('user:1') == [['book', 3, 1]]
+
+
+def test_old_cookie_cart_and_custom_backend():
+    """A cookie cart from before the upgrade is moved into the configured backend"""
+    seed_cart_catalog()
+    app.config['CART_BACKEND'] = 'test_cart_store:MemoryCartBackend'
+    app.extensions.pop('cart_store', None)
+    try:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['cart'] = [{'id': 4, 'title': 'Old title', 'price': 1, 'quantity': 2}]
+            response = client.get('/cart')
+            assert b'Book 003' in response.data and b'Old title' not in response.data
+            with client.session_transaction() as sess:
+                assert 'cart' not in sess
+                cart_id = f"anon:{sess['cart_id']}"
+            with app.app_context():
+                store = cart_store.backend()
+            assert isinstance(store, MemoryCartBackend)
+            assert store.carts[cart_id] == [['book', 4, 2]]
+    finally:
+        app.config['CART_BACKEND'] = None
+        app.extensions.pop('cart_store', None)
+
+
+if __name__ == "__main__":
+    test_cart_lines_live_server_side()
+    test_old_cookie_cart_and_custom_backend()
@@ -0,0 +1,95 @@
+#!/usr/bin/env python3
+"""
+Test script to verify /books keyset cursors visit every book and section once
+and that malformed cursors are rejected with 400
+"""
+
+from app import app, db
+from models import Book
+import catalog
+from test_catalog_queries import seed_books
+
+
+def seed_paging():
+    """60 books in three categories plus two uncategorized ones, with repeated titles"""
+    seed_books(60)
+    with app.app_context():
+        # Pairs of equal titles so the id has to break ties across page boundaries
+        for book in Book.query.all():
+            book.title = f'Title {book.id // 2:03d}'
+        db.session.add_all([Book(title='Loose Leaf', author='Anon', quantity=1, price=50) for _ in range(2)])
+        db.session.commit()
+
+
+def expected_order(section):
+    books = [b for b in catalog.book_cards(Book.query.filter_by(is_deleted=False))
+             if section in b.categories or (section == catalog.UNCATEGORIZED and not b.categories)]
+    return [b.id for b in sorted(books, key=lambda b: (b.title, b.id))]
+
+
+def test_section_feed_pages_without_gaps():
+    """Following next_cursor through /books/section returns each book of the section once, in order"""
+    seed_paging()
+    with app.app_context():
+        expected = expected_order('Category 1')
+
+    with app.test_client() as client:
+        seen, cursor, pages = [], '', 0
+        while cursor is not None:
+            data = client.get(f'/books/section?section=Category 1&after={cursor}').get_json()
+            assert data['success']
+            seen.extend(book['id'] for book in data['books'])
+            cursor, pages = data['next_cursor'], pages + 1
+
+    assert pages == 2
+    assert seen == expected
+
+
+def test_list_and_section_pages_round_trip():
+    """Cursors from the list view and the section index decode to the next page"""
+    seed_paging()
+    with app.test_request_context():
+        seen, cursor = [], None
+        while True:
+            page = catalog.book_list_page({}, after=catalog.decode_cursor(cursor, catalog.BOOK_CURSOR), limit=7)
+            seen.extend(book.id for book in page['books'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        assert seen == sorted(seen, key=lambda i: (db.session.get(Book, i).title, i))
+        assert len(set(seen)) == Book.query.count()
+
+        names, cursor = [], None
+        while True:
+            page = catalog.category_sections({}, after=catalog.decode_cursor(cursor, catalog.SECTION_CURSOR), limit=1)
+            names.extend(section['name'] for section in page['sections'])
+            cursor = page['next_cursor']
+            if not cursor:
+                break
+        assert names == ['Category 0', 'Category 1', 'Category 2', catalog.UNCATEGORIZED]
+
+
+def test_bad_cursors_are_rejected():
+    """Undecodable cursors, wrong shapes and wrong value types answer 400"""
+    seed_books(3)
+    bad = ['not-a-cursor!', catalog.encode_cursor({'title': 'x'}), catalog.encode_cursor(['x']),
+           catalog.encode_cursor([1, 'x']), catalog.encode_cursor(['x', '1']), catalog.encode_cursor(['x', True])]
+
+    with app.test_client() as client:
+        for cursor in bad:
+            response = client.get(f'/books/section?section=Category 0&after={cursor}')
+            assert response.status_code == 400, cursor
+            assert response.get_json() == {'success': False, 'message': 'Invalid cursor'}
+            assert client.get(f'/books?view=list&after={cursor}').status_code == 400
+            assert client.get(f'/book/1/reviews?after={cursor}').status_code == 400
+        assert client.get(f"/books?after={catalog.encode_cursor(['x', 1])}").status_code == 400
+        assert client.get(f"/book/1/reviews?after={catalog.encode_cursor(['yesterday', 1])}").status_code == 400
+
+        # A well-formed cursor still works
+        assert client.get(f"/books?after={catalog.encode_cursor([0, 'Category 0'])}").status_code == 200
+
+
+if __name__ == "__main__":
+    test_section_feed_pages_without_gaps()
+    test_list_and_section_pages_round_trip()
+    test_bad_cursors_are_rejected()
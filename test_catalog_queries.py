@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+"""
+Test script to verify listing routes run a constant number of queries,
+no matter how many books are on the page
+"""
+
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import app, db
+from models import Book, BookImage, Category, SubCategory
+
+LISTING_ROUTES = [
+    '/',
+    '/books',
+    '/books?view=list',
+    '/search?q=Book',
+    '/admin/manage-books',
+]
+
+
+@contextmanager
+def count_queries():
+    """Collect every SQL statement executed inside the block"""
+    statements = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        statements.append(statement)
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield statements
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def seed_books(count):
+    """Replace the catalog with `count` books, each with images and categories"""
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+        categories = [Category(name=f'Category {i}') for i in range(3)]
+        db.session.add_all(categories)
+        db.session.flush()
+        subcategories = [SubCategory(name=f'Subject {i}', category_id=categories[i].id) for i in range(3)]
+        db.session.add_all(subcategories)
+
+        for i in range(count):
+            book = Book(title=f'Book {i:03d}', author=f'Author {i}', description='A test book',
+                        quantity=10, price=100 + i, original_price=150 + i)
+            book.categories.append(categories[i % 3])
+            book.subcategories.append(subcategories[i % 3])
+            book.images.extend([BookImage(image_filename=f'book{i}_1.jpg'),
+                                BookImage(image_filename=f'book{i}_2.jpg')])
+            db.session.add(book)
+        db.session.commit()
+
+
+def listing_query_counts(book_count):
+    """Return {route: number of SQL statements} for a catalog of book_count books"""
+    seed_books(book_count)
+    counts = {}
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['admin_id'] = 1
+            sess['admin_name'] = 'Test Admin'
+        for url in LISTING_ROUTES:
+            with count_queries() as statements:
+                response = client.get(url)
+            assert response.status_code == 200, f'{url} returned {response.status_code}'
+            counts[url] = len(statements)
+    return counts
+
+
+def test_listing_query_counts_are_constant():
+    """Listing routes must not issue per-book lazy loads (N+1 queries)"""
+    small = listing_query_counts(3)
+    large = listing_query_counts(30)
+
+    for url in LISTING_ROUTES:
+        print(f"   {url}: {small[url]} queries for 3 books, {large[url]} for 30 books")
+        assert small[url] == large[url], f'{url} query count grows with the number of books'
+
+
+if __name__ == "__main__":
+    test_listing_query_counts_are_constant()
@@ -0,0 +1,82 @@
+#!/usr/bin/env python3
+"""
+Test script to verify ordinary writes survive concurrent writers: a request
+that reads first and writes later must not fail with "database is locked"
+when another connection commits in between
+"""
+
+import sqlite3
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import app, db
+from models import Book, BookReview, Order, OrderItem, User
+from test_catalog_queries import seed_books
+
+
+@contextmanager
+def commit_elsewhere_after_first_read():
+    """Once the request has run its first SELECT, commit a write from another connection"""
+    with app.app_context():
+        engine = db.engine
+    path = engine.url.database
+    done = []
+
+    def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if not done and statement.lstrip().upper().startswith('SELECT'):
+            done.append(True)
+            other = sqlite3.connect(path, timeout=5)
+            with other:
+                other.execute('UPDATE books SET quantity = quantity - 1 WHERE id = 2')
+            other.close()
+
+    event.listen(engine, 'after_cursor_execute', after_cursor_execute)
+    try:
+        yield done
+    finally:
+        event.remove(engine, 'after_cursor_execute', after_cursor_execute)
+
+
+def test_review_survives_concurrent_commit():
+    seed_books(2)
+    with app.app_context():
+        user = User(email='reader@example.com', phone='7400000000', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        order = Order(user_id=user.id, status='completed', total_amount=100)
+        order.items = [OrderItem(book_id=1, price=100)]
+        db.session.add(order)
+        db.session.commit()
+        user_id = user.id
+
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        with commit_elsewhere_after_first_read() as done:
+            response = client.post('/book/1/review', data={'rating': '4', 'review_text': 'Solid'})
+        assert done and response.status_code == 302
+
+    with app.app_context():
+        assert BookReview.query.filter_by(book_id=1, user_id=user_id).count() == 1
+        assert db.session.get(Book, 1).review_count == 1
+        assert db.session.get(Book, 2).quantity == 9
+
+
+def test_admin_edit_survives_concurrent_commit():
+    seed_books(2)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['admin_id'] = 1
+        with commit_elsewhere_after_first_read() as done:
+            response = client.get('/admin/delete-book/1')
+        assert done and response.status_code == 302
+
+    with app.app_context():
+        assert db.session.get(Book, 1).is_deleted
+        assert db.session.get(Book, 2).quantity == 9
+
+
+if __name__ == "__main__":
+    test_review_survives_concurrent_commit()
+    test_admin_edit_survives_concurrent_commit()
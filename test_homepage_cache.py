@@ -0,0 +1,45 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the homepage is served from cache and refreshed after admin writes
+"""
+
+from app import app, db
+from models import Testimonial
+from test_catalog_queries import count_queries, seed_books
+
+
+def test_homepage_cache_hits_and_invalidation():
+    """A repeat visit runs no SQL; committing a testimonial shows up on the next visit"""
+    seed_books(3)
+
+    with app.test_client() as client:
+        client.get('/')
+        with count_queries() as statements:
+            response = client.get('/')
+        assert response.status_code == 200
+        print(f"   Cached homepage ran {len(statements)} queries")
+        assert statements == [], 'cached homepage should not touch the database'
+
+        with app.app_context():
+            db.session.add(Testimonial(name='Cache Tester', role='Student', message='Great courses'))
+            db.session.commit()
+
+        response = client.get('/')
+        assert b'Cache Tester' in response.data, 'homepage was not invalidated by the write'
+
+
+def test_homepage_cache_varies_by_navbar():
+    """Logged-in visitors must not be served the anonymous navbar"""
+    with app.test_client() as client:
+        anonymous = client.get('/').data
+        with client.session_transaction() as sess:
+            sess['user_id'] = 1
+        logged_in = client.get('/').data
+
+    assert b'Logout' not in anonymous
+    assert b'Logout' in logged_in
+
+
+if __name__ == "__main__":
+    test_homepage_cache_hits_and_invalidation()
+    test_homepage_cache_varies_by_navbar()
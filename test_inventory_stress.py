@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Stress test: hundreds of concurrent checkouts from several processes race for
+a book with limited stock while a job worker processes their follow-up jobs.
+Exactly the available copies must be sold, and neither a checkout nor a job
+may fail with a locked database.
+"""
+
+import multiprocessing
+import time
+
+from sqlalchemy import text
+
+from app import app, db
+from models import Book, Order, OrderItem, QueuedJob, User
+import cart_store
+import jobs
+from test_catalog_queries import seed_books
+
+PROCESSES = 8
+CHECKOUTS = 240
+STOCK = 50
+
+CUSTOMER_INFO = {'full_name': 'Load Test', 'email': 'load@example.com', 'phone': '9000000000',
+                 'address': '1 Main Road, Pune, MH - 411001'}
+
+
+def seed_stress():
+    """One book with STOCK copies and one buyer per checkout; returns the buyer ids"""
+    seed_books(1)
+    with app.app_context():
+        db.session.get(Book, 1).quantity = STOCK
+        users = [User(email=f'buyer{i}@example.com', phone=f'79{i:08d}', password_hash='x')
+                 for i in range(CHECKOUTS)]
+        db.session.add_all(users)
+        db.session.commit()
+        user_ids = [user.id for user in users]
+        with app.test_request_context():
+            for user_id in user_ids:
+                cart_store.backend().delete(f'user:{user_id}')
+        return user_ids
+
+
+def run_checkouts(user_ids):
+    """Check out one copy of book 1 for each user; returns [(status, seconds)]"""
+    # Connections must not be shared with the parent process
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+    results = []
+    for user_id in user_ids:
+        with app.test_client() as client:
+            with client.session_transaction() as sess:
+                sess['user_id'] = user_id
+                sess['customer_info'] = CUSTOMER_INFO
+            client.get('/cart/add/1')
+            start = time.perf_counter()
+            response = client.get(f'/payment/success?payment_id=pay_stress{user_id:06d}')
+            results.append((response.status_code, time.perf_counter() - start))
+    return results
+
+
+def run_job_worker(stop, failures):
+    """Run jobs as they are queued until stop is set and none are due; reports failed runs"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+        failed = 0
+        while True:
+            job = jobs.claim_next()
+            if job is None:
+                if stop.is_set():
+                    break
+                time.sleep(0.05)
+                continue
+            failed += not jobs.run_job(job)
+        failures.put(failed)
+
+
+def test_concurrent_checkouts_never_oversell():
+    user_ids = seed_stress()
+    chunks = [user_ids[n::PROCESSES] for n in range(PROCESSES)]
+
+    context = multiprocessing.get_context('fork')
+    stop, failures = context.Event(), context.Queue()
+    worker = context.Process(target=run_job_worker, args=(stop, failures))
+    worker.start()
+    start = time.perf_counter()
+    with context.Pool(PROCESSES) as pool:
+        results = [result for chunk in pool.map(run_checkouts, chunks) for result in chunk]
+    elapsed = time.perf_counter() - start
+    stop.set()
+    failed_jobs = failures.get(timeout=120)
+    worker.join()
+
+    statuses = [status for status, _ in results]
+    latencies = sorted(seconds for _, seconds in results)
+    p95 = latencies[int(len(latencies) * 0.95)]
+    print(f"   {CHECKOUTS} checkouts in {elapsed:.1f}s from {PROCESSES} processes, "
+          f"p95 {p95 * 1000:.0f}ms, {statuses.count(200)} sold, {statuses.count(302)} turned away")
+
+    # Every request either sold a copy or was sent back to the cart: no 500s from locking
+    assert set(statuses) <= {200, 302}, f'unexpected statuses: {sorted(set(statuses))}'
+    assert statuses.count(200) == STOCK
+    # The job worker wrote alongside the checkouts without a single failed job
+    assert failed_jobs == 0
+
+    with app.app_context():
+        assert db.session.execute(text('PRAGMA journal_mode')).scalar() == 'wal'
+        assert QueuedJob.query.count() == 0
+        assert db.session.get(Book, 1).quantity == 0
+        assert Order.query.count() == STOCK
+        assert db.session.query(db.func.sum(OrderItem.quantity)).scalar() == STOCK
+
+
+if __name__ == "__main__":
+    test_concurrent_checkouts_never_oversell()
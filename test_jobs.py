@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the SQLite job queue: jobs commit with the enqueuing
+transaction, failures retry with backoff and end up in the dead-letter table,
+and a failed job's writes are rolled back
+"""
+
+from datetime import timedelta
+
+from app import app, db
+from models import Category, DeadLetterJob, QueuedJob, utc_now
+import jobs
+from test_slow_queries import ListHandler
+
+calls = []
+
+
+@jobs.task('test-add-category')
+def add_category(name, fail=False):
+    calls.append(name)
+    db.session.add(Category(name=name))
+    if fail:
+        raise RuntimeError(f'cannot add {name}')
+
+
+def reset_db():
+    with app.app_context():
+        db.session.remove()
+        db.drop_all()
+        db.create_all()
+
+
+def make_due(job_id):
+    """Skip a job's backoff delay"""
+    db.session.get(QueuedJob, job_id).run_at = utc_now() - timedelta(seconds=1)
+    db.session.commit()
+
+
+def test_jobs_run_after_commit_only():
+    reset_db()
+    calls.clear()
+    with app.app_context():
+        jobs.enqueue('test-add-category', name='Rolled back')
+        db.session.rollback()
+        jobs.enqueue('test-add-category', name='Poetry')
+        db.session.commit()
+
+        assert jobs.work(burst=True) == 1
+        assert calls == ['Poetry']
+        assert [c.name for c in Category.query] == ['Poetry']
+        assert QueuedJob.query.count() == 0
+
+
+def test_failures_retry_then_dead_letter():
+    reset_db()
+    calls.clear()
+    handler = ListHandler()
+    app.logger.addHandler(handler)
+    with app.app_context():
+        jobs.enqueue('test-add-category', max_attempts=3, name='Drama', fail=True)
+        db.session.commit()
+        job_id = QueuedJob.query.one().id
+
+        assert jobs.work(burst=True) == 1
+        job = db.session.get(QueuedJob, job_id)
+        assert job.attempts == 1 and job.locked_until is None
+        assert 'cannot add Drama' in job.last_error
+        # Backoff: the retry is not due yet, and nothing the handler wrote survived
+        assert jobs.work(burst=True) == 0
+        assert Category.query.count() == 0
+        first_delay = job.run_at - utc_now().replace(tzinfo=None)
+        assert timedelta(seconds=5) < first_delay <= timedelta(seconds=jobs.RETRY_BASE_SECONDS)
+
+        make_due(job_id)
+        jobs.work(burst=True)
+        second_delay = db.session.get(QueuedJob, job_id).run_at - utc_now().replace(tzinfo=None)
+        assert second_delay > first_delay
+
+        make_due(job_id)
+        jobs.work(burst=True)
+        assert QueuedJob.query.count() == 0
+        dead = DeadLetterJob.query.one()
+        assert (dead.job_id, dead.task, dead.attempts) == (job_id, 'test-add-category', 3)
+        assert calls == ['Drama'] * 3
+        app.logger.removeHandler(handler)
+        assert [message.split(':')[0] for message in handler.messages] == [
+            f'Job {job_id} (test-add-category) failed, retrying in {jobs.RETRY_BASE_SECONDS}s',
+            f'Job {job_id} (test-add-category) failed, retrying in {jobs.RETRY_BASE_SECONDS * 2}s',
+            f'Job {job_id} (test-add-category) failed 3 times, moved to dead letters',
+        ]
+
+        assert jobs.retry_dead_jobs() == 1
+        assert DeadLetterJob.query.count() == 0
+        assert QueuedJob.query.one().attempts == 0
+
+
+def test_leased_jobs_are_not_claimed_twice():
+    reset_db()
+    with app.app_context():
+        jobs.enqueue('test-add-category', name='Essays')
+        db.session.commit()
+
+        job = jobs.claim_next()
+        assert job.task == 'test-add-category' and job.attempts == 1
+        assert jobs.claim_next() is None
+
+        # A worker that died mid-job loses its lease
+        db.session.get(QueuedJob, job.id).locked_until = utc_now() - timedelta(seconds=1)
+        db.session.commit()
+        again = jobs.claim_next()
+        assert again.id == job.id and again.attempts == 2
+        assert jobs.run_job(again)
+        assert QueuedJob.query.count() == 0
+
+
+if __name__ == "__main__":
+    test_jobs_run_after_commit_only()
+    test_failures_retry_then_dead_letter()
+    test_leased_jobs_are_not_claimed_twice()
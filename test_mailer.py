@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Test script to verify email delivery against a local SMTP sink: requests only
+queue mail, the background sender batches over one reused connection,
+reconnects when the server drops it and retries temporary failures
+"""
+
+import socketserver
+import threading
+import time
+from contextlib import contextmanager
+from email import message_from_bytes
+
+from app import app
+import jobs
+import mailer
+import utils
+from test_order_pipeline import checkout_queries
+
+
+class SMTPSink(socketserver.ThreadingTCPServer):
+    """Just enough SMTP to accept messages and keep them in memory"""
+
+    allow_reuse_address = True
+    daemon_threads = True
+
+    def __init__(self, fail_code=None, fail_times=0, drop_after=None, data_delay=0.0):
+        super().__init__(('127.0.0.1', 0), SMTPSinkHandler)
+        self.messages = []
+        self.connections = 0
+        self.data_attempts = 0
+        self.fail_code, self.fail_times = fail_code, fail_times
+        self.drop_after = drop_after
+        self.data_delay = data_delay
+
+
+class SMTPSinkHandler(socketserver.StreamRequestHandler):
+
+    def reply(self, line):
+        self.wfile.write(f'{line}\r\n'.encode())
+
+    def handle(self):
+        sink = self.server
+        sink.connections += 1
+        accepted = 0
+        self.reply('220 sink ready')
+        while True:
+            line = self.rfile.readline()
+            if not line:
+                return
+            command = line.decode().strip().upper()
+            if command.startswith(('EHLO', 'HELO')):
+                self.reply('250 sink')
+            elif command.startswith(('MAIL', 'RCPT', 'RSET', 'NOOP')):
+                self.reply('250 OK')
+            elif command == 'DATA':
+                self.reply('354 End data with <CR><LF>.<CR><LF>')
+                data = []
+                while (chunk := self.rfile.readline()) not in (b'.\r\n', b''):
+                    data.append(chunk)
+                time.sleep(sink.data_delay)
+                sink.data_attempts += 1
+                if sink.fail_times:
+                    sink.fail_times -= 1
+                    self.reply(f'{sink.fail_code} Rejected by sink')
+                    continue
+                sink.messages.append(message_from_bytes(b''.join(data)))
+                self.reply('250 Queued')
+                accepted += 1
+                if sink.drop_after and accepted >= sink.drop_after:
+                    return  # hang up without warning, like an idle timeout
+            elif command == 'QUIT':
+                self.reply('221 Bye')
+                return
+            else:
+                self.reply('502 Not implemented')
+
+
+@contextmanager
+def smtp_sink(**options):
+    """Run a sink and point the MAIL_* settings at it"""
+    sink = SMTPSink(**options)
+    threading.Thread(target=sink.serve_forever, daemon=True).start()
+    saved = {key: app.config.get(key) for key in ('MAIL_SERVER', 'MAIL_PORT', 'MAIL_USE_TLS', 'MAIL_USERNAME', 'MAIL_ENABLED')}
+    app.config.update(MAIL_SERVER='127.0.0.1', MAIL_PORT=sink.server_address[1], MAIL_USE_TLS=False,
+                      MAIL_USERNAME=None, MAIL_ENABLED=True)
+    try:
+        yield sink
+    finally:
+        app.config.update(saved)
+        sink.shutdown()
+        sink.server_close()
+
+
+def test_requests_only_queue_and_sender_batches():
+    with smtp_sink(data_delay=0.05) as sink:
+        with app.test_request_context():
+            start = time.perf_counter()
+            for n in range(20):
+                assert utils.send_reset_email(f'reader{n}@example.com', f'{n:06d}')
+            queued_in = time.perf_counter() - start
+        # Sending inline would take 20 x 50ms
+        assert queued_in < 0.5
+
+        assert mailer.flush(timeout=10)
+        assert len(sink.messages) == 20
+        assert sink.connections == 1, 'every message should reuse the same connection'
+        first = sink.messages[0]
+        assert first['To'] == 'reader0@example.com'
+        assert '000000' in first.get_payload(decode=True).decode()
+
+
+def test_dropped_connections_reconnect():
+    with smtp_sink(drop_after=1) as sink:
+        with app.test_request_context():
+            for n in range(3):
+                utils.send_reset_email(f'reader{n}@example.com', '123456')
+        assert mailer.flush(timeout=10)
+        assert len(sink.messages) == 3
+        assert sink.connections == 3
+
+
+def test_temporary_failures_retry_permanent_ones_do_not():
+    saved, mailer.RETRY_BASE_SECONDS = mailer.RETRY_BASE_SECONDS, 0.05
+    try:
+        with smtp_sink(fail_code=451, fail_times=2) as sink:
+            with app.test_request_context():
+                utils.send_reset_email('retry@example.com', '123456')
+            assert mailer.flush(timeout=10)
+            assert len(sink.messages) == 1 and sink.data_attempts == 3
+
+        with smtp_sink(fail_code=550, fail_times=1) as sink:
+            with app.test_request_context():
+                utils.send_reset_email('nobody@example.com', '123456')
+            assert mailer.flush(timeout=10)
+            assert sink.messages == [] and sink.data_attempts == 1
+    finally:
+        mailer.RETRY_BASE_SECONDS = saved
+
+
+def test_order_confirmation_is_sent_by_the_job_worker():
+    checkout_queries(2, 1)
+    with smtp_sink() as sink:
+        with app.app_context():
+            jobs.work(burst=True)
+        assert len(sink.messages) == 1
+        confirmation = sink.messages[0]
+        assert confirmation['To'] == 'asha@example.com'
+        assert 'confirmed' in confirmation['Subject']
+        body = confirmation.get_payload(decode=True).decode()
+        assert 'Pack 0' in body and 'Asha Rao' in body
+
+    with app.test_request_context():
+        certificate = mailer.compose('asha@example.com', 'Certificate', 'certificate_issued.html',
+                                     name=None, course_title='Python Basics', download_url='http://localhost/c/1')
+        assert 'Python Basics' in certificate.get_content()
+
+
+if __name__ == "__main__":
+    test_requests_only_queue_and_sender_batches()
+    test_dropped_connections_reconnect()
+    test_temporary_failures_retry_permanent_ones_do_not()
+    test_order_confirmation_is_sent_by_the_job_worker()
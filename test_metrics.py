@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Test script to verify /metrics: request, cache and checkout counters in the
+Prometheus text format, summed over every worker process through the shared
+metrics file, and only served to local scrapers
+"""
+
+import os
+
+from app import app
+import jobs
+import mailer
+import metrics
+from test_catalog_queries import seed_books
+from test_order_pipeline import checkout_queries
+
+
+def scrape(client):
+    response = client.get('/metrics')
+    assert response.status_code == 200
+    assert response.mimetype == 'text/plain'
+    return response.get_data(as_text=True).splitlines()
+
+
+def test_requests_and_checkouts_are_exported():
+    seed_books(3)
+    metrics.reset()
+    with app.test_client() as client:
+        client.get('/')
+        client.get('/')
+        client.get('/books')
+        lines = scrape(client)
+
+    assert '# TYPE http_request_duration_seconds histogram' in lines
+    assert 'http_requests_total{endpoint="index",method="GET",status="200"} 2' in lines
+    buckets = [line for line in lines if line.startswith('http_request_duration_seconds_bucket{endpoint="books"')]
+    assert buckets[-1] == 'http_request_duration_seconds_bucket{endpoint="books",le="+Inf"} 1'
+    counts = [int(line.rsplit(' ', 1)[1]) for line in buckets]
+    assert counts == sorted(counts), 'buckets are cumulative and in order'
+    assert any(line.startswith('db_queries_total{endpoint="books"}') for line in lines)
+    # The first homepage request misses both the page and its data, the second hits the page
+    assert 'cache_lookups_total{namespace="homepage",result="miss"} 2' in lines
+    assert 'cache_lookups_total{namespace="homepage",result="memory_hit"} 1' in lines
+    assert 'cache_hit_ratio{namespace="homepage"} 0.3333333333333333' in lines
+
+    checkout_queries(2, 1)
+    with app.test_client() as client:
+        lines = scrape(client)
+        assert 'checkouts_total{result="success"} 1' in lines
+        assert 'email_queue_depth{queue="jobs"} 1' in lines
+        with app.app_context():
+            jobs.work(burst=True)
+        assert 'email_queue_depth{queue="jobs"} 0' in scrape(client)
+
+
+def test_counters_are_summed_across_workers():
+    metrics.reset()
+    workers = []
+    for _ in range(3):
+        pid = os.fork()
+        if pid == 0:
+            metrics.inc('stock_outs_total', stage='race')
+            mailer._outbox._pending = 4
+            metrics.flush()
+            os._exit(0)
+        workers.append(pid)
+    for pid in workers:
+        assert os.waitpid(pid, 0)[1] == 0
+
+    metrics.inc('stock_outs_total', stage='race')
+    with app.test_client() as client:
+        lines = scrape(client)
+    assert 'stock_outs_total{stage="race"} 4' in lines
+    # Gauges of workers that exited are dropped
+    assert 'email_queue_depth{queue="outbox"} 0' in lines
+
+
+def test_metrics_are_only_served_locally():
+    with app.test_client() as client:
+        assert client.get('/metrics', environ_base={'REMOTE_ADDR': '10.0.0.5'}).status_code == 404
+        assert client.get('/metrics').status_code == 200
+
+
+if __name__ == "__main__":
+    test_requests_and_checkouts_are_exported()
+    test_counters_are_summed_across_workers()
+    test_metrics_are_only_served_locally()
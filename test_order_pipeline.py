@@ -0,0 +1,147 @@
+#!/usr/bin/env python3
+"""
+Test script to verify payment_success validates stock from one batched
+snapshot, so completing an order takes the same number of queries for any
+number of cart lines
+"""
+
+import pytest
+from sqlalchemy.exc import IntegrityError
+
+from app import HOMEPAGE_CACHE, app, db
+from models import Book, BookRecommendation, BundleOffer, FullOrderDetail, Order, OrderItem, RelatedBook, User
+import cache
+import cart_store
+import catalog
+import jobs
+import order_pipeline
+from test_catalog_queries import count_queries, seed_books
+
+CUSTOMER_INFO = {'full_name': 'Asha Rao', 'email': 'asha@example.com', 'phone': '9000000000',
+                 'address': '1 Main Road, Pune, MH - 411001'}
+
+WARM_CACHES = (HOMEPAGE_CACHE, catalog.FACETS_CACHE, cart_store.SUMMARY_CACHE)
+
+
+def seed_checkout(book_count, bundle_count):
+    """Books 1..book_count and bundles of three books each; returns (user_id, bundle_ids)"""
+    seed_books(book_count + 3 * bundle_count)
+    with app.app_context():
+        user = User(email='buyer@example.com', phone='7800000000', password_hash='x')
+        db.session.add(user)
+        bundles = []
+        for i in range(bundle_count):
+            first = book_count + 3 * i + 1
+            books = [db.session.get(Book, n) for n in range(first, first + 3)]
+            bundles.append(BundleOffer(title=f'Pack {i}', mrp=0, selling_price=250, books=books))
+            db.session.add(bundles[-1])
+        db.session.commit()
+        # Carts outlive the seeded database; start from an empty one
+        cart_store.backend().delete(f'user:{user.id}')
+        return user.id, [bundle.id for bundle in bundles]
+
+
+def checkout_queries(book_count, bundle_count):
+    """Fill a cart and return the number of SELECTs /payment/success runs before committing"""
+    user_id, bundle_ids = seed_checkout(book_count, bundle_count)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['customer_info'] = CUSTOMER_INFO
+        for book_id in range(1, book_count + 1):
+            client.get(f'/cart/add/{book_id}')
+        for bundle_id in bundle_ids:
+            client.get(f'/cart/add-bundle/{bundle_id}')
+
+        with count_queries() as statements:
+            response = client.get('/payment/success?payment_id=pay_TEST123456')
+        assert response.status_code == 200
+
+    with app.app_context():
+        order = Order.query.one()
+        assert OrderItem.query.filter_by(order_id=order.id).count() == book_count + 3 * bundle_count
+        assert all(book.quantity == 9 for book in Book.query.all())
+    return sum(s.lstrip().upper().startswith('SELECT') for s in statements)
+
+
+def test_checkout_queries_do_not_grow_with_cart():
+    small = checkout_queries(1, 1)
+    large = checkout_queries(10, 4)
+    print(f"   payment_success: {small} SELECTs for 2 lines, {large} for 14")
+    assert small == large
+
+
+def test_stock_is_checked_across_lines():
+    """A book bought alone and inside a bundle needs stock for both"""
+    seed_books(3)
+    with app.app_context():
+        bundle = BundleOffer(title='Pack', mrp=0, selling_price=250, books=[db.session.get(Book, 1)])
+        db.session.add(bundle)
+        db.session.get(Book, 1).quantity = 1
+        db.session.commit()
+
+        cart = [{'type': 'book', 'id': 1, 'title': 'Book 000', 'quantity': 1},
+                {'type': 'bundle', 'id': bundle.id, 'title': 'Pack', 'quantity': 1}]
+        snapshot = order_pipeline.load_cart_snapshot(cart)
+        assert order_pipeline.required_stock(cart, snapshot) == {1: 2}
+        assert 'Insufficient stock' in order_pipeline.stock_error(cart, snapshot)
+        assert order_pipeline.stock_error(cart[:1], snapshot) is None
+
+
+def test_sale_keeps_cached_pages_warm():
+    """Taking stock does not invalidate the homepage, facet or cart-summary caches"""
+    user_id, _ = seed_checkout(2, 0)
+    with app.test_client() as client:
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+            sess['customer_info'] = CUSTOMER_INFO
+        client.get('/cart/add/1')
+        client.get('/')
+        with app.app_context():
+            catalog.facet_counts({})
+            versions = {name: cache.get_version(name) for name in WARM_CACHES}
+
+        response = client.get('/payment/success?payment_id=pay_TEST123456')
+        assert response.status_code == 200
+
+        with app.app_context():
+            assert db.session.get(Book, 1).quantity == 9
+            assert {name: cache.get_version(name) for name in WARM_CACHES} == versions
+        with count_queries() as statements:
+            client.get('/')
+        assert statements == [], 'a sale should leave the cached homepage warm'
+
+
+def test_bulk_inserted_lines():
+    """Queued order details keep the bundle_id rule and purchases refresh related books"""
+    checkout_queries(2, 1)
+    with app.app_context():
+        assert FullOrderDetail.query.count() == 0
+        # Nothing post-checkout ran in the request: related books wait for the job
+        assert db.session.get(RelatedBook, (1, 2)) is None
+        assert jobs.work(burst=True) == 4
+        details = {detail.item_type: detail for detail in FullOrderDetail.query}
+        assert details['bundle'].bundle_id == details['bundle'].item_id
+        assert details['book'].bundle_id is None
+        assert details['bundle'].price == 250
+
+        # Books 1 and 2 share no category, only this order
+        assert db.session.get(RelatedBook, (1, 2)) is not None
+        assert db.session.get(BookRecommendation, (1, 2)) is not None
+
+        # The CHECK constraint rejects a book line that claims a bundle
+        bad = order_pipeline.order_detail_rows(
+            [{'type': 'book', 'id': 1, 'title': 'Book 000', 'quantity': 1, 'price': 100}],
+            order_id=details['book'].order_id
+        )
+        bad[0]['bundle_id'] = details['bundle'].bundle_id
+        with pytest.raises(IntegrityError):
+            order_pipeline.insert_order_details(bad)
+        db.session.rollback()
+
+
+if __name__ == "__main__":
+    test_checkout_queries_do_not_grow_with_cart()
+    test_stock_is_checked_across_lines()
+    test_sale_keeps_cached_pages_warm()
+    test_bulk_inserted_lines()
@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Test script to verify /payment/success is idempotent per payment_id: reloads
+show the same order, and concurrent duplicates create exactly one order
+"""
+
+import multiprocessing
+
+from app import app, db
+from models import Book, FullOrderDetail, Order, Payment, Transaction, User
+import cart_store
+import jobs
+from test_catalog_queries import seed_books
+
+CUSTOMER_INFO = {'full_name': 'Asha Rao', 'email': 'asha@example.com', 'phone': '9000000000',
+                 'address': '1 Main Road, Pune, MH - 411001'}
+
+DUPLICATES = 8
+
+
+def seed_buyers(count=2):
+    """Three books and `count` users with empty carts; returns the user ids"""
+    seed_books(3)
+    with app.app_context():
+        users = [User(email=f'payer{i}@example.com', phone=f'76{i:08d}', password_hash='x') for i in range(count)]
+        db.session.add_all(users)
+        db.session.commit()
+        with app.test_request_context():
+            for user in users:
+                cart_store.backend().delete(f'user:{user.id}')
+        return [user.id for user in users]
+
+
+def logged_in_client(user_id):
+    client = app.test_client()
+    with client.session_transaction() as sess:
+        sess['user_id'] = user_id
+        sess['customer_info'] = CUSTOMER_INFO
+    return client
+
+
+def assert_single_order(payment_id):
+    with app.app_context():
+        jobs.work(burst=True)
+        payment = Payment.query.filter_by(payment_id=payment_id).one()
+        assert Order.query.count() == 1 and Transaction.query.count() == 1
+        assert payment.order_id == Order.query.one().id
+        assert FullOrderDetail.query.count() == 2
+        assert [book.quantity for book in Book.query.order_by(Book.id)] == [9, 8, 10]
+        return payment.custom_order_id
+
+
+def test_reloads_show_the_same_order():
+    buyer, other = seed_buyers()
+    client = logged_in_client(buyer)
+    client.get('/cart/add/1')
+    client.get('/cart/add/2')
+    client.get('/cart/add/2')
+
+    first = client.get('/payment/success?payment_id=pay_RELOAD00001')
+    assert first.status_code == 200
+    custom_order_id = assert_single_order('pay_RELOAD00001')
+    assert custom_order_id.encode() in first.data
+
+    # The cart and customer info are gone by now; the ledger still answers
+    for _ in range(2):
+        again = client.get('/payment/success?payment_id=pay_RELOAD00001')
+        assert again.status_code == 200 and custom_order_id.encode() in again.data
+    assert_single_order('pay_RELOAD00001')
+
+    # Someone else cannot claim or view the payment
+    response = logged_in_client(other).get('/payment/success?payment_id=pay_RELOAD00001')
+    assert response.status_code == 302
+    assert client.get('/payment/success').status_code == 302
+    assert_single_order('pay_RELOAD00001')
+
+
+def pay_at_once(user_id, barrier, results):
+    """Wait for the other duplicates, then complete the same payment"""
+    with app.app_context():
+        db.engine.dispose(close=False)
+    client = logged_in_client(user_id)
+    barrier.wait()
+    response = client.get('/payment/success?payment_id=pay_DOUBLE00001')
+    results.put((response.status_code, response.get_data(as_text=True)))
+
+
+def test_concurrent_duplicates_collapse_into_one_order():
+    buyer, = seed_buyers(1)
+    client = logged_in_client(buyer)
+    client.get('/cart/add/1')
+    client.get('/cart/add/2')
+    client.get('/cart/add/2')
+
+    context = multiprocessing.get_context('fork')
+    barrier = context.Barrier(DUPLICATES)
+    results = context.Queue()
+    workers = [context.Process(target=pay_at_once, args=(buyer, barrier, results)) for _ in range(DUPLICATES)]
+    for worker in workers:
+        worker.start()
+    responses = [results.get(timeout=60) for _ in workers]
+    for worker in workers:
+        worker.join()
+
+    custom_order_id = assert_single_order('pay_DOUBLE00001')
+    assert [status for status, _ in responses] == [200] * DUPLICATES
+    assert all(custom_order_id in body for _, body in responses)
+
+
+if __name__ == "__main__":
+    test_reloads_show_the_same_order()
+    test_concurrent_duplicates_collapse_into_one_order()
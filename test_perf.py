@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Test script to verify request instrumentation: every request is timed and
+its queries counted, repeated identical statements are flagged as N+1, and
+the per-route aggregates are only shown to admins
+"""
+
+from sqlalchemy import text
+
+from app import app, db
+import perf
+from test_catalog_queries import seed_books
+from test_slow_queries import ListHandler
+
+
+def test_requests_are_timed_and_aggregated():
+    seed_books(5)
+    perf.reset()
+    with app.test_client() as client:
+        for _ in range(3):
+            response = client.get('/books')
+            assert response.status_code == 200
+            assert 'Server-Timing' not in response.headers
+        client.get('/static/does-not-exist.css')
+
+    stats = {row['endpoint']: row for row in perf.snapshot()}
+    assert 'static' not in stats
+    books = stats['books']
+    assert books['requests'] == 3
+    assert books['avg_sql_count'] > 0 and books['avg_rows'] >= 5
+    assert books['avg_template_ms'] > 0
+    assert sum(books['histogram'].values()) == 3
+    assert books['n_plus_one'] == []
+
+
+def test_repeated_statements_are_flagged():
+    perf.reset()
+    handler = ListHandler()
+    app.logger.addHandler(handler)
+    try:
+        with app.test_request_context('/books'):
+            app.preprocess_request()
+            for book_id in range(6):
+                db.session.execute(text('SELECT title FROM books WHERE id = :id'), {'id': book_id})
+            app.process_response(app.response_class())
+    finally:
+        app.logger.removeHandler(handler)
+    assert handler.messages == ['Possible N+1 in books: 6x SELECT title FROM books WHERE id = ?']
+
+    [row] = perf.snapshot()
+    assert row['n_plus_one_requests'] == 1
+    [suspect] = row['n_plus_one']
+    assert suspect['count'] == 6 and 'FROM books WHERE id' in suspect['statement']
+
+
+def test_server_timing_is_opt_in():
+    with app.test_client() as client:
+        app.config['SERVER_TIMING'] = True
+        try:
+            assert 'db;dur=' in client.get('/books').headers['Server-Timing']
+        finally:
+            app.config['SERVER_TIMING'] = False
+        assert 'Server-Timing' not in client.get('/books').headers
+
+        with client.session_transaction() as session:
+            session['admin_id'] = 1
+        assert 'db;dur=' in client.get('/books').headers['Server-Timing']
+
+
+def test_perf_pages_are_admin_only():
+    with app.test_client() as client:
+        response = client.get('/admin/perf.json')
+        assert response.status_code == 302 and '/admin/login' in response.location
+
+        with client.session_transaction() as session:
+            session['admin_id'] = 1
+        client.get('/books')
+        assert client.get('/admin/perf').status_code == 200
+        data = client.get('/admin/perf.json').get_json()
+        assert data['buckets_ms'] == list(perf.LATENCY_BUCKETS_MS)
+        assert any(row['endpoint'] == 'books' for row in data['endpoints'])
+
+
+if __name__ == "__main__":
+    test_requests_are_timed_and_aggregated()
+    test_repeated_statements_are_flagged()
+    test_server_timing_is_opt_in()
+    test_perf_pages_are_admin_only()
@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Test script to verify hot route queries are served by indexes: every SELECT
+the routes run is re-planned with EXPLAIN QUERY PLAN against a seeded
+database and must not fall back to a full table scan
+"""
+
+import re
+from contextlib import contextmanager
+
+from sqlalchemy import event
+
+from app import app, db
+from models import (Book, BookReview, Certificate, Course, FullOrderDetail, Order, OrderItem,
+                    Transaction, User, UserCourse)
+import catalog
+from test_catalog_queries import seed_books
+
+# Tables whose lookups must always go through an index
+HOT_TABLES = {'books', 'book_reviews', 'orders', 'order_items', 'transactions',
+              'user_courses', 'certificates', 'full_order_details'}
+
+# "SCAN books" is a full scan; "SCAN books USING INDEX ..." walks an index
+FULL_SCAN = re.compile(r'^SCAN (\w+)(?: AS (\w+))?$')
+
+
+@contextmanager
+def capture_selects():
+    """Collect (statement, parameters) for every SELECT executed inside the block"""
+    selects = []
+
+    def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        if statement.lstrip().upper().startswith(('SELECT', 'WITH')):
+            selects.append((statement, parameters))
+
+    with app.app_context():
+        engine = db.engine
+    event.listen(engine, 'before_cursor_execute', before_cursor_execute)
+    try:
+        yield selects
+    finally:
+        event.remove(engine, 'before_cursor_execute', before_cursor_execute)
+
+
+def query_plan(statement, parameters):
+    """EXPLAIN QUERY PLAN rows of a captured statement"""
+    with app.app_context():
+        conn = db.session.connection().connection.driver_connection
+        plan = conn.execute('EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        db.session.rollback()
+    return plan
+
+
+def full_scans(statement, parameters):
+    """Return the hot tables EXPLAIN QUERY PLAN reads with a full scan"""
+    plan = query_plan(statement, parameters)
+
+    # Map aliases back to table names from the FROM/JOIN clauses
+    aliases = {alias or table: table
+               for table, alias in re.findall(r'(?:FROM|JOIN)\s+(\w+)(?:\s+(?:AS\s+)?(?!ON\b|WHERE\b|JOIN\b|LEFT\b|ORDER\b|GROUP\b|LIMIT\b)(\w+))?',
+                                              statement, re.IGNORECASE)}
+    scanned = []
+    for row in plan:
+        match = FULL_SCAN.match(row[-1])
+        if match:
+            table = aliases.get(match.group(2) or match.group(1), match.group(1))
+            if table in HOT_TABLES:
+                scanned.append(table)
+    return scanned
+
+
+def seed_hot_paths():
+    """Books, a buyer with orders, transactions, reviews, courses and certificates"""
+    seed_books(30)
+    with app.app_context():
+        course = Course(title='Physics', price=500)
+        users = [User(email=f'user{i}@example.com', phone=f'76{i:08d}', password_hash='x') for i in range(5)]
+        db.session.add_all([course] + users)
+        db.session.flush()
+
+        for i, user in enumerate(users):
+            order = Order(user_id=user.id, status='completed', total_amount=200)
+            order.items = [OrderItem(book_id=1 + i, price=100), OrderItem(book_id=2 + i, price=100)]
+            db.session.add(order)
+            db.session.flush()
+            db.session.add_all([
+                Transaction(user_id=user.id, order_id=order.id, amount=200, status='completed'),
+                BookReview(book_id=1, user_id=user.id, rating=1 + i % 5, review_text='Good'),
+                UserCourse(user_id=user.id, course_id=course.id),
+                Certificate(user_id=user.id, course_id=course.id, filename='cert.pdf'),
+                FullOrderDetail(order_id=order.id, item_id=1 + i, item_type='book',
+                                item_title=f'Book {i:03d}', price=100),
+            ])
+        db.session.commit()
+        return users[0].id
+
+
+def test_hot_route_queries_use_indexes():
+    """No hot route query plans a full scan of a hot table"""
+    user_id = seed_hot_paths()
+
+    with app.test_client() as client, capture_selects() as selects:
+        client.get('/books?view=list')
+        client.get('/book/1')
+        with app.app_context():
+            cursor = catalog.encode_cursor(['2100-01-01T00:00:00', 0])
+            catalog.user_book_flags(user_id, 2)
+        client.get(f'/book/1/reviews?after={cursor}')
+
+        with client.session_transaction() as sess:
+            sess['user_id'] = user_id
+        client.get('/profile')
+        client.post('/book/1/review', data={'rating': '5'})
+        client.get('/enroll-course/1')
+
+        with client.session_transaction() as sess:
+            sess['admin_id'] = 1
+        client.get('/admin/full-orders')
+
+    hot = [(statement, parameters) for statement, parameters in selects
+           if set(re.findall(r'\w+', statement)) & HOT_TABLES]
+    assert hot, 'no hot route queries were captured'
+
+    failures = []
+    for statement, parameters in hot:
+        scanned = full_scans(statement, parameters)
+        if scanned:
+            failures.append(f"{', '.join(scanned)}: {' '.join(statement.split())}")
+    assert not failures, 'full table scans:\n' + '\n'.join(failures)
+
+
+def test_review_pages_are_read_in_index_order():
+    """Review pages walk the (book_id, created_at, id) index instead of sorting the book's reviews"""
+    seed_hot_paths()
+    with app.test_client() as client, capture_selects() as selects:
+        client.get('/book/1')
+        with app.app_context():
+            cursor = catalog.encode_cursor(['2100-01-01T00:00:00', 0])
+        client.get(f'/book/1/reviews?after={cursor}')
+
+    pages = [(statement, parameters) for statement, parameters in selects
+             if 'FROM book_reviews' in statement and 'ORDER BY' in statement]
+    assert len(pages) == 2
+    for statement, parameters in pages:
+        plan = [row[-1] for row in query_plan(statement, parameters)]
+        assert any('idx_book_reviews_book_created' in step for step in plan), plan
+        assert not any('TEMP B-TREE' in step for step in plan), plan
+
+
+if __name__ == "__main__":
+    test_hot_route_queries_use_indexes()
+    test_review_pages_are_read_in_index_order()
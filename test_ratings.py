@@ -0,0 +1,77 @@
+#!/usr/bin/env python3
+"""
+Test script to verify book rating aggregates follow review adds, edits and
+deletes, and that reconcile_ratings reports and fixes drift
+"""
+
+from app import app, db
+from models import Book, BookReview, User
+import ratings
+from test_catalog_queries import count_queries, seed_books
+
+
+def aggregates(book):
+    return (round(book.avg_rating, 4), book.review_count, [count for _, count, _ in book.rating_histogram])
+
+
+def test_ratings_follow_review_changes():
+    """Each review write updates the book with one UPDATE and never drifts"""
+    seed_books(2)
+    with app.app_context():
+        users = [User(email=f'reader{i}@example.com', phone=f'74{i:08d}', password_hash='x') for i in range(4)]
+        db.session.add_all(users)
+        db.session.commit()
+
+        reviews = [BookReview(book_id=1, user_id=user.id, rating=rating)
+                   for user, rating in zip(users, (5, 4, 4, 1))]
+        db.session.add_all(reviews)
+        with count_queries() as statements:
+            db.session.commit()
+        assert sum('UPDATE books' in s for s in statements) == 1
+        book = db.session.get(Book, 1)
+        assert aggregates(book) == (3.5, 4, [1, 2, 0, 0, 1])
+
+        reviews[3].rating = 3
+        db.session.commit()
+        assert aggregates(book) == (4.0, 4, [1, 2, 1, 0, 0])
+
+        reviews[0].book_id = 2
+        db.session.commit()
+        assert aggregates(book) == (round(11 / 3, 4), 3, [0, 2, 1, 0, 0])
+        assert aggregates(db.session.get(Book, 2)) == (5.0, 1, [1, 0, 0, 0, 0])
+
+        for review in reviews[1:]:
+            db.session.delete(review)
+        db.session.commit()
+        assert aggregates(book) == (0.0, 0, [0, 0, 0, 0, 0])
+
+        assert ratings.reconcile_ratings(fix=False) == []
+
+
+def test_reconcile_reports_and_fixes_drift():
+    """A hand-edited aggregate is reported once and then fixed"""
+    seed_books(2)
+    with app.app_context():
+        user = User(email='reader@example.com', phone='7500000000', password_hash='x')
+        db.session.add(user)
+        db.session.commit()
+        db.session.add(BookReview(book_id=1, user_id=user.id, rating=2))
+        db.session.commit()
+
+        db.session.execute(db.text('UPDATE books SET avg_rating = 4.5, review_count = 12, rating_count_2 = 0'))
+        db.session.commit()
+
+        drift = ratings.reconcile_ratings(fix=False)
+        assert [(row.book_id, row.stored_count, row.actual_count) for row in drift] == [(1, 12, 1), (2, 12, 0)]
+
+        assert len(ratings.reconcile_ratings()) == 2
+        assert aggregates(db.session.get(Book, 1)) == (2.0, 1, [0, 0, 0, 1, 0])
+        assert ratings.reconcile_ratings() == []
+
+    result = app.test_cli_runner().invoke(args=['reconcile-ratings', '--dry-run'])
+    assert 'All book ratings match' in result.output
+
+
+if __name__ == "__main__":
+    test_ratings_follow_review_changes()
+    test_reconcile_reports_and_fixes_drift()
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Test script to verify co-purchase recommendations: the NumPy engine, incremental
+updates for new orders and the /books/also-bought endpoint
+"""
+
+from collections import Counter
+from itertools import permutations
+
+import numpy as np
+
+from app import app, db
+from models import BookRecommendation, Order, OrderItem, User
+import recommendations
+from test_catalog_queries import seed_books
+
+
+def test_top_k_matches_brute_force():
+    """Vectorized counts equal a plain Python count over every order"""
+    rng = np.random.default_rng(7)
+    order_ids = rng.integers(0, 200, size=1000)
+    book_ids = rng.integers(1, 40, size=1000)
+
+    baskets = {}
+    for order_id, book_id in zip(order_ids.tolist(), book_ids.tolist()):
+        baskets.setdefault(order_id, set()).add(book_id)
+    expected = Counter(pair for basket in baskets.values() for pair in permutations(basket, 2))
+
+    source, target, co_purchases, rank = recommendations.top_k_neighbours(order_ids, book_ids, k=1000)
+    assert dict(zip(zip(source.tolist(), target.tolist()), co_purchases.tolist())) == dict(expected)
+
+    source, target, co_purchases, rank = recommendations.top_k_neighbours(order_ids, book_ids, k=3)
+    for book_id in set(source.tolist()):
+        row = co_purchases[source == book_id]
+        assert len(row) <= 3 and list(row) == sorted(row, reverse=True)
+
+
+def place_order(user_id, book_ids):
+    order = Order(user_id=user_id, status='completed', total_amount=100 * len(book_ids))
+    order.items = [OrderItem(book_id=book_id, price=100) for book_id in book_ids]
+    db.session.add(order)
+    db.session.commit()
+
+
+def stored_rows():
+    return sorted(db.session.query(BookRecommendation.book_id, BookRecommendation.recommended_id,
+                                   BookRecommendation.co_purchases, BookRecommendation.rank).all())
+
+
+def test_incremental_updates_match_rebuild():
+    """Updating per order gives the same table as a full rebuild"""
+    app.config['BACKGROUND_REFRESH_ASYNC'] = False
+    try:
+        seed_books(6)
+        with app.app_context():
+            user = User(email='reader@example.com', phone='8888888888', password_hash='x')
+            db.session.add(user)
+            db.session.commit()
+
+            place_order(user.id, [1, 2, 3])
+            place_order(user.id, [1, 2])
+            place_order(user.id, [2, 4])
+
+            incremental = stored_rows()
+            recommendations.rebuild_recommendations()
+            assert stored_rows() == incremental
+
+            assert recommendations.also_bought([1]) == [2, 3]
+            assert recommendations.also_bought([1, 2]) == [3, 4]
+
+        with app.test_client() as client:
+            data = client.get('/books/also-bought?ids=1').get_json()
+            assert data['success']
+            assert [book['id'] for book in data['books']] == [2, 3]
+
+            # Ids no book can have are ignored instead of overflowing the bind
+            response = client.get('/books/also-bought?ids=99999999999999999999,1,²')
+            assert response.status_code == 200
+            assert [book['id'] for book in response.get_json()['books']] == [2, 3]
+
+            # The limit is clamped to 1..20: a negative LIMIT would mean no limit in SQLite
+            data = client.get('/books/also-bought?ids=1&limit=-5').get_json()
+            assert [book['id'] for book in data['books']] == [2]
+            data = client.get('/books/also-bought?ids=1&limit=500').get_json()
+            assert [book['id'] for book in data['books']] == [2, 3]
+    finally:
+        app.config.pop('BACKGROUND_REFRESH_ASYNC', None)
+
+
+if __name__ == "__main__":
+    test_top_k_matches_brute_force()
+    test_incremental_updates_match_rebuild()
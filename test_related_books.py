@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the precomputed related_books table and its incremental refresh
+"""
+
+from app import app, db
+from models import Book, Order, OrderItem, RelatedBook, User
+import related
+from test_catalog_queries import seed_books
+
+
+def test_related_books_refresh():
+    """Category overlap seeds the table; a completed order promotes co-purchased books"""
+    app.config['BACKGROUND_REFRESH_ASYNC'] = False
+    try:
+        seed_books(9)   # books i and j share a category when i % 3 == j % 3
+
+        with app.app_context():
+            assert related.rebuild_related_books() == 9 * 2
+            assert sorted(related.related_book_ids(1)) == [4, 7]
+
+            # Books 1 and 2 share no category; buying them together relates them
+            user = User(email='buyer@example.com', phone='9999999999', password_hash='x')
+            db.session.add(user)
+            db.session.flush()
+            order = Order(user_id=user.id, status='completed', total_amount=200)
+            order.items = [OrderItem(book_id=1, price=100), OrderItem(book_id=2, price=100)]
+            db.session.add(order)
+            db.session.commit()
+
+            assert related.related_book_ids(1)[0] == 2
+            assert related.related_book_ids(2)[0] == 1
+
+            # Soft-deleting a book drops it from every related list
+            db.session.get(Book, 4).is_deleted = True
+            db.session.commit()
+            assert 4 not in related.related_book_ids(1)
+            assert related.related_book_ids(4) == []
+
+        with app.test_client() as client:
+            response = client.get('/book/1')
+            assert response.status_code == 200
+            assert b'Book 001' in response.data
+    finally:
+        app.config.pop('BACKGROUND_REFRESH_ASYNC', None)
+
+
+def test_purchase_refresh_is_limited_to_ordered_books():
+    """An order recomputes only its own books, each from a bounded set of candidates"""
+    seed_books(9)
+    with app.app_context():
+        related.rebuild_related_books()
+        # Book 4 shares a category with books 1 and 7; its rows must stay untouched
+        db.session.query(RelatedBook).filter_by(book_id=4).delete()
+        db.session.commit()
+
+        user = User(email='buyer@example.com', phone='9999999999', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        order = Order(user_id=user.id, status='completed', total_amount=200)
+        order.items = [OrderItem(book_id=1, price=100), OrderItem(book_id=2, price=100)]
+        db.session.add(order)
+        db.session.commit()
+
+        assert related.related_book_ids(1) == [2, 4, 7]
+        assert related.related_book_ids(4) == []
+        assert related.refresh_purchased_books(order_ids=[order.id]) == 2
+
+        saved, related.CANDIDATE_LIMIT = related.CANDIDATE_LIMIT, 1
+        try:
+            related.rebuild_related_books()
+            # Co-purchased book 2 plus only the first other member of book 1's category
+            assert related.related_book_ids(1) == [2, 4]
+        finally:
+            related.CANDIDATE_LIMIT = saved
+
+
+if __name__ == "__main__":
+    test_related_books_refresh()
+    test_purchase_refresh_is_limited_to_ordered_books()
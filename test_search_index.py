@@ -0,0 +1,100 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the FTS5 search index follows ORM writes, ranks results
+with BM25 and pages them, and that searches fall back to LIKE matching
+"""
+
+from sqlalchemy import text
+
+from app import app, db
+from models import Book, Category
+import search_index
+from test_catalog_queries import seed_books
+
+
+def found(query, **kwargs):
+    return search_index.search_book_ids(query, **kwargs)[0]
+
+
+def test_index_follows_orm_writes():
+    """Inserts, updates, category renames, soft and hard deletes reach books_fts in the same flush"""
+    seed_books(3)
+    with app.app_context():
+        book = Book(title='Organic Chemistry', author='Morrison Boyd', quantity=5, price=400)
+        book.categories.append(db.session.get(Category, 1))
+        db.session.add(book)
+        db.session.flush()
+        assert found('organ chem') == [book.id]
+        db.session.commit()
+
+        book.title = 'Inorganic Reactions'
+        db.session.commit()
+        assert found('organic') == []
+        assert found('inorganic') == [book.id]
+        assert found('morrison') == [book.id]
+
+        # Category names are denormalized into every member's row
+        db.session.get(Category, 1).name = 'Stereochemistry'
+        db.session.commit()
+        assert sorted(found('stereochem')) == [1, book.id]
+
+        book.is_deleted = True
+        db.session.commit()
+        assert found('inorganic') == []
+
+        db.session.delete(db.session.get(Book, 2))
+        db.session.commit()
+        assert found('book') == [1, 3]
+        assert db.session.execute(text('SELECT COUNT(*) FROM books_fts')).scalar() == 2
+
+
+def test_bm25_ranking():
+    """Title matches outrank author matches, which outrank description matches"""
+    seed_books(0)
+    with app.app_context():
+        db.session.add_all([
+            Book(title='Waves and Optics', author='N Subrahmanyam', description='Covers quantum optics',
+                 quantity=1, price=100),
+            Book(title='Quantum Mechanics', author='D J Griffiths', quantity=1, price=100),
+            Book(title='Problems in Physics', author='Quantum Press', quantity=1, price=100),
+        ])
+        db.session.commit()
+        assert found('quantum') == [2, 3, 1]
+
+
+def test_pagination():
+    """Pages are disjoint, cover every match and report whether more follow"""
+    seed_books(5)
+    with app.app_context():
+        pages = [search_index.search_book_ids('book', page=page, per_page=2) for page in (1, 2, 3)]
+        assert [has_more for _, has_more in pages] == [True, True, False]
+        ids = [book_id for page_ids, _ in pages for book_id in page_ids]
+        assert sorted(ids) == [1, 2, 3, 4, 5]
+        assert found('book', page=4, per_page=2) == []
+
+    with app.test_client() as client:
+        data = client.get('/search?q=book&page=3').get_json()
+        assert data['page'] == 3 and data['has_more'] is False
+
+
+def test_like_fallback():
+    """Queries FTS cannot tokenize, and databases without the index, use substring matching"""
+    seed_books(3)
+    with app.app_context():
+        db.session.add(Book(title='C++ Primer', author='Lippman', quantity=1, price=300))
+        db.session.commit()
+        assert found('++') == [4]
+        assert found('  ') == []
+
+        db.session.execute(text('DROP TABLE books_fts'))
+        db.session.commit()
+        assert found('00') == [1, 2, 3]
+        assert search_index.search_book_ids('book', per_page=2) == ([1, 2], True)
+        assert found('primer') == [4]
+
+
+if __name__ == "__main__":
+    test_index_follows_orm_writes()
+    test_bm25_ranking()
+    test_pagination()
+    test_like_fallback()
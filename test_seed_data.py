@@ -0,0 +1,102 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the synthetic data generator: the same seed gives the
+same rows, the generated orders look like real checkouts and the derived
+tables (ratings, bundle totals, search index) agree with them
+"""
+
+import click
+import pytest
+from sqlalchemy import func, text
+from werkzeug.security import check_password_hash
+
+from app import app, db
+from models import Book, BundleOffer, FullOrderDetail, Order, OrderItem, Payment, Transaction, User
+import ratings
+import search_index
+import seed_data
+
+SCALE = 0.001  # 100 books, 500 users, 2,000 orders, 1,000 reviews
+
+
+def fingerprint():
+    """A digest of the generated rows that changes if any of them differs"""
+    tables = ['books', 'users', 'orders', 'order_items', 'full_order_details', 'book_reviews', 'bundle_books']
+    return {table: tuple(db.session.execute(text(f'SELECT * FROM {table} ORDER BY 1')).all())
+            for table in tables}
+
+
+def test_same_seed_same_data():
+    with app.app_context():
+        counts = seed_data.seed_database(scale=SCALE, seed=7, reset=True, log=lambda line: None)
+        assert counts['books'] == 100 and counts['users'] == 500 and counts['orders'] == 2000
+        first = fingerprint()
+
+        seed_data.seed_database(scale=SCALE, seed=7, reset=True, log=lambda line: None)
+        assert fingerprint() == first
+
+        seed_data.seed_database(scale=SCALE, seed=8, reset=True, log=lambda line: None)
+        assert fingerprint()['orders'] != first['orders']
+
+        # Seeding never silently mixes with existing data
+        with pytest.raises(click.ClickException):
+            seed_data.seed_database(scale=SCALE, log=lambda line: None)
+
+
+def test_generated_data_is_consistent():
+    with app.app_context():
+        seed_data.seed_database(scale=SCALE, seed=1, reset=True, log=lambda line: None)
+
+        # Every order was paid once and totals its lines plus delivery
+        assert Transaction.query.count() == Payment.query.count() == Order.query.count()
+        order = db.session.get(Order, 1)
+        lines = FullOrderDetail.query.filter_by(order_id=1).all()
+        subtotal = sum(line.price * line.quantity for line in lines)
+        delivery = seed_data.DELIVERY_CHARGE if subtotal < seed_data.FREE_DELIVERY_FROM else 0
+        assert order.total_amount == pytest.approx(subtotal + delivery)
+        transaction = Transaction.query.filter_by(order_id=1).one()
+        assert Payment.query.filter_by(order_id=1).one().payment_id == transaction.payment_id
+
+        # Bundle lines became one order item per book in the bundle
+        bundle_line = FullOrderDetail.query.filter_by(item_type='bundle').first()
+        bundle = db.session.get(BundleOffer, bundle_line.bundle_id)
+        items = OrderItem.query.filter_by(order_id=bundle_line.order_id).all()
+        assert {book.id for book in bundle.books} <= {item.book_id for item in items}
+
+        # Derived data matches the generated rows
+        assert ratings.reconcile_ratings(fix=False) == []
+        assert db.session.query(func.sum(Book.review_count)).scalar() == 1000
+        assert bundle.book_count == len(bundle.books) and bundle.total_mrp > bundle.selling_price
+        assert search_index.search_book_ids('Vol')[0]
+
+        user = db.session.get(User, 1)
+        assert check_password_hash(user.password_hash, seed_data.SEED_PASSWORD)
+
+
+def test_reset_asks_first_and_restores_synchronous(monkeypatch):
+    """`seed-data --reset` needs confirmation, and a failed seed leaves fsync on"""
+    with app.app_context():
+        seed_data.seed_database(scale=SCALE, seed=1, reset=True, log=lambda line: None)
+
+    runner = app.test_cli_runner()
+    result = runner.invoke(args=['seed-data', '--scale', str(SCALE), '--reset'], input='n\n')
+    assert result.exit_code == 1 and 'Drop every table' in result.output
+    with app.app_context():
+        assert Book.query.count() == 100
+
+    def fail(seeder, log):
+        raise RuntimeError('disk full')
+
+    monkeypatch.setattr(seed_data.Seeder, 'run', fail)
+    result = runner.invoke(args=['seed-data', '--scale', str(SCALE), '--reset', '--yes'])
+    assert isinstance(result.exception, RuntimeError)
+    with app.app_context():
+        # Pooled connections all keep the default safety level
+        with db.engine.connect() as first, db.engine.connect() as second:
+            for conn in (first, second):
+                assert conn.exec_driver_sql('PRAGMA synchronous').scalar() != 0
+
+
+if __name__ == "__main__":
+    test_same_seed_same_data()
+    test_generated_data_is_consistent()
@@ -0,0 +1,125 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the slow-query log: statements over the threshold are
+recorded with their route and query plan, personal data never reaches the
+log, and the admin view ranks statements by total time
+"""
+
+import json
+import logging
+from contextlib import contextmanager
+
+import pytest
+from sqlalchemy import text
+from sqlalchemy.exc import OperationalError
+
+from app import app, db
+from models import Customer, User
+import slow_queries
+from test_catalog_queries import seed_books
+
+
+@contextmanager
+def threshold(ms):
+    saved, slow_queries.THRESHOLD_MS = slow_queries.THRESHOLD_MS, ms
+    try:
+        yield
+    finally:
+        slow_queries.THRESHOLD_MS = saved
+
+
+def test_slow_statements_are_recorded_with_plan():
+    seed_books(5)
+    with app.app_context():
+        slow_queries.clear()
+    with threshold(0), app.test_client() as client:
+        client.get('/books?q=Book')
+        client.get('/books?q=Book')
+
+    with app.app_context():
+        ranked = slow_queries.ranking()
+    assert ranked
+    assert [row['total_ms'] for row in ranked] == sorted((row['total_ms'] for row in ranked), reverse=True)
+    books = next(row for row in ranked if 'FROM books' in row['statement'])
+    assert books['calls'] >= 2 and books['routes'] == 'GET books'
+    assert 'books' in books['plan']
+
+    # Fast statements stay out of the log under a real threshold
+    with app.app_context():
+        slow_queries.clear()
+        with threshold(10_000):
+            db.session.execute(text('SELECT COUNT(*) FROM books')).scalar()
+        assert slow_queries.ranking() == []
+
+
+def test_personal_data_is_redacted():
+    with app.app_context():
+        slow_queries.clear()
+        with threshold(0):
+            User.query.filter_by(email='asha@example.com').first()
+            db.session.execute(text('SELECT :note, :book_id'),
+                               {'note': 'call +91 98765 43210 or mail asha@example.com', 'book_id': 7})
+            db.session.add_all([Customer(user_id=n, full_name='Asha Rao', email='asha@example.com',
+                                         street_address='12 MG Road') for n in range(3)])
+            db.session.flush()
+            db.session.rollback()
+        ranked = slow_queries.ranking()
+
+    logged = json.dumps(ranked)
+    for secret in ('asha@example.com', 'Asha Rao', 'MG Road', '98765'):
+        assert secret not in logged
+    note = next(row for row in ranked if row['statement'].startswith('SELECT ?, ?'))
+    assert json.loads(note['parameters']) == ['call <redacted> or mail <redacted>', 7]
+    user = next(row for row in ranked if 'FROM users' in row['statement'])
+    assert json.loads(user['parameters'])[0] == '<redacted>'
+    assert user['routes'] == '<background>'
+
+
+class ListHandler(logging.Handler):
+    def __init__(self):
+        super().__init__(logging.WARNING)
+        self.messages = []
+
+    def emit(self, record):
+        self.messages.append(record.getMessage())
+
+
+def test_failed_statements_and_logging():
+    """A statement that raises leaves no start time behind; slow ones go to the app log"""
+    handler = ListHandler()
+    app.logger.addHandler(handler)
+    with app.app_context():
+        connection = db.session.connection()
+        with threshold(0):
+            with pytest.raises(OperationalError):
+                db.session.execute(text('SELECT * FROM no_such_table'))
+            assert connection.info['slow_query_start'] == []
+            db.session.rollback()
+
+            try:
+                db.session.execute(text('SELECT :message, :review_text'),
+                                   {'message': 'Loved it', 'review_text': 'Five stars'}).all()
+            finally:
+                app.logger.removeHandler(handler)
+        ranked = slow_queries.ranking()
+
+    assert any(m.startswith('Slow query') and 'SELECT ?, ?' in m for m in handler.messages)
+    logged = next(row for row in ranked if row['statement'].startswith('SELECT ?, ?'))
+    assert json.loads(logged['parameters']) == ['<redacted>', '<redacted>']
+
+
+def test_admin_view_ranks_statements():
+    with app.test_client() as client:
+        assert client.get('/admin/slow-queries').status_code == 302
+        with client.session_transaction() as session:
+            session['admin_id'] = 1
+        response = client.get('/admin/slow-queries')
+        assert response.status_code == 200
+        assert b'FROM users' in response.data
+
+
+if __name__ == "__main__":
+    test_slow_statements_are_recorded_with_plan()
+    test_personal_data_is_redacted()
+    test_failed_statements_and_logging()
+    test_admin_view_ranks_statements()
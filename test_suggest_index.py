@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Test script to verify the in-memory suggestion index: word-prefix lookup,
+popularity ranking, incremental updates and deletions, and that changes made
+by another worker reach this worker's index without a rebuild, including
+review counts and category book counts
+"""
+
+from sqlalchemy import update
+
+from app import app, db
+from models import Book, BookReview, Category, User
+import ratings
+import suggest_index
+from suggest_index import PrefixIndex
+from test_catalog_queries import seed_books
+
+
+def titles(results, group='books'):
+    return [text for text, _ in results[group]]
+
+
+def test_prefix_lookup_and_ranking():
+    index = PrefixIndex()
+    index.load([(1, 'Concepts of Physics', 'H C Verma', 40),
+                (2, 'Physical Chemistry', 'P Bahadur', 90),
+                (3, 'Biophysics Basics', 'H C Verma', 10)],
+               [('category', 1, 'Physics', 2), ('subcategory', 1, 'Organic Chemistry', 1)])
+
+    # Any word start matches, the middle of a word does not; most popular first
+    assert titles(index.suggest('phys')) == ['Physical Chemistry', 'Concepts of Physics']
+    assert titles(index.suggest('PHYSICS')) == ['Concepts of Physics']
+    assert titles(index.suggest('physics', limit=5), 'category') == ['Physics']
+    assert titles(index.suggest('chem'), 'subcategory') == ['Organic Chemistry']
+    assert titles(index.suggest('phys', limit=1)) == ['Physical Chemistry']
+
+    # Authors are ranked by the popularity of all their books
+    assert index.suggest('verma')['author'] == [('H C Verma', 0)]
+    assert titles(index.suggest('p'), 'author') == ['P Bahadur']
+    assert index.suggest('h c')['author'][0][0] == 'H C Verma'
+
+
+def test_incremental_update_and_deletion():
+    index = PrefixIndex()
+    index.load([(1, 'Concepts of Physics', 'H C Verma', 40)], [])
+    assert titles(index.suggest('phys')) == ['Concepts of Physics']
+
+    # A renamed book is found by its new title only
+    index.put_book(1, 'Concepts of Mechanics', 'H C Verma', 40)
+    assert titles(index.suggest('phys')) == []
+    assert titles(index.suggest('mech')) == ['Concepts of Mechanics']
+
+    # New books are ranked against the loaded ones
+    index.put_book(2, 'Mechanics Problems', 'I E Irodov', 70)
+    assert titles(index.suggest('mech')) == ['Mechanics Problems', 'Concepts of Mechanics']
+
+    # Removing an author's last book removes the author
+    index.remove_book(1)
+    assert titles(index.suggest('mech')) == ['Mechanics Problems']
+    assert index.suggest('verma')['author'] == []
+
+    index.put_term('category', 5, 'Mechanics', 3)
+    index.put_term('category', 5, 'Classical Mechanics')
+    assert index.suggest('class')['category'] == [('Classical Mechanics', 5)]
+    index.remove_term('category', 5)
+    assert index.suggest('class')['category'] == []
+
+
+def test_loaded_index_matches_incremental_one():
+    books = [(i, f'Book {i:03d} of Patterns', f'Author {i % 4}', i % 7) for i in range(50)]
+    loaded, built = PrefixIndex(), PrefixIndex()
+    loaded.load(books, [('category', 1, 'Patterns', 50)])
+    for book in books:
+        built.put_book(*book)
+    built.put_term('category', 1, 'Patterns', 50)
+    assert loaded._keys == built._keys
+    assert loaded.suggest('pat', limit=10) == built.suggest('pat', limit=10)
+
+
+def test_other_workers_changes_are_applied_without_rebuild():
+    seed_books(3)
+    with app.app_context():
+        index = suggest_index.build_index()
+        assert titles(suggest_index.suggest('book')) == ['Book 000', 'Book 001', 'Book 002']
+
+        # Our own commit shows at once
+        db.session.get(Book, 1).title = 'Algebra Basics'
+        db.session.commit()
+        assert titles(suggest_index.suggest('alg')) == ['Algebra Basics']
+
+        # Another worker changes rows and logs their ids: written here without the
+        # ORM hooks, so only the change log can tell this worker
+        db.session.execute(update(Book).where(Book.id == 2).values(title='Geometry Basics'))
+        db.session.execute(update(Book).where(Book.id == 3).values(is_deleted=True))
+        db.session.execute(update(Category).where(Category.id == 1).values(name='Mathematics'))
+        db.session.commit()
+        suggest_index._publish([('book', 2), ('book', 3), ('category', 1)])
+
+        suggest_index._last_change_check = 0
+        assert suggest_index.get_index() is index
+        assert titles(suggest_index.suggest('basics')) == ['Algebra Basics', 'Geometry Basics']
+        assert titles(suggest_index.suggest('book')) == []
+        assert titles(suggest_index.suggest('math'), 'category') == ['Mathematics']
+
+
+def popularity(index, group, item_id):
+    return index._entries[(group, item_id)][1]
+
+
+def read_change_log():
+    with open(app.config['SUGGEST_CHANGES_PATH']) as f:
+        return f.read().split()
+
+
+def test_review_counts_reach_index_and_change_log():
+    seed_books(2)
+    with app.app_context():
+        index = suggest_index.build_index()
+        user = User(email='reviewer@example.com', phone='7400000001', password_hash='x')
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(BookReview(book_id=2, user_id=user.id, rating=5))
+        db.session.commit()
+        assert popularity(index, 'books', 2) == 1
+        assert titles(suggest_index.suggest('book')) == ['Book 001', 'Book 000']
+        assert read_change_log()[-2:] == ['book', '2']
+
+        # Drift fixed by reconciling is logged as well
+        db.session.execute(update(Book).where(Book.id == 2).values(review_count=7))
+        db.session.commit()
+        suggest_index._publish([('book', 2)])
+        suggest_index._last_change_check = 0
+        suggest_index.get_index()
+        assert popularity(index, 'books', 2) == 7
+        assert ratings.reconcile_ratings() != []
+        assert popularity(index, 'books', 2) == 1
+        assert read_change_log()[-2:] == ['book', '2']
+
+
+def test_category_counts_follow_books():
+    seed_books(3)
+    with app.app_context():
+        index = suggest_index.build_index()
+        assert popularity(index, 'category', 1) == 1
+
+        book = Book(title='New Book', author='New Author', description='A test book',
+                    quantity=1, price=10, original_price=10)
+        book.categories.append(db.session.get(Category, 1))
+        db.session.add(book)
+        db.session.commit()
+        assert popularity(index, 'category', 1) == 2
+        assert popularity(index, 'subcategory', 1) == 1
+
+        # Soft-deleted books no longer count; moved books count for their new category
+        book.is_deleted = True
+        db.session.get(Book, 2).categories = [db.session.get(Category, 1)]
+        db.session.commit()
+        assert popularity(index, 'category', 1) == 2
+        assert popularity(index, 'category', 2) == 0
+        assert {'category 1', 'category 2'} <= {' '.join(pair) for pair in zip(*[iter(read_change_log())] * 2)}
+
+        # A full rebuild counts the same way
+        rebuilt = suggest_index.build_index()
+        assert rebuilt._entries == index._entries
+
+
+if __name__ == "__main__":
+    test_prefix_lookup_and_ranking()
+    test_incremental_update_and_deletion()
+    test_loaded_index_matches_incremental_one()
+    test_other_workers_changes_are_applied_without_rebuild()
+    test_review_counts_reach_index_and_change_log()
+    test_category_counts_follow_books()